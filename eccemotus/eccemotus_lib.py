@@ -6,8 +6,9 @@ First step is to create a data generator (FileDataGenerator or
 ElasticDataGenerator), depending on where you want to get plaso events from.
 
 FileDataGenerator:
-  Reads JSON_line file and yield one event at a time. It has to read the whole
-  file, but has smaller memory requirements.
+  Reads JSON_line file and yield one event at a time. It has to scan the whole
+  file, but has smaller memory requirements. Lines without parsed data_types
+  can be skipped without decoding.
 
 ElasticDataGenerator:
   Queries elasticsearch for events that it can parse. It has small memory
@@ -18,10 +19,16 @@ Then you have to parse the data with ParsedDataGenerator(data_generator).
 
 Last thing you want to do is to call GetGraphJSON(ParsedDataGenerator) to
 create the actual graph.
+
+GetGraphPipelined does reading, decoding, parsing and graph creation
+concurrently in stages connected by bounded queues.
 """
 
+import hashlib
 import json
 import logging
+import multiprocessing
+import numbers
 
 try:
   from elasticsearch import Elasticsearch
@@ -29,39 +36,195 @@ try:
 except ImportError:
   Elasticsearch = None
 
-from lib import graph as graph_lib# pylint: disable=relative-import
+from lib import graph as graph_lib # pylint: disable=relative-import
+from lib import graph_stream # pylint: disable=relative-import
+from lib import json_codec # pylint: disable=relative-import
+from lib import line_reader # pylint: disable=relative-import
+from lib import pipeline # pylint: disable=relative-import
+from lib import profiling # pylint: disable=relative-import
 from lib.parsers import manager # pylint: disable=relative-import
 
-def FileDataGenerator(filename, verbose=False):
+def _InTimeRange(timestamp, since, until):
+  """Checks whether timestamp is in time range.
+
+  Args:
+    timestamp (int): timestamp.
+    since (None|int): the smallest timestamp, None for no limit.
+    until (None|int): the largest timestamp, None for no limit.
+
+  Returns:
+    bool: True if timestamp is in the time range.
+  """
+  return ((since is None or timestamp >= since) and
+          (until is None or timestamp <= until))
+
+
+def FileLineGenerator(
+    filename, verbose=False, data_types=None, start_offset=0, since=None,
+    until=None):
+  """Reads JSON_line file and yields lines that may contain parsed events.
+
+  Regular files are memory mapped and only lines that are returned are
+  copied. Other inputs (pipes, FIFOs, /dev/stdin) are read line by line.
+
+  With since or until, files sorted by timestamp (output of psort) are read
+  only in the time range found by binary search. Sortedness is checked only on
+  sampled lines, so the file must be fully sorted: lines in the time range
+  that are out of order are not read. Lines of files detected as unsorted are
+  filtered by their raw timestamps. Lines without raw timestamps are returned
+  and should be filtered after decoding (see DecodeLines).
+
+  Args:
+    filename (str): name of file with events in JSON_line format.
+    verbose (bool): control for verbosity.
+    data_types (None|iterable[str]): if specified, lines that do not contain
+        any of the data_types as a JSON string are skipped.
+    start_offset (int): byte offset of the first line to read.
+    since (None|int): if specified, older events are skipped.
+    until (None|int): if specified, newer events are skipped.
+
+  Yields:
+    bytes: JSON serialized event.
+  """
+  logger = logging.getLogger(__name__)
+  literals = None
+  if data_types is not None:
+    literals = [
+        b'"' + data_type.encode(u'utf-8') + b'"' for data_type in data_types]
+  filter_time = since is not None or until is not None
+
+  with open(filename, u'rb') as input_file:
+    reader = line_reader.MappedLineReader(
+        input_file, literals=literals, start_offset=start_offset)
+    if filter_time:
+      if reader.SeekTimeRange(since, until):
+        if verbose:
+          logger.info(u'Time range is at bytes {0:d}-{1:d} of {2:d}'.format(
+              reader.offset, reader.end_offset, reader.size))
+      elif verbose:
+        logger.info(u'File is not sorted by timestamp, filtering all lines')
+
+    for i, (offset, line) in enumerate(reader.Iterate()):
+      if not i % 100000 and verbose:
+        if reader.size is None:
+          logger.info(u'File offset {0:d} bytes'.format(offset))
+        else:
+          logger.info(u'File offset {0:d} of {1:d} bytes'.format(
+              offset, reader.size))
+
+      if filter_time:
+        timestamp = line_reader.GetRawTimestamp(line)
+        if (timestamp is not None and
+            not _InTimeRange(timestamp, since, until)):
+          continue
+      yield line
+
+
+def DecodeLines(lines, since=None, until=None):
+  """Decodes JSON serialized events.
+
+  Args:
+    lines (iterable[bytes]): JSON serialized events.
+    since (None|int): if specified, older events are skipped.
+    until (None|int): if specified, newer events are skipped.
+
+  Returns:
+    list[dict]: decoded events.
+  """
+  events = [json_codec.Loads(line) for line in lines]
+  if since is None and until is None:
+    return events
+
+  return [
+      event for event in events
+      if not isinstance(event.get(u'timestamp'), numbers.Number) or
+      _InTimeRange(event[u'timestamp'], since, until)]
+
+
+def FileDataGenerator(
+    filename, verbose=False, data_types=None, start_offset=0, since=None,
+    until=None):
   """Reads JSON_line file and yields events.
 
   JSON_line file means, that every event is a JSON on a separate line.
+  Lines are read by FileLineGenerator and decoded by json_codec.
 
   Args:
     filename (str): name of file with events in JSON_line format.
+    verbose (bool): control for verbosity.
+    data_types (None|iterable[str]): if specified, lines that do not contain
+        any of the data_types as a JSON string are skipped without decoding.
+        Usually ParserManager.GetParsedTypes(), other events would not be
+        parsed anyway.
+    start_offset (int): byte offset of the first line to read.
+    since (None|int): if specified, older events are skipped.
+    until (None|int): if specified, newer events are skipped.
 
   Yields:
     dict: event.
   """
-  logger = logging.getLogger(__name__)
-  with open(filename, u'r') as input_file:
-    for i, line in enumerate(input_file):
-      if not i % 100000 and verbose:
-        logger.info(u'File line {0:d}'.format(i))
-      yield json.loads(line)
+  lines = FileLineGenerator(
+      filename, verbose=verbose, data_types=data_types,
+      start_offset=start_offset, since=since, until=until)
+  if since is None and until is None:
+    for line in lines:
+      yield json_codec.Loads(line)
+  else:
+    for line in lines:
+      for event in DecodeLines([line], since, until):
+        yield event
 
 
-def ElasticDataGenerator(client, indexes, query=None, verbose=False):
+def GetElasticQuery(query=None, since=None, until=None, data_types=None):
+  """Creates elasticsearch query for events that can be parsed.
+
+  Filters of all parsers (data_types and their own prefilters, see
+  ParserManager.GetElasticFilter) and the time range are pushed down to
+  elasticsearch, so events that would be discarded are not transferred.
+
+  Args:
+    query (None|dict): if specified, events must match this query as well.
+    since (None|int): if specified, older events are skipped.
+    until (None|int): if specified, newer events are skipped.
+    data_types (None|iterable[str]): if specified, only events of parsers of
+        these data_types are queried.
+
+  Returns:
+    dict: elasticsearch request body with bool query.
+  """
+  filters = [manager.ParserManager.GetElasticFilter(data_types)]
+  if since is not None or until is not None:
+    time_range = {}
+    if since is not None:
+      time_range[u'gte'] = since
+    if until is not None:
+      time_range[u'lte'] = until
+    filters.append({u'range': {u'timestamp': time_range}})
+
+  bool_query = {u'filter': filters}
+  if query:
+    bool_query[u'must'] = query
+  return {u'query': {u'bool': bool_query}}
+
+
+def ElasticDataGenerator(
+    client, indexes, query=None, verbose=False, since=None, until=None,
+    data_types=None):
   """Reads event data from elasticsearch.
 
   Uses scan function, so the data are actually streamed and do not need to be
-  in RAM.
+  in RAM. Only events that parsers may extract data from are requested, see
+  GetElasticQuery.
 
   Args:
     client (Elasticsearch): elasticsearch client.
     indexes (list[str]): elasticsearch indexes.
-    query (None|dict): if specified, query is used as elasticsearch query.
+    query (None|dict): if specified, events must match this query as well.
     verbose (bool): control for verbosity.
+    since (None|int): if specified, older events are skipped.
+    until (None|int): if specified, newer events are skipped.
+    data_types (None|iterable[str]): if specified, only events of parsers of
+        these data_types are read.
 
   Yields:
     dict: JSON representation of plaso event.
@@ -70,28 +233,10 @@ def ElasticDataGenerator(client, indexes, query=None, verbose=False):
     ImportError: when you do not have elasticsearch installed.
   """
   if Elasticsearch is None:
-    raise ImportError((u'Please install elasticsearch to use this'
+    raise ImportError((u'Please install elasticsearch to use this '
                        u'functionality.'))
 
-  # Term filter for data_types, that we can parse.
-  should = [{u'term': {u'data_type': data_type}}
-            for data_type in manager.ParserManager.GetParsedTypes()]
-  if not query:
-    query = {u'match_all': {}}
-
-  # Elasticsearch query.
-  full_query = {
-      u'query': {
-          u'filtered': {
-              u'query': query,
-              u'filter': {
-                  u'bool': {
-                      u'should': should,
-                  }
-              }
-          }
-      }
-  }
+  full_query = GetElasticQuery(query, since, until, data_types)
   VERBOSE_INTERVAL = 10000
   logger = logging.getLogger(__name__)
   results = helpers.scan(client, query=full_query, index=indexes)
@@ -104,6 +249,132 @@ def ElasticDataGenerator(client, indexes, query=None, verbose=False):
     yield event
 
 
+def ElasticAggregationGenerator(
+    client, indexes, data_type, fields, interval, query=None, verbose=False,
+    since=None, until=None, page_size=1000, keyword_suffix=u'.keyword'):
+  """Reads pre-aggregated events from elasticsearch.
+
+  Events of data_type are grouped by a composite aggregation over timestamp
+  histogram and fields, which must fully determine parsed data (see
+  ParserManager.GetAggregatedTypes). Only one event per bucket is transferred.
+  Buckets are paged with after_key.
+
+  Strings of plaso and timesketch indices are mapped as text, which can not
+  be aggregated, with a keyword subfield, so terms are aggregated on the
+  subfield. Fields missing in an index (e.g. the other form of a field that
+  can be a string or an object) fall into the missing bucket.
+
+  Every bucket gets a uuid derived from indexes, data_type, interval, query
+  and the bucket key, so buckets are told apart when events are
+  deduplicated, while the same bucket read again gets the same uuid.
+
+  Args:
+    client (Elasticsearch): elasticsearch client.
+    indexes (list[str]): elasticsearch indexes.
+    data_type (str): data_type of aggregated events.
+    fields (iterable[str]): names of aggregated fields.
+    interval (int): width of time buckets in microseconds.
+    query (None|dict): if specified, events must match this query as well.
+    verbose (bool): control for verbosity.
+    since (None|int): if specified, older events are skipped.
+    until (None|int): if specified, newer events are skipped.
+    page_size (int): number of buckets requested at once.
+    keyword_suffix (str): suffix of aggregated subfields of fields, empty if
+        the fields are mapped as keywords.
+
+  Yields:
+    dict: event with values of fields (dotted paths as nested objects),
+        data_type, uuid, timestamp of the bucket start and number of events
+        in the bucket (ParserManager.COUNT_KEY).
+  """
+  logger = logging.getLogger(__name__)
+  sources = [{u'timestamp': {u'histogram': {
+      u'field': u'timestamp', u'interval': interval}}}]
+  for field in fields:
+    sources.append({field: {u'terms': {
+        u'field': field + keyword_suffix, u'missing_bucket': True}}})
+
+  body = GetElasticQuery(query, since, until, [data_type])
+  body[u'size'] = 0
+  composite = {u'size': page_size, u'sources': sources}
+  body[u'aggs'] = {u'buckets': {u'composite': composite}}
+
+  page = 0
+  while True:
+    response = client.search(index=indexes, body=body)
+    aggregation = response[u'aggregations'][u'buckets']
+    if verbose:
+      logger.info(u'Elastic aggregation {0:s} page {1:d}'.format(
+          data_type, page))
+
+    for bucket in aggregation[u'buckets']:
+      event = {}
+      for field in fields:
+        value = bucket[u'key'].get(field)
+        if value is None:
+          continue
+        path = field.split(u'.')
+        parent = event
+        for name in path[:-1]:
+          parent = parent.setdefault(name, {})
+          if not isinstance(parent, dict):
+            break
+        else:
+          parent[path[-1]] = value
+      bucket_id = json.dumps(
+          [indexes, data_type, interval, query, bucket[u'key']],
+          sort_keys=True)
+      event[u'data_type'] = data_type
+      event[u'uuid'] = hashlib.sha1(
+          bucket_id.encode(u'utf-8')).hexdigest()[:32]
+      event[u'timestamp'] = int(bucket[u'key'][u'timestamp'])
+      event[manager.ParserManager.COUNT_KEY] = bucket[u'doc_count']
+      yield event
+
+    after_key = aggregation.get(u'after_key')
+    if not aggregation[u'buckets'] or not after_key:
+      break
+    composite[u'after'] = after_key
+    page += 1
+
+
+def ElasticAggregatedDataGenerator(
+    client, indexes, interval, query=None, verbose=False, since=None,
+    until=None):
+  """Reads events from elasticsearch, aggregating those that can be.
+
+  Data types with aggregation fields are read by ElasticAggregationGenerator,
+  other events are streamed by ElasticDataGenerator.
+
+  Args:
+    client (Elasticsearch): elasticsearch client.
+    indexes (list[str]): elasticsearch indexes.
+    interval (int): width of time buckets in microseconds.
+    query (None|dict): if specified, events must match this query as well.
+    verbose (bool): control for verbosity.
+    since (None|int): if specified, older events are skipped.
+    until (None|int): if specified, newer events are skipped.
+
+  Yields:
+    dict: JSON representation of plaso event or pre-aggregated event.
+  """
+  aggregated_types = manager.ParserManager.GetAggregatedTypes()
+  for data_type in sorted(aggregated_types):
+    for event in ElasticAggregationGenerator(
+        client, indexes, data_type, aggregated_types[data_type], interval,
+        query=query, verbose=verbose, since=since, until=until):
+      yield event
+
+  streamed_types = [
+      data_type for data_type in manager.ParserManager.GetParsedTypes()
+      if data_type not in aggregated_types]
+  if streamed_types:
+    for event in ElasticDataGenerator(
+        client, indexes, query=query, verbose=verbose, since=since,
+        until=until, data_types=streamed_types):
+      yield event
+
+
 def GetClient(host, port):
   """Creates elasticsearch client.
 
@@ -125,36 +396,156 @@ def GetClient(host, port):
   return client
 
 
-def ParsedDataGenerator(raw_generator):
+def BatchGenerator(generator, batch_size):
+  """Groups items from generator to lists.
+
+  Args:
+    generator (iterable): items.
+    batch_size (int): maximum number of items in one list.
+
+  Yields:
+    list: at most batch_size consecutive items.
+  """
+  batch = []
+  for item in generator:
+    batch.append(item)
+    if len(batch) >= batch_size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+
+def ParsedDataGenerator(raw_generator, batch_size=1000):
   """Transforms raw event generator to parsed event generator.
 
+  Events are parsed in batches by ParserManager.ParseBatch.
+
   Args:
     raw_generator (iterable[dict]): Plaso events.
+    batch_size (int): number of events parsed at once.
 
   Yields:
-    dict: parsed Plaso events.
+    event_data.EventData: data parsed from plaso events.
   """
-  for raw_event in raw_generator:
-    if not raw_event:
-      continue
-    parsed = manager.ParserManager.Parse(raw_event)
-    if parsed:
-      yield parsed
+  raw_events = (raw_event for raw_event in raw_generator if raw_event)
+  for batch in BatchGenerator(raw_events, batch_size):
+    for parsed in manager.ParserManager.ParseBatch(batch):
+      if not parsed.IsEmpty():
+        yield parsed
 
 
-def GetGraph(raw_generator, verbose=False):
+def GetGraph(
+    raw_generator, verbose=False, deduplicate=False, profiler=None,
+    event_store=None, parse_cache=None):
   """Creates graph from raw data.
 
   Args:
     raw_generator (iterable[dict]): plaso events
+    verbose (bool): control for verbosity.
+    deduplicate (bool): whether events with the same id (uuid or
+        timesketch_id) should be added to an edge only once.
+    profiler (profiling.Profiler): profiler of generator, parse and graph
+        stages. None disables profiling.
+    event_store (event_store.EventStore): on-disk storage of edge events.
+        None keeps events in memory.
+    parse_cache (parse_cache.ParsedEventCache): if specified and the cache
+        exists, parsed events are read from it and raw_generator is not
+        used, otherwise they are written to it.
 
   Returns:
     Graph: graph created based on events.
   """
+  if profiler is None:
+    profiler = profiling.Profiler()
+  raw_generator = profiler.Iterate(u'generator', raw_generator)
   parsed_generator = ParsedDataGenerator(raw_generator)
-  graph = graph_lib.CreateGraph(parsed_generator, verbose)
+  if parse_cache is not None:
+    parsed_generator = parse_cache.Iterate(parsed_generator)
+  parsed_generator = profiler.Iterate(u'parse', parsed_generator)
+  with profiler.Stage(u'graph'):
+    graph = graph_lib.CreateGraph(
+        parsed_generator, verbose, deduplicate, event_store=event_store)
   return graph
 
+def ParseEvents(raw_events):
+  """Parses events and drops those without data.
+
+  Args:
+    raw_events (list[dict]): plaso events.
+
+  Returns:
+    list[event_data.EventData]: data parsed from events.
+  """
+  raw_events = [raw_event for raw_event in raw_events if raw_event]
+  return [
+      parsed for parsed in manager.ParserManager.ParseBatch(raw_events)
+      if not parsed.IsEmpty()]
+
+
+def GetGraphPipelined(
+    source, decoder=None, verbose=False, deduplicate=False, workers=0,
+    queue_size=8, batch_size=1000, metrics_output=None, event_store=None,
+    parse_cache=None):
+  """Creates graph from raw data by stages running concurrently.
+
+  Source, decode and parse stages run in threads connected by bounded queues
+  (see pipeline.Pipeline), the graph is built in the calling thread. Events
+  are added to the graph in source order, so the graph is the same as from
+  GetGraph.
+
+  Args:
+    source (iterable): plaso events or, with decoder, raw items (e.g. lines
+        from FileLineGenerator).
+    decoder (None|callable): transforms a list of raw items to a list of
+        events (e.g. DecodeLines). Must be picklable if workers are used.
+    verbose (bool): control for verbosity.
+    deduplicate (bool): whether events with the same id (uuid or
+        timesketch_id) should be added to an edge only once.
+    workers (int): number of processes for decode and parse stages, 0 runs
+        them in threads of this process.
+    queue_size (int): maximum number of batches between two stages.
+    batch_size (int): number of source items in one batch.
+    metrics_output (None|file): if specified, per stage metrics are printed
+        there.
+    event_store (event_store.EventStore): on-disk storage of edge events.
+        None keeps events in memory.
+    parse_cache (parse_cache.ParsedEventCache): if specified and the cache
+        exists, parsed events are read from it without running the pipeline,
+        otherwise they are written to it.
+
+  Returns:
+    Graph: graph created based on events.
+  """
+  if parse_cache is not None and parse_cache.Exists():
+    return graph_lib.CreateGraph(
+        parse_cache.Read(), verbose, deduplicate, event_store=event_store)
+
+  pool = None
+  if workers:
+    pool = multiprocessing.Pool(workers)
+
+  stages = pipeline.Pipeline(queue_size=queue_size, batch_size=batch_size)
+  if decoder is not None:
+    stages.AddStage(u'decode', decoder, pool=pool)
+  stages.AddStage(u'parse', ParseEvents, pool=pool)
+  try:
+    parsed_generator = stages.Run(
+        source, source_name=u'source', consumer_name=u'graph')
+    if parse_cache is not None:
+      parsed_generator = parse_cache.Write(parsed_generator)
+    graph = graph_lib.CreateGraph(
+        parsed_generator, verbose, deduplicate, event_store=event_store)
+  finally:
+    if pool is not None:
+      pool.terminate()
+      pool.join()
+
+  if metrics_output is not None:
+    stages.PrintMetrics(metrics_output)
+  return graph
+
+
 def LoadGraph(filename):
   """Loads graph from file.
 
@@ -164,7 +555,38 @@ def LoadGraph(filename):
   Returns:
     graph_lib.Graph: loaded graph.
   """
-  with open(filename, u'r') as input_file:
-    data = json.loads(input_file.read())
+  with open(filename, u'rb') as input_file:
+    data = json_codec.Loads(input_file.read())
     graph = graph_lib.LoadGraph(data)
     return graph
+
+
+def MergeGraphFiles(filenames, deduplicate=False):
+  """Merges graphs from files into one graph.
+
+  Args:
+    filenames (iterable[str]): names of files with JSON serialized graphs
+        (output of f2g or e2g).
+    deduplicate (bool): whether events with the same id should be added to an
+        edge only once.
+
+  Returns:
+    graph_lib.Graph: merged graph.
+  """
+  graphs = (LoadGraph(filename) for filename in filenames)
+  return graph_lib.MergeGraphs(graphs, deduplicate)
+
+
+def GetStreamingSummary(filename):
+  """Summarizes graph from file without loading the whole graph.
+
+  Args:
+    filename (str): name of file with serialized graph (output of f2g or e2g,
+        optionally with --javascript).
+
+  Returns:
+    dict[int, dict[str, list[str]]]: aggregation by cluster id and node type,
+        same as graph_lib.Graph.Summary of the finalized graph.
+  """
+  with open(filename, u'rb') as input_file:
+    return graph_stream.GetSummary(input_file)
@@ -1,8 +1,55 @@
 # -*- coding: utf-8 -*-
 """Tests for eccemotus_lib.py."""
 
+import copy
+import json
+import os
+import shutil
+import tempfile
 import unittest
 import eccemotus.eccemotus_lib as eccemotus
+from eccemotus.lib import parse_cache
+
+class FakeElasticClient(object):
+  """Elasticsearch client returning canned composite aggregation pages.
+
+  Attributes:
+    requests (list[dict]): bodies of search requests.
+  """
+
+  def __init__(self, pages):
+    """Initializes FakeElasticClient.
+
+    Args:
+      pages (list[list[tuple[dict, int]]]): bucket keys and document counts
+          of every page.
+    """
+    self._pages = pages
+    self.requests = []
+
+  def search(self, index=None, body=None):  # pylint: disable=invalid-name
+    """Returns the next page of composite aggregation.
+
+    Args:
+      index (list[str]): elasticsearch indexes.
+      body (dict): request body.
+
+    Returns:
+      dict: search response with composite aggregation.
+    """
+    self.requests.append(copy.deepcopy(body))
+    composite = body[u'aggs'][u'buckets'][u'composite']
+    page_index = composite.get(u'after', {}).get(u'page', -1) + 1
+    buckets = []
+    if page_index < len(self._pages):
+      buckets = [
+          {u'key': key, u'doc_count': count}
+          for key, count in self._pages[page_index]]
+    aggregation = {u'buckets': buckets}
+    if buckets:
+      aggregation[u'after_key'] = {u'page': page_index}
+    return {u'aggregations': {u'buckets': aggregation}}
+
 
 class EccemotusTest(unittest.TestCase):
   """Tests for eccemotus library."""
@@ -45,3 +92,198 @@ class EccemotusTest(unittest.TestCase):
     self.assertEqual(len(graph.nodes), 6)
     self.assertEqual(len(graph.edges), 8)
 
+  def test_FileDataGenerator(self):
+    """Tests reading events with and without data_type prefilter."""
+    events = [
+        {u'data_type': u'windows:evtx:record', u'event_identifier': 4624},
+        {u'data_type': u'fs:stat', u'filename': u'Security.evtx'},
+        {u'data_type': {u'stream': u'syslog:line'}, u'message': u''}]
+    directory = tempfile.mkdtemp()
+    try:
+      path = os.path.join(directory, u'events.json_line')
+      with open(path, u'w') as output_file:
+        for event in events:
+          output_file.write(json.dumps(event) + u'\n')
+
+      self.assertEqual(list(eccemotus.FileDataGenerator(path)), events)
+      self.assertEqual(
+          list(eccemotus.FileDataGenerator(
+              path, data_types=[u'windows:evtx:record', u'syslog:line'])),
+          [events[0], events[2]])
+    finally:
+      shutil.rmtree(directory)
+
+  def test_FileDataGeneratorTimeRange(self):
+    """Tests reading events in time range from sorted and unsorted files."""
+    events = [
+        {u'data_type': u'fs:stat', u'timestamp': timestamp}
+        for timestamp in range(0, 2000, 10)]
+    directory = tempfile.mkdtemp()
+    try:
+      path = os.path.join(directory, u'events.json_line')
+      for ordered_events in [events, events[::-1]]:
+        with open(path, u'w') as output_file:
+          for event in ordered_events:
+            output_file.write(json.dumps(event) + u'\n')
+
+        read_events = eccemotus.FileDataGenerator(path, since=500, until=995)
+        self.assertEqual(
+            sorted(event[u'timestamp'] for event in read_events),
+            list(range(500, 1000, 10)))
+    finally:
+      shutil.rmtree(directory)
+
+  def test_GetGraphPipelined(self):
+    """Tests that pipelined graph creation matches sequential one."""
+    events = [
+        {u'data_type': u'syslog:ssh:login',
+         u'hostname': u'host{0:d}'.format(index % 7),
+         u'message': u'Successful login of user: user{0:d} from '
+                     u'10.0.0.{1:d}:22'.format(index % 5, index % 3),
+         u'timestamp': index}
+        for index in range(100)]
+    lines = [json.dumps(event).encode(u'utf-8') for event in events]
+    graph = eccemotus.GetGraph(events)
+    pipelined_graph = eccemotus.GetGraphPipelined(
+        lines, decoder=eccemotus.DecodeLines, batch_size=9)
+    self.assertEqual(pipelined_graph.MinimalSerialize(),
+                     graph.MinimalSerialize())
+    self.assertTrue(graph.edges)
+
+  def test_GetGraphParseCache(self):
+    """Tests that graph from parse cache equals graph from events."""
+    events = [
+        {u'data_type': u'syslog:ssh:login', u'hostname': u'host',
+         u'message': u'Successful login of user: user{0:d} from '
+                     u'10.0.0.1:22'.format(index),
+         u'timestamp': index}
+        for index in range(10)]
+    directory = tempfile.mkdtemp()
+    try:
+      cache = parse_cache.ParsedEventCache(directory, u'events')
+      graph = eccemotus.GetGraph(events, parse_cache=cache)
+      self.assertTrue(cache.Exists())
+      cached_graph = eccemotus.GetGraph([], parse_cache=cache)
+      pipelined_graph = eccemotus.GetGraphPipelined([], parse_cache=cache)
+    finally:
+      shutil.rmtree(directory)
+    self.assertEqual(
+        cached_graph.MinimalSerialize(), graph.MinimalSerialize())
+    self.assertEqual(
+        pipelined_graph.MinimalSerialize(), graph.MinimalSerialize())
+    self.assertEqual(len(graph.nodes), 12)
+
+  def test_GetElasticQuery(self):
+    """Tests pushdown of parser filters and time range to elasticsearch."""
+    query = eccemotus.GetElasticQuery()
+    self.assertEqual(query, {u'query': {u'bool': {u'filter': [
+        eccemotus.manager.ParserManager.GetElasticFilter()]}}})
+
+    user_query = {u'match': {u'hostname': u'acserver'}}
+    query = eccemotus.GetElasticQuery(user_query, since=10, until=20)
+    bool_query = query[u'query'][u'bool']
+    self.assertEqual(bool_query[u'must'], user_query)
+    self.assertEqual(
+        bool_query[u'filter'][1],
+        {u'range': {u'timestamp': {u'gte': 10, u'lte': 20}}})
+
+    query = eccemotus.GetElasticQuery(since=10)
+    self.assertEqual(
+        query[u'query'][u'bool'][u'filter'][1],
+        {u'range': {u'timestamp': {u'gte': 10}}})
+
+  def test_ElasticAggregationGenerator(self):
+    """Tests building graph from composite aggregation buckets."""
+    hour = 3600 * 1000000
+    pages = [
+        [({u'timestamp': 0.0, u'hostname': u'acserver',
+           u'ip_address': u'192.168.1.11', u'ip_address.stream': None,
+           u'user': u'dean', u'computer_name': u'192.168.1.11'}, 5),
+         # Index where ip_address is a serialized bytes object.
+         ({u'timestamp': float(hour), u'hostname': u'acserver',
+           u'ip_address': None, u'ip_address.stream': u'192.168.1.11',
+           u'user': u'dean', u'computer_name': u'192.168.1.11'}, 2)],
+        [({u'timestamp': float(hour), u'hostname': u'acserver',
+           u'ip_address': None, u'ip_address.stream': None, u'user': u'root',
+           u'computer_name': None}, 1)]]
+    client = FakeElasticClient(pages)
+    events = list(eccemotus.ElasticAggregationGenerator(
+        client, [u'plaso'], u'linux:utmp:event',
+        eccemotus.manager.ParserManager.GetAggregatedTypes()[
+            u'linux:utmp:event'],
+        hour, since=0, page_size=2))
+
+    self.assertEqual(len(client.requests), 3)
+    request = client.requests[0]
+    self.assertEqual(request[u'size'], 0)
+    self.assertEqual(
+        request[u'query'][u'bool'][u'filter'][0][u'bool'][u'should'],
+        [{u'term': {u'data_type': u'linux:utmp:event'}}])
+    composite = request[u'aggs'][u'buckets'][u'composite']
+    self.assertEqual(composite[u'size'], 2)
+    self.assertEqual(
+        [list(source)[0] for source in composite[u'sources']],
+        [u'timestamp', u'hostname', u'ip_address', u'ip_address.stream',
+         u'user', u'computer_name'])
+    # Text fields of plaso indices are aggregated on keyword subfields.
+    self.assertEqual(
+        [list(source.values())[0][u'terms'][u'field']
+         for source in composite[u'sources'][1:]],
+        [u'hostname.keyword', u'ip_address.keyword',
+         u'ip_address.stream.keyword', u'user.keyword',
+         u'computer_name.keyword'])
+    self.assertNotIn(u'after', composite)
+    self.assertEqual(
+        client.requests[1][u'aggs'][u'buckets'][u'composite'][u'after'],
+        {u'page': 0})
+
+    self.assertEqual(len(events), 3)
+    self.assertEqual(events[1][u'ip_address'], {u'stream': u'192.168.1.11'})
+    self.assertEqual(len(set(event.pop(u'uuid') for event in events)), 3)
+    self.assertEqual(events[2], {
+        u'data_type': u'linux:utmp:event', u'hostname': u'acserver',
+        u'user': u'root', u'timestamp': hour, u'__count__': 1})
+
+    graph = eccemotus.GetGraph(events)
+    access_edges = [
+        edge for edge in graph.edges
+        if edge[u'type'] == graph.EDGE_ACCESS]
+    self.assertEqual(len(access_edges), 1)
+    self.assertEqual(
+        access_edges[0][u'events'],
+        [{u'id': access_edges[0][u'events'][0][u'id'], u'timestamp': 0,
+          u'count': 5},
+         {u'id': access_edges[0][u'events'][1][u'id'], u'timestamp': hour,
+          u'count': 2}])
+    self.assertEqual(graph.GetEventCount(access_edges[0]), 7)
+    for edge in graph.edges:
+      if edge[u'type'] == graph.EDGE_HAS and len(edge[u'events']) == 1:
+        self.assertNotIn(u'count', edge[u'events'][0])
+
+  def test_ElasticAggregationGeneratorDeduplicate(self):
+    """Tests that buckets of one time slot are not deduplicated together."""
+    pages = [[
+        ({u'timestamp': 0.0, u'hostname': u'acserver',
+          u'ip_address': u'192.168.1.11', u'ip_address.stream': None,
+          u'user': u'alice', u'computer_name': u'192.168.1.11'}, 5),
+        ({u'timestamp': 0.0, u'hostname': u'acserver',
+          u'ip_address': u'192.168.1.11', u'ip_address.stream': None,
+          u'user': u'bob', u'computer_name': u'192.168.1.11'}, 3)]]
+    fields = eccemotus.manager.ParserManager.GetAggregatedTypes()[
+        u'linux:utmp:event']
+    events = list(eccemotus.ElasticAggregationGenerator(
+        FakeElasticClient(pages), [u'plaso'], u'linux:utmp:event', fields,
+        3600 * 1000000))
+
+    # The same bucket read again keeps its identifier.
+    self.assertEqual(
+        [event[u'uuid'] for event in events],
+        [event[u'uuid'] for event in eccemotus.ElasticAggregationGenerator(
+            FakeElasticClient(pages), [u'plaso'], u'linux:utmp:event',
+            fields, 3600 * 1000000)])
+
+    graph = eccemotus.GetGraph(events, deduplicate=True)
+    is_edges = [
+        edge for edge in graph.edges if edge[u'type'] == graph.EDGE_IS]
+    self.assertEqual(len(is_edges), 1)
+    self.assertEqual(graph.GetEventCount(is_edges[0]), 8)
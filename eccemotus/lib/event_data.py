@@ -87,9 +87,13 @@ class EventData(object):
   datum.
 
   Attributes:
+    count (int): number of events represented by this EventData, more than
+        one for pre-aggregated events.
     event_data_type: data_type of event responsible for creation of this
         EventData.
     event_id (int): id of event responsible for creation of this EventData.
+    failed (bool): whether the event records a failed attempt, e.g. a failed
+        logon, rather than a successful access.
     timestamp (int): timestamp id of event responsible for creation of this
         EventData.
   """
@@ -101,7 +105,8 @@ class EventData(object):
   }
 
   def __init__(
-      self, data=None, event_data_type=None, event_id=None, timestamp=None):
+      self, data=None, event_data_type=None, event_id=None, timestamp=None,
+      count=1, failed=False):
     """Initializes empty EventData.
 
     Args:
@@ -109,11 +114,15 @@ class EventData(object):
       event_data_type (str): plaso event data_type.
       event_id (int|str): event identifier.
       timestamp (int): timestamp of event.
+      count (int): number of represented events.
+      failed (bool): whether the event records a failed attempt.
     """
     if data is None:
       data = []
     self._index = {}  # Holds each added datum.
+    self.count = count
     self.event_id = event_id
+    self.failed = failed
     self.timestamp = timestamp
     self.event_data_type = event_data_type
     for datum in data:
@@ -162,3 +171,54 @@ class EventData(object):
       bool: whether the EventData is empty.
     """
     return len(self._index) == 0
+
+
+class ExtractionPlan(object):
+  """Precompiled recipe for extracting event data from a sequence of values.
+
+  Plan is compiled once from reference data and positions of their values.
+  Applying it does not create reference data nor compute their full names and
+  black lists for every event.
+  """
+
+  def __init__(self, fields):
+    """Initializes ExtractionPlan.
+
+    Args:
+      fields (iterable[tuple]): reference datum (its class, source and
+          target), position of its value in the sequence and optionally
+          a function converting the value. Converted value None is skipped.
+    """
+    compiled_fields = []
+    for field in fields:
+      datum, position = field[:2]
+      converter = field[2] if len(field) > 2 else None
+      compiled_fields.append((
+          datum.__class__, datum.source, datum.target, datum.GetFullName(),
+          position, converter,
+          EventData.BLACK_LIST.get(datum.__class__, frozenset())))
+    self._fields = tuple(compiled_fields)
+
+  def Apply(self, values, data):
+    """Adds data with values from their positions.
+
+    Equivalent to data.Add for every field. Positions out of values are
+    skipped.
+
+    Args:
+      values (list): sequence of values (e.g. windows event strings).
+      data (EventData): event data to be extended.
+    """
+    # pylint: disable=protected-access
+    index = data._index
+    values_count = len(values)
+    for (datum_class, source, target, full_name, position, converter,
+         black_list) in self._fields:
+      if position >= values_count:
+        continue
+      value = values[position]
+      if converter and value:
+        value = converter(value)
+      if value and value not in black_list:
+        index[full_name] = datum_class(
+            value=value, source=source, target=target)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""On-disk storage of edge events.
+
+Events of edges dominate the size of large graphs. Graph created with an
+EventStore keeps only nodes and edge keys in memory and appends events to a
+sqlite table, so the graph size is bounded by disk rather than memory. Events
+are read back edge by edge when the graph is serialized (see
+graph_stream.WriteGraph).
+"""
+
+import numbers
+import os
+import sqlite3
+import tempfile
+
+from eccemotus.lib import json_codec
+
+
+class EventStore(object):
+  """Appends events of edges to a temporary sqlite database.
+
+  Inserts are buffered and written in large transactions. The database file
+  is removed by Close.
+
+  Attributes:
+    path (str): path of the database file.
+  """
+
+  # Number of buffered events written in one transaction.
+  _BATCH_SIZE = 10000
+
+  def __init__(self, directory=None):
+    """Initializes EventStore.
+
+    Args:
+      directory (None|str): directory of the database file, None for the
+          default temporary directory.
+    """
+    file_descriptor, self.path = tempfile.mkstemp(
+        prefix=u'eccemotus-events-', suffix=u'.sqlite', dir=directory)
+    os.close(file_descriptor)
+    self._buffer = []
+    self._database = sqlite3.connect(self.path)
+    # The database is temporary, so durability is not needed.
+    self._database.execute(u'PRAGMA journal_mode = OFF')
+    self._database.execute(u'PRAGMA synchronous = OFF')
+    self._database.execute(
+        u'CREATE TABLE events (edge_id INTEGER, timestamp INTEGER, '
+        u'count INTEGER, event TEXT)')
+    self._indexed = False
+
+  def Add(self, edge_id, event):
+    """Appends event to edge.
+
+    Args:
+      edge_id (int): edge identifier.
+      event (dict): event with id, timestamp and optional count.
+    """
+    timestamp = event.get(u'timestamp')
+    if not isinstance(timestamp, numbers.Number):
+      timestamp = None
+    self._buffer.append((
+        edge_id, timestamp, event.get(u'count', 1), json_codec.Dumps(event)))
+    if len(self._buffer) >= self._BATCH_SIZE:
+      self.Flush()
+
+  def Flush(self):
+    """Writes buffered events to the database."""
+    if not self._buffer:
+      return
+    with self._database:
+      self._database.executemany(
+          u'INSERT INTO events VALUES (?, ?, ?, ?)', self._buffer)
+    self._buffer = []
+
+  def _PrepareReading(self):
+    """Flushes buffered events and indexes events by edge."""
+    self.Flush()
+    if not self._indexed:
+      self._database.execute(
+          u'CREATE INDEX events_edge_id ON events (edge_id)')
+      self._indexed = True
+
+  def GetEvents(self, edge_id):
+    """Reads events of edge.
+
+    Args:
+      edge_id (int): edge identifier.
+
+    Returns:
+      list[dict]: events in order of adding.
+    """
+    self._PrepareReading()
+    cursor = self._database.execute(
+        u'SELECT event FROM events WHERE edge_id = ? ORDER BY rowid',
+        (edge_id,))
+    return [json_codec.Loads(event) for event, in cursor]
+
+  def IterateEvents(self):
+    """Iterates over events of all edges ordered by edge identifier.
+
+    Yields:
+      tuple[int, list[dict]]: edge identifier and its events in order of
+          adding. Edges without events are skipped.
+    """
+    self._PrepareReading()
+    cursor = self._database.execute(
+        u'SELECT edge_id, event FROM events ORDER BY edge_id, rowid')
+    edge_id = None
+    events = []
+    for row_edge_id, event in cursor:
+      if row_edge_id != edge_id:
+        if events:
+          yield edge_id, events
+        edge_id = row_edge_id
+        events = []
+      events.append(json_codec.Loads(event))
+    if events:
+      yield edge_id, events
+
+  def GetStatistics(self):
+    """Computes number of events and the latest timestamp of every edge.
+
+    Returns:
+      dict[int, tuple[int, int]]: event count (including events represented
+          by aggregates) and the latest timestamp (0 if there is none) by edge
+          identifier.
+    """
+    self._PrepareReading()
+    cursor = self._database.execute(
+        u'SELECT edge_id, SUM(count), MAX(COALESCE(timestamp, 0)) '
+        u'FROM events GROUP BY edge_id')
+    return dict(
+        (edge_id, (count, latest)) for edge_id, count, latest in cursor)
+
+  def Close(self):
+    """Closes and removes the database."""
+    self._database.close()
+    os.remove(self.path)
@@ -4,13 +4,25 @@
 For default use-case, call CreateGraph(data).MinimalSerialize().
 This returns json representation of property graph. It can be directly send to
 javascript visualization.
+
+Serialize(SCHEMA_V2) gives a more compact representation, where events of
+every link are stored as parallel arrays of ids and delta encoded timestamps
+instead of one object per event. LoadGraph and the visualization read both.
 """
 
 from collections import defaultdict
+from collections import deque
 from collections import namedtuple
 import logging
+import numbers
 
 from eccemotus.lib import event_data
+from eccemotus.lib import membership
+
+
+# Versions of graph serialization. Version 1 has no version marker.
+SCHEMA_V1 = 1
+SCHEMA_V2 = 2
 
 
 class Graph(object):
@@ -37,10 +49,13 @@ class Graph(object):
         "is": Machine is ip_address (this is not necessarily true for the whole
             time)
         "access": remote connection
+        "failed_access": failed attempt of remote connection (e.g. failed
+            logon)
     events:
       List of event ids and timestamps. Those events are responsible for
       creation of given edge. Events can be found by id in timesketch or
-      filtered by timestamps.
+      filtered by timestamps. Pre-aggregated events have count of events
+      they represent.
   In fact, every edge in a graph represents multiple edges created by multiple
   events. Those events are specified in events property of this node.
 
@@ -57,6 +72,11 @@ class Graph(object):
     edges (list): list of graph edges.
     edges_ids (defaultdict[tuple, int]): maps tuple serialized edges to their
         ids.
+    event_filter (membership.EventIdFilter|None): if set, events already
+        present at an edge (with the same event id) are not added again.
+    event_store (event_store.EventStore|None): if set, events of edges are
+        stored there instead of in "events" property of edges, which stays
+        empty. Use GetEdgeEvents and IterateEdges to read them.
     nodes (list): list of graph nodes.
     nodes_ids (defaultdict[tuple, int]): maps tuple serialized nodes to their
         ids.
@@ -66,6 +86,7 @@ class Graph(object):
   EDGE_HAS = u'has'
   EDGE_IS = u'is'
   EDGE_ACCESS = u'access'
+  EDGE_FAILED_ACCESS = u'failed_access'
 
   # Rules describing which pairs of event_data should create which type of
   # edge.
@@ -113,10 +134,42 @@ class Graph(object):
       event_data.UserName, event_data.UserId, event_data.MachineName,
       event_data.Ip, event_data.StorageFileName)
 
-  def __init__(self):
-    """Initializes empty graph."""
+  # Summary of Compact: numbers of kept and dropped nodes, access edges and
+  # events of dropped access edges and number of collapsed user nodes.
+  CompactionReport = namedtuple(u'CompactionReport', [
+      u'kept_nodes', u'dropped_nodes', u'collapsed_nodes', u'kept_edges',
+      u'dropped_edges', u'dropped_events'])
+
+  # Orderings of access edges for Compact.
+  COMPACT_BY_COUNT = u'count'
+  COMPACT_BY_RECENCY = u'recency'
+
+  # Node types collapsed into cluster center by Compact.
+  COLLAPSIBLE_NODE_TYPES = frozenset([
+      event_data.UserName.NAME, event_data.UserId.NAME])
+
+  # Priorities of node types to be the center of a cluster, lower is better.
+  CLUSTER_PRIORITY = {
+      u'machine_name': 0,
+      u'ip': 1,
+      u'user_name': 2,
+      u'user_id': 3
+  }
+  DEFAULT_CLUSTER_PRIORITY = 10**10
+
+  def __init__(self, event_filter=None, event_store=None):
+    """Initializes empty graph.
+
+    Args:
+      event_filter (membership.EventIdFilter): filter for deduplication of
+          events by their ids. None disables deduplication.
+      event_store (event_store.EventStore): on-disk storage of edge events.
+          None keeps events in memory.
+    """
     self.edges = []
     self.edges_ids = defaultdict(int)  # Provides fast index for edges.
+    self.event_filter = event_filter
+    self.event_store = event_store
     self.nodes = []
     self.nodes_ids = defaultdict(int)  # Provides fast index for nodes.
 
@@ -140,38 +193,175 @@ class Graph(object):
 
     return self.nodes_ids[node.ToTuple()]
 
-  def AddEdge(self, source_id, target_id, edge_type, timestamp, event_id):
+  def AddEdge(
+      self, source_id, target_id, edge_type, timestamp, event_id, count=1):
     """Adds new edge to graph or just adds new event to existing edge.
 
     Args:
-      edge_type (str): type of the edge (currently "has", "is" or "access").
+      edge_type (str): type of the edge (currently "has", "is", "access" or
+          "failed_access").
       event_id (int|str): identifier for event responsible for this edge.
       source_id (int): id of source node.
       target_id (int): id of target node.
       timestamp (int): timestamp when event happened.
+      count (int): number of events represented by the event, stored only
+          if it is not 1.
     """
     edge = (source_id, target_id, edge_type)
     if edge in self.edges_ids:
       edge_id = self.edges_ids[edge]
-      event = {
-          u'id': event_id,
-          u'timestamp': timestamp
-      }
-      self.edges[edge_id][u'events'].append(event)
+      if not self._IsNewEvent(edge_id, event_id):
+        return
     else:
       edge_id = len(self.edges)
       self.edges_ids[edge] = edge_id
-      event = {
-          u'id': event_id,
-          u'timestamp': timestamp
-      }
+      self._IsNewEvent(edge_id, event_id)
       self.edges.append({
           u'source': source_id,
           u'target': target_id,
           u'type': edge_type,
-          u'events': [event],
+          u'events': [],
       })
 
+    event = {
+        u'id': event_id,
+        u'timestamp': timestamp
+    }
+    if count != 1:
+      event[u'count'] = count
+    self._AddEvent(edge_id, event)
+
+  def _AddEvent(self, edge_id, event):
+    """Appends event to edge in memory or in the event store.
+
+    Args:
+      edge_id (int): edge identifier.
+      event (dict): event.
+    """
+    if self.event_store is None:
+      self.edges[edge_id][u'events'].append(event)
+    else:
+      self.event_store.Add(edge_id, event)
+
+  def GetEdgeEvents(self, edge_id):
+    """Gets events of edge.
+
+    Args:
+      edge_id (int): edge identifier.
+
+    Returns:
+      list[dict]: events of edge, read from the event store if it is used.
+    """
+    if self.event_store is None:
+      return self.edges[edge_id][u'events']
+    return self.event_store.GetEvents(edge_id)
+
+  def IterateEdges(self):
+    """Iterates over edges with their events.
+
+    With the event store only events of one edge are in memory at a time.
+
+    Yields:
+      dict: edge with "events" property.
+    """
+    if self.event_store is None:
+      for edge in self.edges:
+        yield edge
+      return
+
+    stored_events = self.event_store.IterateEvents()
+    next_edge_id, next_events = next(stored_events, (None, None))
+    for edge_id, edge in enumerate(self.edges):
+      events = []
+      if edge_id == next_edge_id:
+        events = next_events
+        next_edge_id, next_events = next(stored_events, (None, None))
+      edge = dict(edge)
+      edge[u'events'] = events
+      yield edge
+
+  def _GetEdgeStatistics(self):
+    """Computes number of events and the latest timestamp of every edge.
+
+    Returns:
+      list[tuple[int, int]]: event count (including events represented by
+          aggregates) and the latest timestamp (0 if there is none) by edge
+          identifier.
+    """
+    if self.event_store is None:
+      return [
+          (self.GetEventCount(edge),
+           max([event.get(u'timestamp') or 0 for event in edge[u'events']]
+               or [0]))
+          for edge in self.edges]
+
+    statistics = self.event_store.GetStatistics()
+    return [statistics.get(edge_id, (0, 0)) for edge_id in range(
+        len(self.edges))]
+
+  def _IsNewEvent(self, edge_id, event_id):
+    """Checks and records whether the event is new for given edge.
+
+    Args:
+      edge_id (int): edge identifier.
+      event_id (int|str): event identifier.
+
+    Returns:
+      bool: False if deduplication is enabled and the edge already has
+          the event.
+    """
+    if self.event_filter is None or event_id is None:
+      return True
+    return self.event_filter.AddIfNew((edge_id, event_id))
+
+  def Merge(self, other):
+    """Adds nodes and edges of other graph to this graph.
+
+    Nodes are matched by their type and value, so node ids of other graph are
+    remapped through nodes_ids. Events of edges present in both graphs are
+    concatenated (and deduplicated if event_filter is set). Cluster
+    assignments are not merged, call Finalize afterwards. Both graphs can use
+    event stores.
+
+    Args:
+      other (Graph): graph to be merged into this graph. It is not modified.
+    """
+    node_id_map = [
+        self.GetAddNode(node.get(u'type'), node.get(u'value'))
+        for node in other.nodes]
+
+    for edge in other.IterateEdges():
+      source_id = node_id_map[edge[u'source']]
+      target_id = node_id_map[edge[u'target']]
+      edge_tuple = (source_id, target_id, edge[u'type'])
+      if edge_tuple in self.edges_ids:
+        edge_id = self.edges_ids[edge_tuple]
+      else:
+        edge_id = len(self.edges)
+        self.edges_ids[edge_tuple] = edge_id
+        self.edges.append({
+            u'source': source_id,
+            u'target': target_id,
+            u'type': edge[u'type'],
+            u'events': [],
+        })
+
+      for event in edge[u'events']:
+        if self._IsNewEvent(edge_id, event.get(u'id')):
+          self._AddEvent(edge_id, event)
+
+  @classmethod
+  def GetEventCount(cls, edge):
+    """Counts events of edge including events represented by aggregates.
+
+    Args:
+      edge (dict): graph edge.
+
+    Returns:
+      int: number of events.
+    """
+    return sum(event.get(u'count', 1) for event in edge[u'events'])
+
   @classmethod
   def GetRemote(cls, data, source=False, target=False):
     """Gets most specific remote source/target.
@@ -202,7 +392,8 @@ class Graph(object):
 
 
   def AddData(
-      self, source_datum, target_datum, edge_type, event_time, event_id):
+      self, source_datum, target_datum, edge_type, event_time, event_id,
+      count=1):
     """Adds edge with corresponding nodes to graph.
 
     This ensures that required nodes are in the graph and creates an edge
@@ -214,10 +405,11 @@ class Graph(object):
       event_time (str): timestamp for event.
       source_datum (event_data.EventDatum): event datum about source node.
       target_datum (event_data.EventDatum): event datum about target node.
+      count (int): number of events represented by the event.
     """
     source_id = self.GetAddNode(source_datum.NAME, source_datum.value)
     target_id = self.GetAddNode(target_datum.NAME, target_datum.value)
-    self.AddEdge(source_id, target_id, edge_type, event_time, event_id)
+    self.AddEdge(source_id, target_id, edge_type, event_time, event_id, count)
 
   def AddEventData(self, parsed_event):
     """Processes one parsed event and encodes it to edges and nodes.
@@ -237,20 +429,64 @@ class Graph(object):
       if source_datum and target_datum:
         self.AddData(
             source_datum, target_datum, rule.type, parsed_event.timestamp,
-            parsed_event.event_id)
+            parsed_event.event_id, parsed_event.count)
 
-    # Rules for access edges.
+    # Rules for access edges. Failed attempts are kept apart from successful
+    # accesses.
     remote_source = self.__class__.GetRemote(parsed_event, source=True)
     remote_target = self.__class__.GetRemote(parsed_event, target=True)
     if remote_source and remote_target:
+      if parsed_event.failed:
+        edge_type = self.__class__.EDGE_FAILED_ACCESS
+      else:
+        edge_type = self.__class__.EDGE_ACCESS
       self.AddData(
-          remote_source, remote_target, self.__class__.EDGE_ACCESS,
-          parsed_event.timestamp, parsed_event.event_id)
+          remote_source, remote_target, edge_type, parsed_event.timestamp,
+          parsed_event.event_id, parsed_event.count)
 
   def MinimalSerialize(self):
-    """Serializes only required data for visualization."""
+    """Serializes only required data for visualization.
+
+    Events in the event store are not included, such graphs are serialized by
+    graph_stream.WriteGraph.
+    """
     return {u'nodes': self.nodes, u'links': self.edges}
 
+  def Serialize(self, version=SCHEMA_V2):
+    """Serializes graph in given schema version.
+
+    Args:
+      version (int): SCHEMA_V1 (same as MinimalSerialize) or SCHEMA_V2 (links
+          with event arrays, see EncodeLink).
+
+    Returns:
+      dict: serialized graph. Events are read from the event store if the
+          graph uses one.
+
+    Raises:
+      ValueError: if the version is not supported.
+    """
+    if version == SCHEMA_V1:
+      return {u'nodes': self.nodes, u'links': list(self.IterateEdges())}
+    if version == SCHEMA_V2:
+      return {
+          u'version': SCHEMA_V2,
+          u'nodes': self.nodes,
+          u'links': [EncodeLink(edge) for edge in self.IterateEdges()]}
+    raise ValueError(u'Unsupported schema version: {0!s}'.format(version))
+
+  @classmethod
+  def GetClusterPriority(cls, node_type):
+    """Returns priority of node type to be the center of a cluster.
+
+    Args:
+      node_type (str): node type.
+
+    Returns:
+      int: priority, lower is better.
+    """
+    return cls.CLUSTER_PRIORITY.get(node_type, cls.DEFAULT_CLUSTER_PRIORITY)
+
   def Finalize(self):
     """Assigns cluster identifier to each node.
 
@@ -299,16 +535,7 @@ class Graph(object):
         int: priority.
       """
       node = item[1]
-      PRIORITY = {
-          u'machine_name': 0,
-          u'ip': 1,
-          u'user_name':2,
-          u'user_id': 3
-      }
-      if node[u'type'] in PRIORITY:
-        return PRIORITY[node[u'type']]
-      else:
-        return 10**10
+      return self.GetClusterPriority(node[u'type'])
 
 
 
@@ -344,6 +571,213 @@ class Graph(object):
 
     return aggregation
 
+  def _GetClusterPaths(self):
+    """Computes paths from nodes to their cluster centers.
+
+    Requires finalized graph.
+
+    Returns:
+      list[int]: next node on has/is path to cluster center for every node.
+          Cluster centers point to themselves.
+    """
+    neighbours = [[] for _ in self.nodes]
+    for edge in self.edges:
+      if edge[u'type'] in (self.EDGE_HAS, self.EDGE_IS):
+        neighbours[edge[u'source']].append(edge[u'target'])
+        neighbours[edge[u'target']].append(edge[u'source'])
+
+    parents = [None] * len(self.nodes)
+    for node_id, node in enumerate(self.nodes):
+      if node.get(u'cluster') != node_id:
+        continue
+      # Breadth first search gives the shortest paths to the center.
+      parents[node_id] = node_id
+      queue = deque([node_id])
+      while queue:
+        current_id = queue.popleft()
+        for neighbour_id in neighbours[current_id]:
+          if parents[neighbour_id] is None:
+            parents[neighbour_id] = current_id
+            queue.append(neighbour_id)
+    return parents
+
+  def Compact(self, max_nodes, order_by=COMPACT_BY_COUNT):
+    """Creates smaller graph with the most important access edges.
+
+    Access edges are ranked by number of events (count) or by their latest
+    event (recency) and taken in this order while the graph fits into
+    max_nodes. Ends of every taken edge are kept together with has/is paths to
+    their cluster centers, so clusters stay connected. Other user names and
+    ids are collapsed into their cluster center: they are dropped and their
+    numbers by type are stored in "collapsed" property of the center node.
+    Other nodes and edges are dropped. This graph is finalized, but otherwise
+    not modified. The compacted graph keeps events in memory even if this
+    graph uses the event store.
+
+    Args:
+      max_nodes (int): maximum number of nodes in compacted graph.
+      order_by (str): ranking of access edges, "count" or "recency".
+
+    Returns:
+      tuple[Graph, Graph.CompactionReport]: finalized compacted graph and
+          report of what was dropped.
+
+    Raises:
+      ValueError: if order_by is not supported.
+    """
+    if order_by not in (self.COMPACT_BY_COUNT, self.COMPACT_BY_RECENCY):
+      raise ValueError(u'Unsupported ordering: {0:s}'.format(order_by))
+
+    self.Finalize()
+    parents = self._GetClusterPaths()
+
+    statistics = self._GetEdgeStatistics()
+    ranking = []
+    for edge_id, edge in enumerate(self.edges):
+      if edge[u'type'] != self.EDGE_ACCESS:
+        continue
+      count, latest = statistics[edge_id]
+      if order_by == self.COMPACT_BY_COUNT:
+        ranking.append((-count, -latest, edge_id))
+      else:
+        ranking.append((-latest, -count, edge_id))
+    ranking.sort()
+
+    kept_nodes = set()
+    kept_edges = set()
+    for _, _, edge_id in ranking:
+      edge = self.edges[edge_id]
+      required_nodes = set()
+      for node_id in (edge[u'source'], edge[u'target']):
+        while node_id not in kept_nodes and node_id not in required_nodes:
+          required_nodes.add(node_id)
+          if parents[node_id] == node_id:
+            break
+          node_id = parents[node_id]
+
+      if len(kept_nodes) + len(required_nodes) <= max_nodes:
+        kept_nodes.update(required_nodes)
+        kept_edges.add(edge_id)
+
+    compacted = Graph()
+    node_id_map = {}
+    for node_id in sorted(kept_nodes):
+      node = self.nodes[node_id]
+      node_id_map[node_id] = compacted.GetAddNode(
+          node.get(u'type'), node.get(u'value'))
+
+    for edge_id, edge in enumerate(self.edges):
+      if edge[u'type'] == self.EDGE_ACCESS:
+        if edge_id not in kept_edges:
+          continue
+      elif (edge[u'source'] not in kept_nodes or
+            edge[u'target'] not in kept_nodes):
+        continue
+      source_id = node_id_map[edge[u'source']]
+      target_id = node_id_map[edge[u'target']]
+      compacted.edges_ids[(source_id, target_id, edge[u'type'])] = len(
+          compacted.edges)
+      compacted.edges.append({
+          u'source': source_id,
+          u'target': target_id,
+          u'type': edge[u'type'],
+          u'events': list(self.GetEdgeEvents(edge_id)),
+      })
+
+    collapsed_nodes = 0
+    for node_id, node in enumerate(self.nodes):
+      center_id = node.get(u'cluster')
+      if (node_id in kept_nodes or center_id not in kept_nodes or
+          node.get(u'type') not in self.COLLAPSIBLE_NODE_TYPES):
+        continue
+      center = compacted.nodes[node_id_map[center_id]]
+      collapsed = center.setdefault(u'collapsed', {})
+      collapsed[node[u'type']] = collapsed.get(node[u'type'], 0) + 1
+      collapsed_nodes += 1
+
+    compacted.Finalize()
+
+    dropped_events = 0
+    access_edges = 0
+    for edge_id, edge in enumerate(self.edges):
+      if edge[u'type'] == self.EDGE_ACCESS:
+        access_edges += 1
+        if edge_id not in kept_edges:
+          dropped_events += statistics[edge_id][0]
+
+    report = self.CompactionReport(
+        kept_nodes=len(kept_nodes),
+        dropped_nodes=len(self.nodes) - len(kept_nodes),
+        collapsed_nodes=collapsed_nodes,
+        kept_edges=len(kept_edges),
+        dropped_edges=access_edges - len(kept_edges),
+        dropped_events=dropped_events)
+    return compacted, report
+
+  def CollapseClusters(self, expanded_clusters=None):
+    """Creates graph where clusters are represented by single nodes.
+
+    Nodes of every cluster, except the expanded ones, are replaced by the
+    cluster center. Numbers of replaced nodes by type are stored in
+    "collapsed" property of the center. Edges are redirected accordingly,
+    edges inside a collapsed cluster are dropped and parallel edges are
+    aggregated into one edge with events of all of them.
+
+    Every node of the result has "full_cluster" property, the id of its
+    cluster in this graph. These ids are used to select clusters to expand.
+    The collapsed graph keeps events in memory even if this graph uses the
+    event store.
+
+    Args:
+      expanded_clusters (iterable[int]): ids of clusters in this graph, whose
+          nodes are kept. None collapses all clusters.
+
+    Returns:
+      Graph: finalized collapsed graph.
+    """
+    if any(u'cluster' not in node for node in self.nodes):
+      self.Finalize()
+    expanded_clusters = frozenset(expanded_clusters or [])
+
+    collapsed = Graph()
+    node_id_map = []
+    for node_id, node in enumerate(self.nodes):
+      cluster_id = node[u'cluster']
+      if cluster_id in expanded_clusters:
+        representative = node
+      else:
+        representative = self.nodes[cluster_id]
+      new_node_id = collapsed.GetAddNode(
+          representative.get(u'type'), representative.get(u'value'))
+      node_id_map.append(new_node_id)
+
+      new_node = collapsed.nodes[new_node_id]
+      new_node[u'full_cluster'] = cluster_id
+      if representative is not node:
+        counts = new_node.setdefault(u'collapsed', {})
+        counts[node[u'type']] = counts.get(node[u'type'], 0) + 1
+
+    for edge in self.IterateEdges():
+      source_id = node_id_map[edge[u'source']]
+      target_id = node_id_map[edge[u'target']]
+      if source_id == target_id:
+        continue
+      edge_tuple = (source_id, target_id, edge[u'type'])
+      if edge_tuple in collapsed.edges_ids:
+        edge_id = collapsed.edges_ids[edge_tuple]
+        collapsed.edges[edge_id][u'events'].extend(edge[u'events'])
+      else:
+        collapsed.edges_ids[edge_tuple] = len(collapsed.edges)
+        collapsed.edges.append({
+            u'source': source_id,
+            u'target': target_id,
+            u'type': edge[u'type'],
+            u'events': list(edge[u'events']),
+        })
+
+    collapsed.Finalize()
+    return collapsed
+
 
 class Node(object):
   """Graph node.
@@ -390,18 +824,25 @@ class Node(object):
     """
     return (self.type, self.value)
 
-def CreateGraph(events_data, verbose=False):
+def CreateGraph(
+    events_data, verbose=False, deduplicate=False, event_store=None):
   """Creates graph from events_data.
 
   Args:
     events_data (iterable[event_data.EventData]): data can be any iterable
         (list), preferably generator, because of memory optimization.
+    verbose (bool): control for verbosity.
+    deduplicate (bool): whether events with the same id should be added to an
+        edge only once.
+    event_store (event_store.EventStore): on-disk storage of edge events.
+        None keeps events in memory.
 
   Returns:
     Graph: property graph for events.
   """
   logger = logging.getLogger(__name__)
-  graph = Graph()
+  graph = Graph(
+      event_filter=GetEventFilter(deduplicate), event_store=event_store)
   VERBOSE_INTERVAL = 1000
   for i, event in enumerate(events_data):
     graph.AddEventData(event)
@@ -412,19 +853,136 @@ def CreateGraph(events_data, verbose=False):
   graph.Finalize()
   return graph
 
+def GetEventFilter(deduplicate):
+  """Creates filter for deduplication of events.
+
+  Args:
+    deduplicate (bool): whether deduplication is required.
+
+  Returns:
+    membership.EventIdFilter|None: event filter or None if deduplicate is
+        False.
+  """
+  if not deduplicate:
+    return None
+  return membership.EventIdFilter()
+
+def MergeGraphs(graphs, deduplicate=False):
+  """Merges independently created graphs into one graph.
+
+  This allows to create partial graphs (e.g. one for each host's plaso export)
+  in parallel and reduce them afterwards.
+
+  Args:
+    graphs (iterable[Graph]): graphs to be merged, preferably generator, so
+        only one partial graph has to be in memory at a time.
+    deduplicate (bool): whether events with the same id should be added to an
+        edge only once. Useful when partial graphs were created from
+        overlapping exports.
+
+  Returns:
+    Graph: merged and finalized graph.
+  """
+  graph = Graph(event_filter=GetEventFilter(deduplicate))
+  for partial_graph in graphs:
+    graph.Merge(partial_graph)
+
+  graph.Finalize()
+  return graph
+
+# Keys of events that can be encoded in event arrays of schema version 2.
+_EVENT_KEYS = frozenset([u'id', u'timestamp'])
+_AGGREGATED_EVENT_KEYS = frozenset([u'id', u'timestamp', u'count'])
+
+
+def EncodeLink(edge):
+  """Encodes edge as link of schema version 2.
+
+  Events are replaced by parallel arrays: event_ids, timestamps as
+  differences from the previous event's timestamp (the first one from 0) and
+  event_counts, present only if some event is aggregated. The order of
+  events is kept. Edges with events that do not fit the arrays (e.g. without
+  integer timestamp) keep their events.
+
+  Args:
+    edge (dict): graph edge.
+
+  Returns:
+    dict: link.
+  """
+  events = edge[u'events']
+  for event in events:
+    keys = frozenset(event)
+    timestamp = event.get(u'timestamp')
+    if ((keys != _EVENT_KEYS and keys != _AGGREGATED_EVENT_KEYS) or
+        not isinstance(timestamp, numbers.Integral) or
+        isinstance(timestamp, bool)):
+      return edge
+
+  link = dict(
+      (key, value) for key, value in edge.items() if key != u'events')
+  timestamps = []
+  previous_timestamp = 0
+  for event in events:
+    timestamps.append(event[u'timestamp'] - previous_timestamp)
+    previous_timestamp = event[u'timestamp']
+  link[u'event_ids'] = [event[u'id'] for event in events]
+  link[u'timestamps'] = timestamps
+  if any(u'count' in event for event in events):
+    link[u'event_counts'] = [event.get(u'count', 1) for event in events]
+  return link
+
+
+def DecodeLink(link):
+  """Decodes link of schema version 2 to edge.
+
+  Args:
+    link (dict): link created by EncodeLink.
+
+  Returns:
+    dict: graph edge with events. Events with count 1 have no count.
+  """
+  if u'event_ids' not in link:
+    return link
+
+  edge = dict(
+      (key, value) for key, value in link.items()
+      if key not in (u'event_ids', u'timestamps', u'event_counts'))
+  counts = link.get(u'event_counts')
+  events = []
+  timestamp = 0
+  for index, event_id in enumerate(link[u'event_ids']):
+    timestamp += link[u'timestamps'][index]
+    event = {u'id': event_id, u'timestamp': timestamp}
+    if counts and counts[index] != 1:
+      event[u'count'] = counts[index]
+    events.append(event)
+  edge[u'events'] = events
+  return edge
+
+
 def LoadGraph(json_data):
-  """Restores graph from minimal serialization.
+  """Restores graph from serialization.
 
   Args:
-    json_data (dict): dict serialization of graph (by MinimalSerialize
-        method).
+    json_data (dict): dict serialization of graph (by MinimalSerialize or
+        Serialize method) of schema version 1 or 2.
 
   Returns:
     Graph: restored graph.
+
+  Raises:
+    ValueError: if the schema version is not supported.
   """
+  version = json_data.get(u'version', SCHEMA_V1)
+  if version not in (SCHEMA_V1, SCHEMA_V2):
+    raise ValueError(u'Unsupported schema version: {0!s}'.format(version))
+
   graph = Graph()
   graph.nodes = json_data.get(u'nodes', [])
   graph.edges = json_data.get(u'links', [])
+  if version == SCHEMA_V2:
+    graph.edges = [DecodeLink(link) for link in graph.edges]
 
   for edge_id, edge in enumerate(graph.edges):
     edge_tuple = (
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""Memory bounded cache of loaded graphs.
+
+The web server loads a graph from the database and decodes it for every
+request that needs more than a stored payload (e.g. expanding clusters).
+GraphCache keeps recently used Graph objects with their indexes in memory.
+Sizes of graphs are estimated from a sample of nodes and edges, and least
+recently used graphs are evicted when the total estimated size exceeds the
+limit.
+"""
+
+import collections
+import sys
+import threading
+
+
+def GetObjectSize(obj, samples=100):
+  """Estimates size of object with objects it contains.
+
+  Only containers used in graphs (dict, list, tuple, set) are traversed.
+  Sizes of lists and tuples longer than samples are extrapolated from evenly
+  spaced items. Objects shared by several containers are counted for each of
+  them.
+
+  Args:
+    obj (object): object.
+    samples (int): maximum number of measured items of a list or tuple.
+
+  Returns:
+    int: size in bytes.
+  """
+  size = sys.getsizeof(obj)
+  if isinstance(obj, dict):
+    for key, value in obj.items():
+      size += GetObjectSize(key, samples) + GetObjectSize(value, samples)
+  elif isinstance(obj, (list, tuple)):
+    size += _GetSampledSize(obj, samples)
+  elif isinstance(obj, (set, frozenset)):
+    for item in obj:
+      size += GetObjectSize(item, samples)
+  return size
+
+
+def _GetSampledSize(items, samples):
+  """Estimates size of items from evenly spaced samples.
+
+  Args:
+    items (list|tuple): items.
+    samples (int): maximum number of measured items.
+
+  Returns:
+    int: estimated size of items in bytes, without the list itself.
+  """
+  if not items:
+    return 0
+  step = max(1, len(items) // samples)
+  sampled = items[::step]
+  sampled_size = sum(GetObjectSize(item, samples) for item in sampled)
+  return sampled_size * len(items) // len(sampled)
+
+
+def EstimateGraphSize(graph, samples=100):
+  """Estimates memory used by graph.
+
+  Args:
+    graph (graph_lib.Graph): graph with events in memory.
+    samples (int): maximum number of measured nodes, edges and events of an
+        edge.
+
+  Returns:
+    int: approximate size in bytes of nodes, edges with events and indexes.
+  """
+  size = GetObjectSize(graph.nodes, samples)
+  size += GetObjectSize(graph.edges, samples)
+  for index in (graph.nodes_ids, graph.edges_ids):
+    size += sys.getsizeof(index)
+    size += _GetSampledSize(list(index.keys()), samples)
+  return size
+
+
+class GraphCache(object):
+  """Thread safe LRU cache of graphs with bounded total size.
+
+  Attributes:
+    evictions (int): number of evicted graphs.
+    hits (int): number of lookups that found a graph.
+    max_size (int): maximum total estimated size of cached graphs in bytes.
+    misses (int): number of lookups that did not find a graph.
+    size (int): total estimated size of cached graphs in bytes.
+  """
+
+  def __init__(self, max_size):
+    """Initializes empty GraphCache.
+
+    Args:
+      max_size (int): maximum total estimated size of cached graphs in bytes.
+          Graphs larger than this are not cached.
+    """
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+    self.evictions = 0
+    self.hits = 0
+    self.max_size = max_size
+    self.misses = 0
+    self.size = 0
+
+  def Get(self, key):
+    """Gets graph and marks it as the most recently used.
+
+    Args:
+      key (object): hashable key, e.g. graph id and revision.
+
+    Returns:
+      graph_lib.Graph|None: graph or None if it is not cached.
+    """
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is None:
+        self.misses += 1
+        return None
+      self._entries[key] = entry
+      self.hits += 1
+      return entry[0]
+
+  def Put(self, key, graph, size=None):
+    """Adds graph, least recently used graphs are evicted to make space.
+
+    Args:
+      key (object): hashable key.
+      graph (graph_lib.Graph): graph. It should not be modified while cached.
+      size (None|int): size of graph in bytes, estimated if not specified.
+
+    Returns:
+      bool: whether the graph was cached.
+    """
+    if size is None:
+      size = EstimateGraphSize(graph)
+    with self._lock:
+      entry = self._entries.pop(key, None)
+      if entry is not None:
+        self.size -= entry[1]
+      if size > self.max_size:
+        return False
+
+      while self._entries and self.size + size > self.max_size:
+        _, (_, evicted_size) = self._entries.popitem(last=False)
+        self.size -= evicted_size
+        self.evictions += 1
+      self._entries[key] = (graph, size)
+      self.size += size
+      return True
+
+  def GetOrLoad(self, key, loader):
+    """Gets graph or loads and caches it.
+
+    Loading is not locked, so concurrent requests for the same missing graph
+    may load it more than once.
+
+    Args:
+      key (object): hashable key.
+      loader (callable): returns graph for key.
+
+    Returns:
+      graph_lib.Graph: graph.
+    """
+    graph = self.Get(key)
+    if graph is None:
+      graph = loader()
+      self.Put(key, graph)
+    return graph
+
+  def GetStatistics(self):
+    """Returns counters of the cache.
+
+    Returns:
+      dict[str, int]: entries, size, max_size, hits, misses and evictions.
+    """
+    with self._lock:
+      return {
+          u'entries': len(self._entries),
+          u'evictions': self.evictions,
+          u'hits': self.hits,
+          u'max_size': self.max_size,
+          u'misses': self.misses,
+          u'size': self.size}
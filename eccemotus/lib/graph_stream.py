@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+"""Streaming processing of serialized graphs.
+
+Serialized graphs are dominated by edges and their events. GraphStreamReader
+decodes nodes and links one by one, so a graph can be summarized without
+holding the whole document (or the Graph object) in memory. WriteGraph
+encodes links one by one, so events of graphs with an event store are read
+from disk edge by edge.
+"""
+
+import codecs
+import json
+import re
+
+from eccemotus.lib import graph as graph_lib
+from eccemotus.lib import json_codec
+
+
+class GraphStreamReader(object):
+  """Incremental reader of JSON serialized graph.
+
+  Reads output of Graph.MinimalSerialize, optionally wrapped in javascript
+  (var graph=...;) as written by f2g and e2g with --javascript.
+
+  Attributes:
+    attributes (dict[str, object]): top level members that are not arrays.
+        Available after the whole document was iterated.
+  """
+
+  JAVASCRIPT_PREFIX = u'var graph='
+
+  _STRING_REGEXP = re.compile(r'\\.|"', re.DOTALL)
+  _STRUCTURE_REGEXP = re.compile(r'["\[\]{}]')
+  _WHITESPACE_REGEXP = re.compile(r'\s*')
+
+  def __init__(self, input_file, chunk_size=1024 * 1024):
+    """Initializes GraphStreamReader.
+
+    Args:
+      input_file (file): file opened in binary mode.
+      chunk_size (int): number of bytes read at once.
+    """
+    self.attributes = {}
+    self._buffer = u''
+    self._chunk_size = chunk_size
+    self._end_of_file = False
+    self._input_file = input_file
+    self._json_decoder = json.JSONDecoder()
+    self._position = 0
+    self._text_decoder = codecs.getincrementaldecoder(u'utf-8')()
+
+  def _ReadText(self):
+    """Reads and decodes next chunk of the file.
+
+    Returns:
+      str: decoded text, possibly empty if the chunk ends inside a character.
+    """
+    if self._end_of_file:
+      return u''
+
+    data = self._input_file.read(self._chunk_size)
+    if not data:
+      self._end_of_file = True
+    return self._text_decoder.decode(data, final=self._end_of_file)
+
+  def _ReadChunk(self):
+    """Appends next chunk of the file to the unprocessed part of buffer.
+
+    Returns:
+      bool: False if there is nothing more to read.
+    """
+    if self._end_of_file:
+      return False
+
+    text = self._ReadText()
+    self._buffer = self._buffer[self._position:] + text
+    self._position = 0
+    return not self._end_of_file
+
+  def _ReadValue(self):
+    """Reads chunks until the string, array or object at position ends.
+
+    New text is scanned once for the closing delimiter, skipping brackets in
+    strings and escaped quotes, and appended to buffer at once. Values larger
+    than a chunk are therefore read in linear time.
+    """
+    depth = 0
+    in_string = False
+    escaped = False
+    text = self._buffer
+    index = self._position
+    texts = []
+    while True:
+      if escaped and text:
+        index += 1
+        escaped = False
+
+      while True:
+        if in_string:
+          match = self._STRING_REGEXP.search(text, index)
+          if not match:
+            escaped = index < len(text) and text[-1] == u'\\'
+            break
+          index = match.end()
+          if match.group() == u'"':
+            in_string = False
+            if not depth:
+              break
+        else:
+          match = self._STRUCTURE_REGEXP.search(text, index)
+          if not match:
+            break
+          index = match.end()
+          character = match.group()
+          if character == u'"':
+            in_string = True
+          elif character in u'[{':
+            depth += 1
+          else:
+            depth -= 1
+            if not depth:
+              break
+
+      if match or self._end_of_file:
+        break
+      text = self._ReadText()
+      texts.append(text)
+      index = 0
+
+    if texts:
+      self._buffer = self._buffer[self._position:] + u''.join(texts)
+      self._position = 0
+
+  def _Peek(self):
+    """Skips whitespace and returns next character.
+
+    Returns:
+      str: next character.
+
+    Raises:
+      ValueError: if the document ends.
+    """
+    while True:
+      match = self._WHITESPACE_REGEXP.match(self._buffer, self._position)
+      self._position = match.end()
+      if self._position < len(self._buffer):
+        return self._buffer[self._position]
+      if not self._ReadChunk():
+        raise ValueError(u'Unexpected end of graph file.')
+
+  def _Expect(self, characters):
+    """Consumes next character.
+
+    Args:
+      characters (str): allowed characters.
+
+    Returns:
+      str: consumed character.
+
+    Raises:
+      ValueError: if the next character is not one of characters.
+    """
+    character = self._Peek()
+    if character not in characters:
+      raise ValueError(u'Expected one of {0:s} at {1:s}'.format(
+          characters, self._buffer[self._position:self._position + 20]))
+    self._position += 1
+    return character
+
+  def _DecodeValue(self):
+    """Decodes next JSON value.
+
+    A string, array or object that is not complete in buffer is decoded again
+    only after _ReadValue found its end.
+
+    Returns:
+      object: decoded value.
+
+    Raises:
+      ValueError: if the value is not valid JSON.
+    """
+    self._Peek()
+    value_read = False
+    while True:
+      try:
+        value, end = self._json_decoder.raw_decode(
+            self._buffer, self._position)
+        # Value at the end of buffer (e.g. a number) may continue in the next
+        # chunk.
+        if end < len(self._buffer) or self._end_of_file:
+          self._position = end
+          return value
+      except ValueError:
+        # Complete value that does not decode is invalid.
+        if self._end_of_file or value_read:
+          raise
+        if self._buffer[self._position] in u'"[{':
+          self._ReadValue()
+          value_read = True
+          continue
+      self._ReadChunk()
+
+  def _SkipJavascriptPrefix(self):
+    """Skips javascript variable assignment before the graph object."""
+    if self._Peek() == u'{':
+      return
+
+    prefix_length = len(self.JAVASCRIPT_PREFIX)
+    while (len(self._buffer) - self._position < prefix_length and
+           self._ReadChunk()):
+      pass
+    prefix_end = self._position + prefix_length
+    if self._buffer[self._position:prefix_end] != self.JAVASCRIPT_PREFIX:
+      raise ValueError(u'Not a serialized graph.')
+    self._position = prefix_end
+
+  def Iterate(self):
+    """Iterates over items of top level arrays (nodes and links).
+
+    Yields:
+      tuple[str, object]: name of the array and decoded item.
+
+    Raises:
+      ValueError: if the document is not a serialized graph.
+    """
+    self._SkipJavascriptPrefix()
+    self._Expect(u'{')
+    if self._Peek() == u'}':
+      return
+
+    while True:
+      name = self._DecodeValue()
+      self._Expect(u':')
+      if self._Peek() == u'[':
+        self._position += 1
+        if self._Peek() == u']':
+          self._position += 1
+        else:
+          while True:
+            yield name, self._DecodeValue()
+            if self._Expect(u',]') == u']':
+              break
+      else:
+        self.attributes[name] = self._DecodeValue()
+
+      if self._Expect(u',}') == u'}':
+        return
+
+
+class DisjointSet(object):
+  """Disjoint-set forest of non-negative integers."""
+
+  def __init__(self):
+    """Initializes DisjointSet with no elements."""
+    self._parents = []
+    self._sizes = []
+
+  def _Grow(self, element):
+    """Adds singleton sets up to element.
+
+    Args:
+      element (int): the largest required element.
+    """
+    while len(self._parents) <= element:
+      self._parents.append(len(self._parents))
+      self._sizes.append(1)
+
+  def Find(self, element):
+    """Finds representative of element's set.
+
+    Args:
+      element (int): element.
+
+    Returns:
+      int: representative element.
+    """
+    if element >= len(self._parents):
+      return element
+    parents = self._parents
+    while parents[element] != element:
+      # Path halving.
+      parents[element] = parents[parents[element]]
+      element = parents[element]
+    return element
+
+  def Union(self, first, second):
+    """Joins sets of two elements.
+
+    Args:
+      first (int): element.
+      second (int): element.
+    """
+    self._Grow(max(first, second))
+    first = self.Find(first)
+    second = self.Find(second)
+    if first == second:
+      return
+    if self._sizes[first] < self._sizes[second]:
+      first, second = second, first
+    self._parents[second] = first
+    self._sizes[first] += self._sizes[second]
+
+
+def GetSummary(input_file):
+  """Aggregates node values by clusters and types of a serialized graph.
+
+  Gives the same result as Graph.Summary after Graph.Finalize. Clusters are
+  joined by a disjoint set over has/is links, so links are never stored.
+  Only types and values of nodes are kept.
+
+  Args:
+    input_file (file): file with serialized graph opened in binary mode.
+
+  Returns:
+    dict[int, dict[str, list[str]]]: aggregation by cluster id and node type.
+
+  Raises:
+    ValueError: if the file is not a serialized graph.
+  """
+  clusters = DisjointSet()
+  node_types = []
+  node_values = []
+  type_names = {}
+  cluster_edge_types = (graph_lib.Graph.EDGE_HAS, graph_lib.Graph.EDGE_IS)
+
+  for name, item in GraphStreamReader(input_file).Iterate():
+    if name == u'nodes':
+      node_type = item.get(u'type')
+      node_types.append(type_names.setdefault(node_type, node_type))
+      node_values.append(item.get(u'value'))
+    elif name == u'links' and item.get(u'type') in cluster_edge_types:
+      clusters.Union(item[u'source'], item[u'target'])
+
+  # Cluster center is the node with the smallest (priority, id), as in
+  # Graph.Finalize.
+  centers = {}
+  for node_id, node_type in enumerate(node_types):
+    root = clusters.Find(node_id)
+    key = (graph_lib.Graph.GetClusterPriority(node_type), node_id)
+    if root not in centers or key < centers[root]:
+      centers[root] = key
+
+  aggregation = {}
+  for node_id, node_type in enumerate(node_types):
+    cluster_id = centers[clusters.Find(node_id)][1]
+    aggregation.setdefault(cluster_id, {})
+    aggregation[cluster_id].setdefault(node_type, [])
+    aggregation[cluster_id][node_type].append(node_values[node_id])
+
+  return aggregation
+
+
+def WriteGraph(graph, output_file, version=graph_lib.SCHEMA_V1):
+  """Writes graph serialized as by Graph.Serialize.
+
+  The output is the same as json_codec.Dump of Serialize, but only one link
+  is in memory at a time, which matters if the graph uses the event store.
+  Separators and order of top level members are taken from the used JSON
+  encoder.
+
+  Args:
+    graph (graph_lib.Graph): graph.
+    output_file (file): file opened in binary mode.
+    version (int): schema version, graph_lib.SCHEMA_V1 or SCHEMA_V2.
+
+  Raises:
+    ValueError: if the version is not supported.
+  """
+  links = graph.IterateEdges()
+  if version == graph_lib.SCHEMA_V1:
+    skeleton = {u'nodes': [], u'links': []}
+  elif version == graph_lib.SCHEMA_V2:
+    skeleton = {u'version': version, u'nodes': [], u'links': []}
+    links = (graph_lib.EncodeLink(edge) for edge in links)
+  else:
+    raise ValueError(u'Unsupported schema version: {0!s}'.format(version))
+
+  empty_lists = json_codec.DumpBytes(skeleton)
+  separator = json_codec.DumpBytes([0, 0])[2:-2]
+  items = {u'nodes': graph.nodes, u'links': links}
+  # Names of members are found in the encoded skeleton, every "[]" is
+  # replaced by the encoded items.
+  position = 0
+  while True:
+    list_position = empty_lists.find(b'[]', position)
+    if list_position == -1:
+      break
+    output_file.write(empty_lists[position:list_position + 1])
+    name_position = empty_lists.rfind(b'"links"', position, list_position)
+    name = u'links' if name_position != -1 else u'nodes'
+    for index, item in enumerate(items[name]):
+      if index:
+        output_file.write(separator)
+      json_codec.Dump(item, output_file)
+    position = list_position + 1
+  output_file.write(empty_lists[position:])
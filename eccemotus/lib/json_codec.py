@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""JSON encoding and decoding with the fastest available backend.
+
+Backends are probed at import time. Decoders are preferred in order orjson,
+simdjson, ujson and encoders in order orjson, ujson. The standard json module
+is used when none of them is installed. Backends can be changed with
+SetDecoder and SetEncoder.
+
+Decoding accepts bytes directly, so lines read from a file in binary mode do
+not need a separate decode step.
+"""
+
+import json
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+try:
+  import simdjson
+except ImportError:
+  simdjson = None
+
+try:
+  import ujson
+except ImportError:
+  ujson = None
+
+
+def _StdlibLoads(data):
+  """Decodes JSON with the standard json module.
+
+  Args:
+    data (bytes|str): JSON document.
+
+  Returns:
+    object: decoded document.
+  """
+  if isinstance(data, bytearray):
+    data = bytes(data)
+  return json.loads(data)
+
+
+def _StdlibDumps(obj):
+  """Encodes JSON with the standard json module.
+
+  Args:
+    obj (object): object to encode.
+
+  Returns:
+    bytes: utf-8 encoded JSON document.
+  """
+  return json.dumps(obj).encode(u'utf-8')
+
+
+def _UjsonDumps(obj):
+  """Encodes JSON with ujson.
+
+  Args:
+    obj (object): object to encode.
+
+  Returns:
+    bytes: utf-8 encoded JSON document.
+  """
+  return ujson.dumps(obj).encode(u'utf-8')
+
+
+# Maps backend names to their decoding and encoding functions. Functions
+# accept bytes or text and return bytes.
+_DECODERS = {u'json': _StdlibLoads}
+_ENCODERS = {u'json': _StdlibDumps}
+
+if orjson is not None:
+  _DECODERS[u'orjson'] = orjson.loads
+  _ENCODERS[u'orjson'] = orjson.dumps
+
+if simdjson is not None:
+  _DECODERS[u'simdjson'] = simdjson.loads
+
+if ujson is not None:
+  _DECODERS[u'ujson'] = ujson.loads
+  _ENCODERS[u'ujson'] = _UjsonDumps
+
+_DECODER_PRIORITY = (u'orjson', u'simdjson', u'ujson', u'json')
+_ENCODER_PRIORITY = (u'orjson', u'ujson', u'json')
+
+_decoder_name = [
+    name for name in _DECODER_PRIORITY if name in _DECODERS][0]
+_encoder_name = [
+    name for name in _ENCODER_PRIORITY if name in _ENCODERS][0]
+_loads = _DECODERS[_decoder_name]
+_dumps = _ENCODERS[_encoder_name]
+
+
+def GetAvailableBackends():
+  """Returns names of installed backends.
+
+  Returns:
+    tuple[list[str], list[str]]: names of decoders and encoders.
+  """
+  return (
+      [name for name in _DECODER_PRIORITY if name in _DECODERS],
+      [name for name in _ENCODER_PRIORITY if name in _ENCODERS])
+
+
+def GetDecoderName():
+  """Returns name of the used decoder."""
+  return _decoder_name
+
+
+def GetEncoderName():
+  """Returns name of the used encoder."""
+  return _encoder_name
+
+
+def SetDecoder(name):
+  """Sets backend used for decoding.
+
+  Args:
+    name (str): backend name (json, orjson, simdjson or ujson).
+
+  Raises:
+    ValueError: if the backend is not installed.
+  """
+  global _decoder_name, _loads  # pylint: disable=global-statement
+  if name not in _DECODERS:
+    raise ValueError(u'JSON decoder {0:s} is not available.'.format(name))
+  _decoder_name = name
+  _loads = _DECODERS[name]
+
+
+def SetEncoder(name):
+  """Sets backend used for encoding.
+
+  Args:
+    name (str): backend name (json, orjson or ujson).
+
+  Raises:
+    ValueError: if the backend is not installed.
+  """
+  global _encoder_name, _dumps  # pylint: disable=global-statement
+  if name not in _ENCODERS:
+    raise ValueError(u'JSON encoder {0:s} is not available.'.format(name))
+  _encoder_name = name
+  _dumps = _ENCODERS[name]
+
+
+def Loads(data):
+  """Decodes JSON document.
+
+  Args:
+    data (bytes|str): JSON document, bytes are expected to be utf-8 encoded.
+
+  Returns:
+    object: decoded document.
+
+  Raises:
+    ValueError: if the document is not valid JSON.
+  """
+  return _loads(data)
+
+
+def DumpBytes(obj):
+  """Encodes object as JSON.
+
+  Args:
+    obj (object): object to encode.
+
+  Returns:
+    bytes: utf-8 encoded JSON document.
+  """
+  return _dumps(obj)
+
+
+def Dumps(obj):
+  """Encodes object as JSON.
+
+  Args:
+    obj (object): object to encode.
+
+  Returns:
+    str: JSON document.
+  """
+  return _dumps(obj).decode(u'utf-8')
+
+
+def Dump(obj, output_file):
+  """Encodes object as JSON and writes it to file.
+
+  Args:
+    obj (object): object to encode.
+    output_file (file): file opened in binary mode.
+  """
+  output_file.write(_dumps(obj))
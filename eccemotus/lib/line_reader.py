@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""Memory mapped reading of json_line files.
+
+Plaso exports are dominated by events that no parser is interested in.
+MappedLineReader finds lines containing one of given literals (e.g. quoted
+data_types) by searching the mapped file, so other lines are never split,
+copied or decoded. Offsets of returned lines can be used for progress
+reporting and for resuming reading.
+
+psort writes events ordered by timestamp. For such files SeekTimeRange
+narrows reading to a time window by binary search over byte offsets.
+
+Inputs that can not be mapped (pipes, FIFOs, /dev/stdin and empty files) are
+read line by line through the file buffer instead, without seeking.
+"""
+
+import mmap
+import os
+import re
+import stat
+
+
+# Top level timestamp of plaso event in microseconds, as written by json and
+# orjson encoders.
+_TIMESTAMP_REGEXP = re.compile(br'"timestamp": ?(-?[0-9]+)[,}\s]')
+
+
+def GetRawTimestamp(line):
+  """Gets timestamp of serialized event without decoding it.
+
+  Args:
+    line (bytes): JSON serialized plaso event.
+
+  Returns:
+    int|None: timestamp or None if the line has no integer timestamp or has
+        more than one timestamp key (e.g. nested in another attribute).
+  """
+  match = _TIMESTAMP_REGEXP.search(line)
+  if not match or line.find(b'"timestamp"', match.end()) != -1:
+    return None
+  return int(match.group(1))
+
+
+class MappedLineReader(object):
+  """Reads lines of a memory mapped file.
+
+  Attributes:
+    end_offset (int|None): byte offset where reading stops, None if the input
+        can not be mapped and no end offset was specified.
+    offset (int): byte offset after the last returned line. Reading from this
+        offset continues with the next line.
+    size (int|None): size of the file in bytes, None if the input is not a
+        regular file.
+  """
+
+  # Number of lines searched for a timestamp when peeking at an offset.
+  _PEEK_LINES = 1000
+
+  # Number of offsets checked to decide whether the file is sorted.
+  _SORTED_SAMPLES = 32
+
+  # Peeked timestamp at the end of file.
+  _END = float(u'inf')
+
+  def __init__(
+      self, input_file, literals=None, start_offset=0, end_offset=None):
+    """Initializes MappedLineReader.
+
+    Args:
+      input_file (file): file opened in binary mode, usually a regular file.
+          Other inputs (e.g. pipes) are read from their current position.
+      literals (None|iterable[bytes]): if specified, only lines containing at
+          least one of the literals are returned.
+      start_offset (int): byte offset of the first line to read, usually
+          offset from a previous reading.
+      end_offset (None|int): byte offset of line start where reading stops.
+          None means the end of file.
+    """
+    self._input_file = input_file
+    self._literals = list(set(literals)) if literals is not None else None
+    self.offset = start_offset
+    status = os.fstat(input_file.fileno())
+    self.size = None
+    if stat.S_ISREG(status.st_mode):
+      self.size = status.st_size
+    # Empty regular files can not be mapped, but some (e.g. in /proc) are
+    # not empty when read.
+    self._mappable = bool(self.size)
+    if self._mappable:
+      if end_offset is None:
+        end_offset = self.size
+      end_offset = min(end_offset, self.size)
+    self.end_offset = end_offset
+
+  def _Map(self):
+    """Maps the file into memory.
+
+    Returns:
+      mmap.mmap|None: read only mapping of the whole file or None if the file
+          can not be mapped.
+    """
+    if not self._mappable:
+      return None
+    try:
+      return mmap.mmap(
+          self._input_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (EnvironmentError, ValueError):
+      self._mappable = False
+      return None
+
+  def _GetLineStart(self, mapped, position):
+    """Finds start of the first line at or after position.
+
+    Args:
+      mapped (mmap.mmap): mapped file.
+      position (int): byte offset.
+
+    Returns:
+      int: byte offset of line start or size of the file.
+    """
+    if position == 0:
+      return 0
+    end = mapped.find(b'\n', position - 1)
+    if end == -1:
+      return self.size
+    return end + 1
+
+  def _PeekTimestamp(self, mapped, position):
+    """Gets timestamp of the first line with timestamp at or after position.
+
+    Args:
+      mapped (mmap.mmap): mapped file.
+      position (int): byte offset.
+
+    Returns:
+      int|float|None: timestamp, _END if there is no timestamp until the end
+          of file or None if there is no timestamp in _PEEK_LINES lines.
+    """
+    start = self._GetLineStart(mapped, position)
+    for _ in range(self._PEEK_LINES):
+      if start >= self.size:
+        return self._END
+      end = mapped.find(b'\n', start)
+      if end == -1:
+        end = self.size
+      timestamp = GetRawTimestamp(mapped[start:end])
+      if timestamp is not None:
+        return timestamp
+      start = end + 1
+    return None
+
+  def _IsSorted(self, mapped):
+    """Checks whether timestamps at sampled offsets are non-decreasing.
+
+    Args:
+      mapped (mmap.mmap): mapped file.
+
+    Returns:
+      bool: True if the file looks sorted by timestamp and has timestamps.
+    """
+    last_timestamp = None
+    for index in range(self._SORTED_SAMPLES):
+      timestamp = self._PeekTimestamp(
+          mapped, self.size * index // self._SORTED_SAMPLES)
+      if timestamp is None or (index == 0 and timestamp == self._END):
+        return False
+      if last_timestamp is not None and timestamp < last_timestamp:
+        return False
+      last_timestamp = timestamp
+    return True
+
+  def _FindTimestamp(self, mapped, timestamp):
+    """Finds the first line with timestamp at least timestamp.
+
+    Args:
+      mapped (mmap.mmap): mapped file sorted by timestamp.
+      timestamp (int): searched timestamp.
+
+    Returns:
+      int|None: byte offset of line start, size of the file if all lines
+          are older or None if some offset has no timestamp nearby.
+    """
+    low = 0
+    high = self.size
+    while low < high:
+      middle = (low + high) // 2
+      peeked_timestamp = self._PeekTimestamp(mapped, middle)
+      if peeked_timestamp is None:
+        return None
+      if peeked_timestamp >= timestamp:
+        high = middle
+      else:
+        low = middle + 1
+    return self._GetLineStart(mapped, low)
+
+  def SeekTimeRange(self, since=None, until=None):
+    """Narrows reading to lines in time range if the file is sorted.
+
+    Sortedness is only checked on sampled offsets. Lines in the time range
+    that are out of order (outside of the narrowed offsets) are not read, so
+    this must only be used on files that are fully sorted, e.g. psort output.
+    Lines that are read may still be outside of the time range and should be
+    filtered by their timestamps.
+
+    Args:
+      since (None|int): the smallest timestamp, None for no limit.
+      until (None|int): the largest timestamp, None for no limit.
+
+    Returns:
+      bool: True if the file looks sorted and offsets were narrowed, False if
+          it does not or if it can not be mapped.
+    """
+    mapped = self._Map()
+    if mapped is None:
+      return False
+
+    try:
+      if not self._IsSorted(mapped):
+        return False
+
+      start_offset = 0
+      end_offset = self.size
+      if since is not None:
+        start_offset = self._FindTimestamp(mapped, since)
+      if until is not None:
+        end_offset = self._FindTimestamp(mapped, until + 1)
+      if start_offset is None or end_offset is None:
+        return False
+    finally:
+      mapped.close()
+
+    self.offset = max(self.offset, start_offset)
+    self.end_offset = min(self.end_offset, end_offset)
+    return True
+
+  def _IterateAll(self, mapped):
+    """Iterates over all non-empty lines.
+
+    Args:
+      mapped (mmap.mmap): mapped file.
+
+    Yields:
+      tuple[int, bytes]: byte offset and content of line without newline.
+    """
+    find = mapped.find
+    limit = self.end_offset
+    position = self.offset
+    while position < limit:
+      end = find(b'\n', position, limit)
+      if end == -1:
+        end = limit
+      self.offset = min(end + 1, limit)
+      if end > position:
+        yield position, mapped[position:end]
+      position = end + 1
+
+  def _IterateMatching(self, mapped):
+    """Iterates over lines containing one of the literals.
+
+    The next occurrence of every literal is remembered, so each literal is
+    searched for only once per line that is returned.
+
+    Args:
+      mapped (mmap.mmap): mapped file.
+
+    Yields:
+      tuple[int, bytes]: byte offset and content of line without newline.
+    """
+    find = mapped.find
+    rfind = mapped.rfind
+    limit = self.end_offset
+    literals = self._literals
+    occurrences = [-1] * len(literals)
+    position = self.offset
+    while position < limit:
+      match = limit
+      for index, literal in enumerate(literals):
+        occurrence = occurrences[index]
+        if occurrence < position:
+          occurrence = find(literal, position, limit)
+          if occurrence == -1:
+            occurrence = limit
+          occurrences[index] = occurrence
+        if occurrence < match:
+          match = occurrence
+      if match == limit:
+        break
+
+      start = rfind(b'\n', position, match) + 1 or position
+      end = find(b'\n', match, limit)
+      if end == -1:
+        end = limit
+      self.offset = min(end + 1, limit)
+      yield start, mapped[start:end]
+      position = end + 1
+
+  def _IterateBuffered(self):
+    """Iterates over lines read through the file buffer.
+
+    Regular files are read from the start offset. Other inputs are read from
+    their current position, which is treated as offset 0, and lines before
+    the start offset are skipped.
+
+    Yields:
+      tuple[int, bytes]: byte offset and content of line without newline.
+    """
+    position = 0
+    if self.size is not None:
+      self._input_file.seek(self.offset)
+      position = self.offset
+    literals = self._literals
+    limit = self.end_offset
+    for line in self._input_file:
+      start = position
+      position += len(line)
+      if limit is not None and start >= limit:
+        break
+      if start < self.offset:
+        continue
+
+      self.offset = position
+      if line.endswith(b'\n'):
+        line = line[:-1]
+      if not line:
+        continue
+      if literals is not None and not any(
+          literal in line for literal in literals):
+        continue
+      yield start, line
+
+  def Iterate(self):
+    """Iterates over lines from the start offset to the end offset.
+
+    Yields:
+      tuple[int, bytes]: byte offset and content of line without newline.
+    """
+    if self._literals == [] or (
+        self.end_offset is not None and self.offset >= self.end_offset):
+      if self.end_offset is not None:
+        self.offset = max(self.offset, self.end_offset)
+      return
+
+    mapped = self._Map()
+    if mapped is None:
+      for line in self._IterateBuffered():
+        yield line
+      return
+
+    try:
+      if self._literals is None:
+        lines = self._IterateAll(mapped)
+      else:
+        lines = self._IterateMatching(mapped)
+      for line in lines:
+        yield line
+      self.offset = max(self.offset, self.end_offset)
+    finally:
+      mapped.close()
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""Memory bounded structures for testing set membership.
+
+Used for deduplication of events. EventIdFilter keeps an exact set of seen
+keys until it grows over a limit. After that, keys are moved to a scalable
+Bloom filter, which needs a few bits per key instead of a Python object, for
+the price of rare false positives (new key reported as already seen).
+"""
+
+import hashlib
+import math
+import struct
+
+
+class BloomFilter(object):
+  """Bloom filter with fixed capacity.
+
+  Attributes:
+    capacity (int): number of keys the filter is designed for.
+    count (int): number of added keys.
+    error_rate (float): false positive probability when the filter is full.
+  """
+
+  def __init__(self, capacity, error_rate=0.001):
+    """Initializes empty BloomFilter.
+
+    Args:
+      capacity (int): number of keys the filter is designed for.
+      error_rate (float): false positive probability when capacity keys are
+          added.
+
+    Raises:
+      ValueError: if capacity is not positive or error_rate is not in (0, 1).
+    """
+    if capacity <= 0:
+      raise ValueError(u'Capacity must be positive.')
+    if not 0 < error_rate < 1:
+      raise ValueError(u'Error rate must be between 0 and 1.')
+
+    self.capacity = capacity
+    self.count = 0
+    self.error_rate = error_rate
+    ln2 = math.log(2)
+    self._size = int(math.ceil(-capacity * math.log(error_rate) / ln2 ** 2))
+    self._hash_count = max(1, int(round(self._size * ln2 / capacity)))
+    self._bits = bytearray((self._size + 7) // 8)
+
+  def _GetPositions(self, key):
+    """Computes bit positions for key by double hashing.
+
+    Args:
+      key (bytes): key.
+
+    Returns:
+      list[int]: bit positions.
+    """
+    digest = hashlib.md5(key).digest()
+    first_hash, second_hash = struct.unpack('<QQ', digest)
+    return [
+        (first_hash + i * second_hash) % self._size
+        for i in range(self._hash_count)]
+
+  def Add(self, key):
+    """Adds key to the filter.
+
+    Args:
+      key (bytes): key.
+
+    Returns:
+      bool: whether the key was (probably) not in the filter before.
+    """
+    is_new = False
+    for position in self._GetPositions(key):
+      byte_index, bit = divmod(position, 8)
+      mask = 1 << bit
+      if not self._bits[byte_index] & mask:
+        is_new = True
+        self._bits[byte_index] |= mask
+
+    if is_new:
+      self.count += 1
+    return is_new
+
+  def Contains(self, key):
+    """Tests whether key is (probably) in the filter.
+
+    Args:
+      key (bytes): key.
+
+    Returns:
+      bool: False if the key is surely not in the filter.
+    """
+    for position in self._GetPositions(key):
+      byte_index, bit = divmod(position, 8)
+      if not self._bits[byte_index] & (1 << bit):
+        return False
+    return True
+
+  def IsFull(self):
+    """Checks whether the filter reached its capacity.
+
+    Returns:
+      bool: whether the filter is full.
+    """
+    return self.count >= self.capacity
+
+  def GetSize(self):
+    """Returns size of the bit array in bytes."""
+    return len(self._bits)
+
+
+class ScalableBloomFilter(object):
+  """Bloom filter that grows with number of keys.
+
+  When the current filter is full, a new twice as large filter with half
+  the error rate is added, so the total false positive rate stays below
+  error_rate regardless of number of keys.
+  """
+
+  def __init__(self, initial_capacity=1000000, error_rate=0.001):
+    """Initializes empty ScalableBloomFilter.
+
+    Args:
+      initial_capacity (int): capacity of the first filter.
+      error_rate (float): upper bound of false positive probability.
+    """
+    self._next_capacity = initial_capacity
+    # Errors of filters form geometric series error_rate/2 + error_rate/4 ...
+    self._next_error_rate = error_rate / 2.0
+    self._filters = []
+    self._AddFilter()
+
+  def _AddFilter(self):
+    """Adds a new filter for newly added keys."""
+    self._filters.append(
+        BloomFilter(self._next_capacity, self._next_error_rate))
+    self._next_capacity *= 2
+    self._next_error_rate /= 2.0
+
+  def Add(self, key):
+    """Adds key to the filter.
+
+    Args:
+      key (bytes): key.
+
+    Returns:
+      bool: whether the key was (probably) not in the filter before.
+    """
+    if self.Contains(key):
+      return False
+    if self._filters[-1].IsFull():
+      self._AddFilter()
+    return self._filters[-1].Add(key)
+
+  def Contains(self, key):
+    """Tests whether key is (probably) in the filter.
+
+    Args:
+      key (bytes): key.
+
+    Returns:
+      bool: False if the key is surely not in the filter.
+    """
+    for bloom_filter in self._filters:
+      if bloom_filter.Contains(key):
+        return True
+    return False
+
+  def GetSize(self):
+    """Returns size of the bit arrays in bytes."""
+    return sum(bloom_filter.GetSize() for bloom_filter in self._filters)
+
+
+class EventIdFilter(object):
+  """Reports whether an event key was already seen.
+
+  Keys are stored in an exact set until there are more than max_exact_size
+  of them. Then they are spilled to a ScalableBloomFilter and the filter
+  stays in the Bloom filter mode.
+  """
+
+  def __init__(self, max_exact_size=1000000, error_rate=0.001):
+    """Initializes EventIdFilter.
+
+    Args:
+      max_exact_size (int): maximum number of keys stored exactly.
+      error_rate (float): false positive probability in Bloom filter mode.
+    """
+    self._error_rate = error_rate
+    self._max_exact_size = max_exact_size
+    self._exact = set()
+    self._bloom_filter = None
+
+  @staticmethod
+  def _Serialize(key):
+    """Serializes key to bytes.
+
+    Args:
+      key (object): key, usually tuple of edge id and event id.
+
+    Returns:
+      bytes: utf-8 encoded representation of key.
+    """
+    if isinstance(key, tuple):
+      key = u'\x00'.join(u'{0!s}'.format(item) for item in key)
+    else:
+      key = u'{0!s}'.format(key)
+    return key.encode(u'utf-8')
+
+  def _Spill(self):
+    """Moves exactly stored keys to Bloom filter."""
+    self._bloom_filter = ScalableBloomFilter(
+        initial_capacity=2 * self._max_exact_size + 1,
+        error_rate=self._error_rate)
+    for key in self._exact:
+      self._bloom_filter.Add(self._Serialize(key))
+    self._exact = set()
+
+  def AddIfNew(self, key):
+    """Adds key to filter.
+
+    Args:
+      key (object): hashable key, usually tuple of edge id and event id.
+
+    Returns:
+      bool: True if the key was not seen before. In Bloom filter mode, a new key
+          is reported as seen with probability at most error_rate.
+    """
+    if self._bloom_filter is not None:
+      return self._bloom_filter.Add(self._Serialize(key))
+
+    if key in self._exact:
+      return False
+
+    self._exact.add(key)
+    if len(self._exact) > self._max_exact_size:
+      self._Spill()
+    return True
+
+  def IsExact(self):
+    """Checks whether the filter is still in exact mode.
+
+    Returns:
+      bool: whether no false positives are possible.
+    """
+    return self._bloom_filter is None
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""Cache of parsed events.
+
+Rebuilding a graph from the same export (e.g. when tuning graph rules)
+repeats decoding and parsing of every event. ParsedEventCache stores parsed
+EventData as compact marshal records, so later builds read them at near disk
+speed.
+
+Cache files are keyed by the input (file fingerprint or query), options that
+change the parsed set (time range, data_types), sources of parsers and event
+data (including black lists) and the marshal format. Any change creates a new
+cache file, stale files are never read.
+"""
+
+import hashlib
+import json
+import logging
+import marshal
+import os
+import sys
+import tempfile
+
+from eccemotus.lib import event_data
+
+
+# Event datum classes by their names.
+_DATUM_CLASSES = dict(
+    (datum_class.NAME, datum_class) for datum_class in (
+        event_data.Ip, event_data.MachineName, event_data.StorageFileName,
+        event_data.UserId, event_data.UserName))
+
+
+def GetFileFingerprint(filename, sample_size=1024 * 1024):
+  """Computes fingerprint of file content without reading all of it.
+
+  Args:
+    filename (str): path of the file.
+    sample_size (int): number of bytes hashed at the start and at the end.
+
+  Returns:
+    str: size, modification time and hash of the start and the end.
+  """
+  status = os.stat(filename)
+  digest = hashlib.sha1()
+  with open(filename, u'rb') as input_file:
+    digest.update(input_file.read(sample_size))
+    if status.st_size > sample_size:
+      input_file.seek(max(sample_size, status.st_size - sample_size))
+      digest.update(input_file.read(sample_size))
+  return u'{0:d}:{1:d}:{2:s}'.format(
+      status.st_size, int(status.st_mtime), digest.hexdigest())
+
+
+def GetParserVersion():
+  """Computes version of parsing code.
+
+  Returns:
+    str: hash of sources of parsers and event data.
+  """
+  directory = os.path.dirname(os.path.abspath(__file__))
+  parsers_directory = os.path.join(directory, u'parsers')
+  paths = [os.path.join(directory, u'event_data.py')]
+  paths.extend(sorted(
+      os.path.join(parsers_directory, name)
+      for name in os.listdir(parsers_directory) if name.endswith(u'.py')))
+
+  digest = hashlib.sha1()
+  for path in paths:
+    with open(path, u'rb') as source_file:
+      digest.update(source_file.read())
+  return digest.hexdigest()
+
+
+class ParsedEventCache(object):
+  """Reads and writes parsed events of one input.
+
+  Attributes:
+    path (str): path of the cache file.
+  """
+
+  # Number of records marshalled at once.
+  _BATCH_SIZE = 1000
+
+  def __init__(self, directory, key):
+    """Initializes ParsedEventCache.
+
+    Args:
+      directory (str): directory of cache files, created if missing.
+      key (object): JSON serializable description of the input and options
+          that change the parsed events.
+    """
+    digest = hashlib.sha1()
+    digest.update(json.dumps(
+        [key, GetParserVersion(), marshal.version, sys.version_info[:2]],
+        sort_keys=True).encode(u'utf-8'))
+    self._directory = directory
+    self.path = os.path.join(
+        directory, u'{0:s}.parsed'.format(digest.hexdigest()))
+
+  def Exists(self):
+    """Checks whether the cache file was completely written.
+
+    Returns:
+      bool: True if the cache can be read.
+    """
+    return os.path.isfile(self.path)
+
+  @classmethod
+  def _ToRecord(cls, data):
+    """Converts parsed event to marshal record.
+
+    Args:
+      data (event_data.EventData): parsed event.
+
+    Returns:
+      tuple: data_type, timestamp, event_id, count, failed and tuple of
+          datums (name, source, target, value).
+    """
+    return (
+        data.event_data_type, data.timestamp, data.event_id, data.count,
+        data.failed, tuple(
+            (datum.NAME, datum.source, datum.target, datum.value)
+            for datum in data.Items()))
+
+  @classmethod
+  def _FromRecord(cls, record):
+    """Converts marshal record to parsed event.
+
+    Args:
+      record (tuple): record created by _ToRecord.
+
+    Returns:
+      event_data.EventData: parsed event.
+    """
+    data_type, timestamp, event_id, count, failed, datums = record
+    data = event_data.EventData(
+        event_data_type=data_type, event_id=event_id, timestamp=timestamp,
+        count=count, failed=failed)
+    # Values were checked against black lists when they were parsed.
+    # pylint: disable=protected-access
+    index = data._index
+    for name, source, target, value in datums:
+      index[(source, target, name)] = _DATUM_CLASSES[name](
+          value=value, source=source, target=target)
+    return data
+
+  def Read(self):
+    """Reads parsed events.
+
+    Yields:
+      event_data.EventData: parsed events in order of writing.
+    """
+    logging.getLogger(__name__).info(
+        u'Reading parsed events from {0:s}'.format(self.path))
+    from_record = self._FromRecord
+    with open(self.path, u'rb') as cache_file:
+      while True:
+        try:
+          records = marshal.load(cache_file)
+        except EOFError:
+          return
+        for record in records:
+          yield from_record(record)
+
+  def Write(self, parsed_generator):
+    """Writes parsed events while passing them through.
+
+    The cache file appears only after parsed_generator is exhausted, so an
+    interrupted build does not leave an incomplete cache.
+
+    Args:
+      parsed_generator (iterable[event_data.EventData]): parsed events.
+
+    Yields:
+      event_data.EventData: the same parsed events.
+    """
+    if not os.path.isdir(self._directory):
+      os.makedirs(self._directory)
+    file_descriptor, temporary_path = tempfile.mkstemp(
+        dir=self._directory, suffix=u'.tmp')
+    try:
+      with os.fdopen(file_descriptor, u'wb') as cache_file:
+        records = []
+        for data in parsed_generator:
+          records.append(self._ToRecord(data))
+          if len(records) >= self._BATCH_SIZE:
+            marshal.dump(records, cache_file)
+            records = []
+          yield data
+        if records:
+          marshal.dump(records, cache_file)
+      os.rename(temporary_path, self.path)
+    finally:
+      if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+
+  def Iterate(self, parsed_generator):
+    """Reads parsed events from the cache or writes them to it.
+
+    Args:
+      parsed_generator (iterable[event_data.EventData]): parsed events, not
+          iterated if the cache exists.
+
+    Returns:
+      iterable[event_data.EventData]: parsed events.
+    """
+    if self.Exists():
+      return self.Read()
+    return self.Write(parsed_generator)
@@ -13,10 +13,20 @@ class BsmEventParser(parser_interface.ParserInterface):
   """Parser for bsm:event data_type."""
 
   DATA_TYPE = u'bsm:event'
+  LOGIN_EVENT_TYPE = u'OpenSSH login (32800)'
   SUCCESS_REGEXP = re.compile(r'.*BSM_TOKEN_RETURN32: Success*.')
   USER_REGEXP = re.compile(r'BSM_TOKEN_TEXT: successful login (\S+)\]')
   TOKEN_REGEXP = re.compile(r'\[BSM_TOKEN_SUBJECT32_EX: (.*?)\]')
 
+  @classmethod
+  def GetElasticFilter(cls):
+    """Returns elasticsearch filter of OpenSSH logins.
+
+    Returns:
+      dict: match_phrase clause on event_type.
+    """
+    return {u'match_phrase': {u'event_type': cls.LOGIN_EVENT_TYPE}}
+
   @classmethod
   def Parse(cls, event):
     """Parses event.message with regexps.
@@ -35,7 +45,7 @@ class BsmEventParser(parser_interface.ParserInterface):
     data.Add(storage_datum)
     event_type = event.get(u'event_type')
     message = event.get(u'message', '')
-    if not (event_type == u'OpenSSH login (32800)' and
+    if not (event_type == cls.LOGIN_EVENT_TYPE and
             cls.SUCCESS_REGEXP.match(message)):
       return event_data.EventData()
 
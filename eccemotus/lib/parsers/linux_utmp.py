@@ -10,6 +10,23 @@ from eccemotus.lib.parsers import utils
 class LinuxUtmpEventParser(parser_interface.ParserInterface):
   """Parser for linux:utmp:event data_type."""
   DATA_TYPE = u'linux:utmp:event'
+  # ip_address is a string or a serialized bytes object with the address in
+  # stream, an index maps only one of the forms.
+  AGGREGATION_FIELDS = (
+      u'hostname', u'ip_address', u'ip_address.stream', u'user',
+      u'computer_name')
+
+  @classmethod
+  def GetAggregationFields(cls):
+    """Returns fields that fully determine parsed data.
+
+    The plaso file name is not included, so it is missing in data parsed
+    from aggregated events.
+
+    Returns:
+      tuple[str]: names of event fields.
+    """
+    return cls.AGGREGATION_FIELDS
 
   @classmethod
   def Parse(cls, event):
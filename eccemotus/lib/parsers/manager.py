@@ -3,32 +3,77 @@
 
 Provides way for parsing remote access related event data from plaso logs.
 Use ParserManager.Parse(event) and it will extract interesting fields in context
-of lateral movement from plaso event.
+of lateral movement from plaso event. ParserManager.ParseBatch(events) does the
+same for a list of events.
 
 It is parser's responsibility to register to manager via RegisterParser method.
 """
 
+import hashlib
+import json
+
 from eccemotus.lib import event_data
 from eccemotus.lib.parsers import utils
 
 class ParserManager(object):
   """Manages individual parsers.
 
-  You can add a parser with RegisterParser() or parse event with Parse().
+  You can add a parser with RegisterParser() or parse event with Parse() and
+  list of events with ParseBatch().
   """
 
+  # Key of pre-aggregated events with the number of events they represent.
+  COUNT_KEY = u'__count__'
+
   # Keys are event data_types and values are parser classes.
   _parser_clases = {}
-  _parsed_events = 0
+
+  # Fields that locate an event in its source. Content hash and inode tell
+  # apart files with the same name in different images, message tells apart
+  # lines of text logs, which have no offset or record number.
+  _EVENT_LOCATION_FIELDS = (
+      u'display_name', u'filename', u'inode', u'sha256_hash', u'offset',
+      u'record_number', u'store_number', u'store_index', u'message')
+
+  _EVENT_ID_FIELDS = (
+      u'data_type', u'timestamp', u'timestamp_desc') + _EVENT_LOCATION_FIELDS
 
   @classmethod
-  def GetNextEventId(cls):
-    """Provides a way to generate unique identifiers for events.
+  def GetEventId(cls, event):
+    """Gets identifier of event.
+
+    Identifier from elasticsearch (timesketch_id) or plaso (uuid) is used if
+    event has one. Otherwise identifier is a hash of fields that locate the
+    event in its source (_EVENT_ID_FIELDS), which is much cheaper than
+    serializing the whole event. Unlike a shared counter, this is the same for
+    the same event in every process and every run, so parallel and
+    incremental builds do not produce colliding identifiers.
+
+    Events of the same type and time must differ in at least one location
+    field (_EVENT_LOCATION_FIELDS) to get different identifiers. Events
+    without any location field are identified by a hash of all their fields
+    except COUNT_KEY instead.
+
+    Args:
+      event (dict): dict serialized plaso event.
 
-    This is used in case the data does not come from elasticsearch.
+    Returns:
+      int|str: event identifier.
     """
-    cls._parsed_events += 1
-    return cls._parsed_events
+    event_id = event.get(u'timesketch_id')
+    if event_id is None:
+      event_id = event.get(u'uuid')
+    if event_id is None:
+      if any(event.get(field) is not None
+             for field in cls._EVENT_LOCATION_FIELDS):
+        location = repr(
+            tuple(event.get(field) for field in cls._EVENT_ID_FIELDS))
+      else:
+        location = json.dumps(
+            {key: value for key, value in event.items()
+             if key != cls.COUNT_KEY}, sort_keys=True)
+      event_id = hashlib.sha1(location.encode(u'utf-8')).hexdigest()[:32]
+    return event_id
 
   @classmethod
   def GetParsedTypes(cls):
@@ -38,6 +83,48 @@ class ParserManager(object):
     """
     return cls._parser_clases.keys()
 
+  @classmethod
+  def GetAggregatedTypes(cls):
+    """Returns data_types that can be parsed from aggregated fields.
+
+    Returns:
+      dict[str, tuple[str]]: fields determining parsed data by data_type, see
+          ParserInterface.GetAggregationFields.
+    """
+    aggregated_types = {}
+    for data_type, parser_cls in cls._parser_clases.items():
+      fields = parser_cls.GetAggregationFields()
+      if fields:
+        aggregated_types[data_type] = fields
+    return aggregated_types
+
+  @classmethod
+  def GetElasticFilter(cls, data_types=None):
+    """Returns elasticsearch filter of events that can be parsed.
+
+    Every parser contributes a data_type term, combined with its own
+    filter (see ParserInterface.GetElasticFilter) if it has one.
+
+    Args:
+      data_types (None|iterable[str]): if specified, only parsers of these
+          data_types contribute.
+
+    Returns:
+      dict: bool query clause matching events of any parser.
+    """
+    if data_types is None:
+      data_types = cls._parser_clases
+    should = []
+    for data_type in sorted(data_types):
+      data_type_filter = {u'term': {u'data_type': data_type}}
+      parser_filter = cls._parser_clases[data_type].GetElasticFilter()
+      if parser_filter:
+        data_type_filter = {
+            u'bool': {u'filter': [data_type_filter, parser_filter]}}
+      should.append(data_type_filter)
+
+    return {u'bool': {u'should': should, u'minimum_should_match': 1}}
+
   @classmethod
   def RegisterParser(cls, parser_cls):
     """Adds parser to a specific data_type.
@@ -49,6 +136,23 @@ class ParserManager(object):
     """
     cls._parser_clases[parser_cls.DATA_TYPE] = parser_cls
 
+  @classmethod
+  def GetDataType(cls, event):
+    """Gets normalized data_type of event.
+
+    Args:
+      event (dict): dict serialized plaso event.
+
+    Returns:
+      str|None: data_type of event or None if it is missing.
+    """
+    raw_data_type = event.get(u'data_type')
+    if isinstance(raw_data_type, basestring):
+      return raw_data_type
+    elif isinstance(raw_data_type, dict):
+      return raw_data_type.get(u'stream')
+    return None
+
   @classmethod
   def Parse(cls, event):
     """Determines which parser should be used and uses it.
@@ -64,51 +168,101 @@ class ParserManager(object):
     Returns:
         event_data.EventData: event data extracted from event.
     """
-    raw_data_type = event.get(u'data_type')
-    data_type = None
+    data_type = cls.GetDataType(event)
+    parser_cls = cls._parser_clases.get(data_type)
+    if parser_cls is None:
+      return event_data.EventData()
 
-    if isinstance(raw_data_type, basestring):
-      data_type = raw_data_type
-    elif isinstance(raw_data_type, dict):
-      data_type = raw_data_type.get(u'stream')
-
-    if data_type in cls._parser_clases:
-      parsed_data = cls._parser_clases[data_type].Parse(event)
-
-      if not parsed_data or parsed_data.IsEmpty():
-        return event_data.EventData()
-
-      parsed_data.event_data_type = data_type
-      target_datum_candidates = [
-          parsed_data.Get(event_data.MachineName(target=True)),
-          parsed_data.Get(event_data.Ip(target=True)),
-          parsed_data.Get(event_data.StorageFileName(target=True))]
-      target_id = utils.FirstValidDatum(
-          target_datum_candidates, default=u'UNKNOWN')
-
-      for inf in [event_data.UserName(target=True),
-                  event_data.UserId(target=True)]:
-        inf = parsed_data.Get(inf)
-        if inf:
-          inf.value += u'@' + target_id
-
-      source_datum_candidates = [
-          parsed_data.Get(event_data.MachineName(source=True)),
-          parsed_data.Get(event_data.Ip(source=True)),
-          parsed_data.Get(event_data.StorageFileName(source=True))]
-      source_id = utils.FirstValidDatum(
-          source_datum_candidates, default=u'UNKNOWN')
-
-      for inf in [event_data.UserName(source=True),
-                  event_data.UserId(source=True)]:
-        inf = parsed_data.Get(inf)
-        if inf:
-          inf.value += u'@' + source_id
-
-
-      parsed_data.timestamp = event.get(u'timestamp')
-      uuid = event.get(u'uuid', cls.GetNextEventId())
-      parsed_data.event_id = event.get(u'timesketch_id', uuid)
-      return parsed_data
-    else:
+    return cls._EnhanceParsedData(parser_cls.Parse(event), event, data_type)
+
+  @classmethod
+  def ParseBatch(cls, events):
+    """Parses multiple events at once.
+
+    Events are grouped by data_type and each group is handed to ParseBatch of
+    its parser, so parsers can amortize their setup over many events.
+
+    Args:
+      events (list[dict]): dict serialized plaso events.
+
+    Returns:
+      list[event_data.EventData]: event data extracted from events, in the
+          same order as events. Events that can not be parsed result in empty
+          EventData.
+    """
+    results = [None] * len(events)
+    groups = {}
+    for index, event in enumerate(events):
+      data_type = cls.GetDataType(event)
+      if data_type in cls._parser_clases:
+        groups.setdefault(data_type, []).append(index)
+      else:
+        results[index] = event_data.EventData()
+
+    for data_type, indexes in groups.items():
+      parser_cls = cls._parser_clases[data_type]
+      parsed_batch = parser_cls.ParseBatch([events[i] for i in indexes])
+      for index, parsed_data in zip(indexes, parsed_batch):
+        results[index] = cls._EnhanceParsedData(
+            parsed_data, events[index], data_type)
+
+    return results
+
+  # Reference data for the first reasonable machine identifier of target and
+  # source.
+  _TARGET_MACHINE_DATA = (
+      event_data.MachineName(target=True), event_data.Ip(target=True),
+      event_data.StorageFileName(target=True))
+  _SOURCE_MACHINE_DATA = (
+      event_data.MachineName(source=True), event_data.Ip(source=True),
+      event_data.StorageFileName(source=True))
+  # Reference data for users extended by machine identifiers.
+  _TARGET_USER_DATA = (
+      event_data.UserName(target=True), event_data.UserId(target=True))
+  _SOURCE_USER_DATA = (
+      event_data.UserName(source=True), event_data.UserId(source=True))
+
+  @classmethod
+  def _EnhanceParsedData(cls, parsed_data, event, data_type):
+    """Adds information from event to data parsed by a parser.
+
+    Users (names and ids) are extended by first reasonable machine identifier.
+    Adds data_type, timestamps and event_id.
+
+    Args:
+      parsed_data (event_data.EventData): data returned by parser.
+      event (dict): dict serialized plaso event.
+      data_type (str): data_type of event.
+
+    Returns:
+      event_data.EventData: enhanced parsed data or empty EventData if parser
+          returned nothing.
+    """
+    if not parsed_data or parsed_data.IsEmpty():
       return event_data.EventData()
+
+    parsed_data.event_data_type = data_type
+    target_datum_candidates = [
+        parsed_data.Get(datum) for datum in cls._TARGET_MACHINE_DATA]
+    target_id = utils.FirstValidDatum(
+        target_datum_candidates, default=u'UNKNOWN')
+
+    for inf in cls._TARGET_USER_DATA:
+      inf = parsed_data.Get(inf)
+      if inf:
+        inf.value += u'@' + target_id
+
+    source_datum_candidates = [
+        parsed_data.Get(datum) for datum in cls._SOURCE_MACHINE_DATA]
+    source_id = utils.FirstValidDatum(
+        source_datum_candidates, default=u'UNKNOWN')
+
+    for inf in cls._SOURCE_USER_DATA:
+      inf = parsed_data.Get(inf)
+      if inf:
+        inf.value += u'@' + source_id
+
+    parsed_data.timestamp = event.get(u'timestamp')
+    parsed_data.event_id = cls.GetEventId(event)
+    parsed_data.count = event.get(cls.COUNT_KEY, 1)
+    return parsed_data
@@ -2,7 +2,9 @@
 """Contains event parser interface class.
 
 All parsers should implement Parse method, that extracts valuable data from
-plaso event in context of lateral movement.
+plaso event in context of lateral movement. Parsers can override ParseBatch to
+amortize work over many events and GetElasticFilter to narrow elasticsearch
+queries to events they can actually parse.
 Every parser should have DATA_TYPE property which specifies events of which
 data_types will be parsed by this parser.
 """
@@ -45,3 +47,46 @@ class ParserInterface(object):
         event_data.EventData: event data extracted from event.
     """
     pass
+
+  @classmethod
+  def ParseBatch(cls, events):
+    """Parses multiple plaso events of DATA_TYPE.
+
+    The default implementation calls Parse for each event.
+
+    Args:
+      events (list[dict]): dict serialized plaso events.
+
+    Returns:
+      list[event_data.EventData]: event data extracted from events, in the same
+          order as events.
+    """
+    return [cls.Parse(event) for event in events]
+
+  @classmethod
+  def GetElasticFilter(cls):
+    """Returns elasticsearch filter of events that may be parsed.
+
+    The filter is combined with the data_type term, so it only narrows
+    events of DATA_TYPE. It must not exclude any event that Parse would
+    extract data from. The default implementation does not filter.
+
+    Returns:
+      dict|None: elasticsearch query clause or None for no filter.
+    """
+    return None
+
+  @classmethod
+  def GetAggregationFields(cls):
+    """Returns fields that fully determine parsed data.
+
+    Events of such parsers can be aggregated by these fields (e.g. by
+    elasticsearch composite aggregation) and parsed from one event per
+    aggregation bucket. The default implementation returns None, events are
+    not aggregated.
+
+    Returns:
+      tuple[str]|None: names of event fields, fields of nested objects as
+          dotted paths (e.g. ip_address.stream), or None.
+    """
+    return None
@@ -13,38 +13,92 @@ class SysLogParser(parser_interface.ParserInterface):
   """Parser for syslog:line data_type."""
   DATA_TYPE = u'syslog:line'
   MATCH_REGEXP = re.compile(
-      r'.*Accepted password for (?P<user>\S+) '
-      r'from (?P<ip>(?:[0-9]{1,3}\.){3}[0-9]{1,3}) port (?P<port>(\d+)).*')
+      r'Accepted (?:password|publickey|keyboard-interactive(?:/pam)?) '
+      r'for (?P<user>\S+) from (?P<ip>(?:[0-9]{1,3}\.){3}[0-9]{1,3}|'
+      r'[0-9a-fA-F]*:[0-9a-fA-F:.]+) port (?P<port>\d+)')
+  _MATCHER = utils.MessageMatcher(
+      u'Accepted ', MATCH_REGEXP, [u'user', u'ip'])
 
   @classmethod
-  def Parse(cls, event):
-    """Parses event.message with regexp.
+  def GetElasticFilter(cls):
+    """Returns elasticsearch filter of accepted logins.
+
+    Returns:
+      dict: match_phrase clause on message.
+    """
+    return {u'match_phrase': {u'message': u'Accepted'}}
+
+  @classmethod
+  def _CreateEventData(cls, event, fields, image_names=None):
+    """Creates event data of a matched message.
 
     Args:
       event (dict): dict serialized plaso event.
+      fields (tuple[str]): user name and IP address matched in the message.
+      image_names (None|dict[str, str]): cache of storage file names, see
+          utils.GetImageName.
 
     Returns:
       event_data.EventData: event data parsed from event.
     """
-    match = cls.MATCH_REGEXP.match(event.get(u'message', ''))
-    if not match:
-      return event_data.EventData()
+    target_user_name, source_ip = fields
 
     data = event_data.EventData()
 
-    storage_file_name = utils.GetImageName(event)
+    storage_file_name = utils.GetImageName(event, image_names)
     storage_datum = event_data.StorageFileName(
         target=True, value=storage_file_name)
     data.Add(storage_datum)
 
-    target_user_name = match.group(u'user')
     target_user_name_datum = event_data.UserName(
         target=True, value=target_user_name)
     data.Add(target_user_name_datum)
-    source_ip = match.group(u'ip')
     source_ip_datum = event_data.Ip(source=True, value=source_ip)
     data.Add(source_ip_datum)
 
     return data
 
+  @classmethod
+  def Parse(cls, event):
+    """Parses event.message with regexp.
+
+    Args:
+      event (dict): dict serialized plaso event.
+
+    Returns:
+      event_data.EventData: event data parsed from event.
+    """
+    fields = cls._MATCHER.Match(event.get(u'message', u''))
+    if not fields:
+      return event_data.EventData()
+    return cls._CreateEventData(event, fields)
+
+  @classmethod
+  def ParseBatch(cls, events):
+    """Parses event.message of multiple events with regexp.
+
+    The matcher is looked up once per batch and storage file names are
+    computed once per pathspec string.
+
+    Args:
+      events (list[dict]): dict serialized plaso events.
+
+    Returns:
+      list[event_data.EventData]: event data parsed from events, in the same
+          order as events.
+    """
+    match = cls._MATCHER.Match
+    create_event_data = cls._CreateEventData
+    image_names = {}
+    EventData = event_data.EventData  # pylint: disable=invalid-name
+
+    results = []
+    for event in events:
+      fields = match(event.get(u'message', u''))
+      if fields:
+        results.append(create_event_data(event, fields, image_names))
+      else:
+        results.append(EventData())
+    return results
+
 manager.ParserManager.RegisterParser(SysLogParser)
@@ -14,25 +14,39 @@ class SysLogSshParser(parser_interface.ParserInterface):
   DATA_TYPE = u'syslog:ssh:login'
   # Care for tricky \s whitespaces.
   MATCH_REGEXP = re.compile(
-      r'.*Successful login of user: (?P<user>\S+)\s?from '
-      r'(?P<ip>(?:[0-9]{1,3}\.){3}[0-9]{1,3}):(?P<port>(\d+)).*')
+      r'Successful login of user: (?P<user>\S+)\s?from '
+      r'(?P<ip>(?:[0-9]{1,3}\.){3}[0-9]{1,3}|[0-9a-fA-F]*:[0-9a-fA-F:.]+):'
+      r'(?P<port>\d+)')
+  _MATCHER = utils.MessageMatcher(
+      u'Successful login of user', MATCH_REGEXP, [u'user', u'ip'])
 
   @classmethod
-  def Parse(cls, event):
-    """Parses event message with regexp.
+  def GetElasticFilter(cls):
+    """Returns elasticsearch filter of successful logins.
+
+    Returns:
+      dict: match_phrase clause on message.
+    """
+    return {u'match_phrase': {u'message': u'Successful login of user'}}
+
+  @classmethod
+  def _CreateEventData(cls, event, fields, image_names=None):
+    """Creates event data of a matched message.
 
     Args:
       event (dict): dict serialized plaso event.
+      fields (tuple[str]): user name and IP address matched in the message.
+      image_names (None|dict[str, str]): cache of storage file names, see
+          utils.GetImageName.
 
     Returns:
       event_data.EventData: event data parsed from event.
     """
+    target_user_name, source_ip = fields
+
     data = event_data.EventData()
-    match = cls.MATCH_REGEXP.match(event.get(u'message', u''))
-    if not match:
-      return event_data.EventData()
 
-    storage_file_name = utils.GetImageName(event)
+    storage_file_name = utils.GetImageName(event, image_names)
     target_storage_datum = event_data.StorageFileName(
         target=True, value=storage_file_name)
     data.Add(target_storage_datum)
@@ -40,14 +54,55 @@ class SysLogSshParser(parser_interface.ParserInterface):
     target_machine_name_datum = event_data.MachineName(
         target=True, value=target_machine_name)
     data.Add(target_machine_name_datum)
-    target_user_name = match.group(u'user')
     target_user_name_datum = event_data.UserName(
         target=True, value=target_user_name)
     data.Add(target_user_name_datum)
-    source_ip = match.group(u'ip')
     source_ip_datum = event_data.Ip(source=True, value=source_ip)
     data.Add(source_ip_datum)
     # NOTE I do not care for authentication method nor pid.
     return data
 
+  @classmethod
+  def Parse(cls, event):
+    """Parses event message with regexp.
+
+    Args:
+      event (dict): dict serialized plaso event.
+
+    Returns:
+      event_data.EventData: event data parsed from event.
+    """
+    fields = cls._MATCHER.Match(event.get(u'message', u''))
+    if not fields:
+      return event_data.EventData()
+    return cls._CreateEventData(event, fields)
+
+  @classmethod
+  def ParseBatch(cls, events):
+    """Parses event message of multiple events with regexp.
+
+    The matcher is looked up once per batch and storage file names are
+    computed once per pathspec string.
+
+    Args:
+      events (list[dict]): dict serialized plaso events.
+
+    Returns:
+      list[event_data.EventData]: event data parsed from events, in the same
+          order as events.
+    """
+    match = cls._MATCHER.Match
+    create_event_data = cls._CreateEventData
+    image_names = {}
+    EventData = event_data.EventData  # pylint: disable=invalid-name
+
+    results = []
+    for event in events:
+      fields = match(event.get(u'message', u''))
+      if fields:
+        results.append(create_event_data(event, fields, image_names))
+      else:
+        results.append(EventData())
+    return results
+
 manager.ParserManager.RegisterParser(SysLogSshParser)
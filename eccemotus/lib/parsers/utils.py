@@ -1,6 +1,16 @@
 # -*- coding: utf-8 -*-
 """Contains useful functions for parsers."""
 
+import ast
+import re
+
+# List of quoted strings without escape sequences and its items.
+_SIMPLE_STRING_LIST_REGEXP = re.compile(
+    r"""\[\s*(?:u?(?:'[^'\\]*'|"[^"\\]*")\s*,\s*)*"""
+    r"""(?:u?(?:'[^'\\]*'|"[^"\\]*")\s*)?\]$""")
+_SIMPLE_STRING_REGEXP = re.compile(r"""'([^'\\]*)'|"([^"\\]*)["]""")
+
+
 def FirstValidDatum(data, default=None):
   """Gets the first valid datum or default.
 
@@ -37,7 +47,7 @@ def FirstTrue(values, default=None):
   return default
 
 
-def GetImageName(event):
+def GetImageName(event, cache=None):
   """Extracts path to plaso file that the log came from.
 
   Actual directories in actual path are in reversed order.
@@ -47,12 +57,21 @@ def GetImageName(event):
 
   Args:
     event (dict): JSON serialized plaso event.
+    cache (None|dict[str, str]): image names by pathspec strings (as returned
+        by elasticsearch), shared by calls for a batch of events, so every
+        pathspec string is evaluated once.
 
   Returns:
     str: path to plaso file in reversed order (look up at the example).
   """
   spec = event.get(u'pathspec', {})
   if isinstance(spec, basestring):
+    if cache is not None:
+      image_name = cache.get(spec)
+      if image_name is None:
+        image_name = GetImageName(event)
+        cache[spec] = image_name
+      return image_name
     # This is needed in case data come from elasticsearch. event['pathspec']
     # is naturally a nested dictionary but elastic search returns it as a
     # string.
@@ -65,3 +84,109 @@ def GetImageName(event):
   reversed_location_tokens = location_tokens[::-1]
   t_location = u'/'.join(reversed_location_tokens)
   return t_location
+
+
+def ParseStringList(text):
+  """Parses string representation of list of strings.
+
+  Elasticsearch returns lists like plaso event strings as their python
+  representation, e.g. "[u'S-1-0-0', u'-']". Common lists (of quoted strings
+  without escape sequences) are validated and split by regular expressions.
+  Anything else is parsed by ast.literal_eval, which, unlike eval, does not
+  execute code.
+
+  Args:
+    text (str): representation of list of strings.
+
+  Returns:
+    list[str]: parsed list.
+
+  Raises:
+    ValueError: if text does not represent list of strings.
+  """
+  text = text.strip()
+  if not text.startswith(u'['):
+    raise ValueError(u'Not a list: {0:s}'.format(text[:20]))
+
+  if not _SIMPLE_STRING_LIST_REGEXP.match(text):
+    return _LiteralEvalStringList(text)
+
+  return [
+      single_quoted or double_quoted
+      for single_quoted, double_quoted in _SIMPLE_STRING_REGEXP.findall(text)]
+
+
+def _LiteralEvalStringList(text):
+  """Parses representation of list of strings by ast.literal_eval.
+
+  Args:
+    text (str): representation of list of strings.
+
+  Returns:
+    list[str]: parsed list.
+
+  Raises:
+    ValueError: if text does not represent list of strings.
+  """
+  try:
+    items = ast.literal_eval(text)
+  except SyntaxError:
+    raise ValueError(u'Invalid list: {0:s}'.format(text[:20]))
+  if not isinstance(items, list) or not all(
+      isinstance(item, basestring) for item in items):
+    raise ValueError(u'Not a list of strings: {0:s}'.format(text[:20]))
+  return items
+
+
+class MessageMatcher(object):
+  """Extracts fields from messages by regular expression.
+
+  Messages without the literal are rejected by a substring test, which is
+  much cheaper than a failed regular expression search. The expression is
+  expected to start with the literal and it is searched for from the first
+  occurrence of the literal, so it does not scan the message prefix. Fields of
+  matched messages are cached, because log lines tend to repeat.
+  """
+
+  def __init__(self, literal, regexp, group_names, cache_size=10000):
+    """Initializes MessageMatcher.
+
+    Args:
+      literal (str): substring that every matching message contains.
+      regexp (re.RegexObject): expression starting with literal.
+      group_names (list[str]): names of regexp groups to be extracted.
+      cache_size (int): maximum number of cached messages.
+    """
+    self._cache = {}
+    self._cache_size = cache_size
+    self._group_names = tuple(group_names)
+    self._literal = literal
+    self._regexp = regexp
+
+  def Match(self, message):
+    """Extracts fields from message.
+
+    Args:
+      message (str): message, e.g. syslog line.
+
+    Returns:
+      tuple[str]: values of groups in order of group_names or None if the
+          message does not match.
+    """
+    if self._literal not in message:
+      return None
+
+    try:
+      return self._cache[message]
+    except KeyError:
+      pass
+
+    match = self._regexp.search(message, message.find(self._literal))
+    fields = match.group(*self._group_names) if match else None
+    if len(self._group_names) == 1 and fields is not None:
+      fields = (fields,)
+
+    if len(self._cache) >= self._cache_size:
+      self._cache.clear()
+    self._cache[message] = fields
+    return fields
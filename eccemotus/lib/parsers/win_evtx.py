@@ -7,10 +7,151 @@ from eccemotus.lib.parsers import parser_interface
 from eccemotus.lib.parsers import utils
 
 
+def _NormalizeIp(ip_address):
+  """Normalizes IP address from event strings.
+
+  Args:
+    ip_address (str): IP address, possibly IPv4-mapped IPv6 address
+        (e.g. ::ffff:10.0.0.1) or LOCAL for local sessions.
+
+  Returns:
+    str: IP address or None if the address is not a remote one.
+  """
+  if ip_address.startswith(u'::ffff:'):
+    return ip_address[7:]
+  if ip_address == u'LOCAL':
+    return None
+  return ip_address
+
+
+def _IsSuccessStatus(status):
+  """Checks whether status code from event strings reports success.
+
+  Args:
+    status (str): hexadecimal status code (e.g. 0x0 or 0xc000006a).
+
+  Returns:
+    bool: whether the status is zero.
+  """
+  try:
+    return int(status, 16) == 0
+  except ValueError:
+    return False
+
+
+# Remote desktop session events share layout of strings (user, session
+# identifier, source network address).
+_REMOTE_SESSION_PLAN = event_data.ExtractionPlan([
+    (event_data.UserName(target=True), 0),
+    (event_data.Ip(target=True), 2, _NormalizeIp)])
+
+
 class WinEvtxEventParser(parser_interface.ParserInterface):
   """Parser for windows:evtx:record data_type."""
   DATA_TYPE = u'windows:evtx:record'
 
+  # Extraction plans for event.strings by event_identifier. Plans are compiled
+  # once, so parsing does not create reference data for every event. Events
+  # with identifiers outside of this table are not decoded at all.
+  _STRINGS_PLANS = {
+      # An account was successfully logged on.
+      4624: event_data.ExtractionPlan([
+          (event_data.UserId(source=True), 0),
+          (event_data.UserName(source=True), 1),
+          (event_data.UserId(target=True), 4),
+          (event_data.UserName(target=True), 5),
+          (event_data.MachineName(target=True), 11),
+          (event_data.Ip(target=True), 18, _NormalizeIp)]),
+      # An account failed to log on. Strings are laid out as in 4624, except
+      # workstation name and IP address (13 and 19).
+      4625: event_data.ExtractionPlan([
+          (event_data.UserId(source=True), 0),
+          (event_data.UserName(source=True), 1),
+          (event_data.UserId(target=True), 4),
+          (event_data.UserName(target=True), 5),
+          (event_data.MachineName(target=True), 13),
+          (event_data.Ip(target=True), 19, _NormalizeIp)]),
+      # An account was logged off. Strings 0 and 1 are the target account,
+      # the same account as strings 4 and 5 of 4624.
+      4634: event_data.ExtractionPlan([
+          (event_data.UserId(target=True), 0),
+          (event_data.UserName(target=True), 1)]),
+      # User initiated logoff.
+      4647: event_data.ExtractionPlan([
+          (event_data.UserId(target=True), 0),
+          (event_data.UserName(target=True), 1)]),
+      # Login with certificate.
+      4648: event_data.ExtractionPlan([
+          (event_data.UserId(source=True), 0),
+          (event_data.UserName(source=True), 1),
+          (event_data.UserName(target=True), 5),
+          (event_data.MachineName(target=True), 8),
+          (event_data.Ip(target=True), 12, _NormalizeIp)]),
+      # Special privileges assigned to new logon.
+      4672: event_data.ExtractionPlan([
+          (event_data.UserId(source=True), 0),
+          (event_data.UserName(source=True), 1)]),
+      # A Kerberos authentication ticket (TGT) was requested.
+      4768: event_data.ExtractionPlan([
+          (event_data.UserName(target=True), 0),
+          (event_data.UserId(target=True), 2),
+          (event_data.Ip(target=True), 9, _NormalizeIp)]),
+      # A Kerberos service ticket was requested.
+      4769: event_data.ExtractionPlan([
+          (event_data.UserName(target=True), 0),
+          (event_data.Ip(target=True), 6, _NormalizeIp)]),
+      # The computer attempted to validate the credentials for an account.
+      4776: event_data.ExtractionPlan([
+          (event_data.UserName(target=True), 1),
+          (event_data.MachineName(target=True), 2)]),
+      # Remote Desktop Services: User authentication succeeded.
+      1149: event_data.ExtractionPlan([
+          (event_data.UserName(target=True), 0),
+          (event_data.Ip(target=True), 2, _NormalizeIp)]),
+      # Remote Desktop Services: Session logon succeeded.
+      21: _REMOTE_SESSION_PLAN,
+      # Remote Desktop Services: Session has been disconnected.
+      24: _REMOTE_SESSION_PLAN,
+      # Remote Desktop Services: Session reconnection succeeded.
+      25: _REMOTE_SESSION_PLAN,
+  }
+
+  # Event identifiers that are only meaningful for a specific source_name.
+  _SOURCE_NAMES = {
+      1149: u'Microsoft-Windows-TerminalServices-RemoteConnectionManager',
+      21: u'Microsoft-Windows-TerminalServices-LocalSessionManager',
+      24: u'Microsoft-Windows-TerminalServices-LocalSessionManager',
+      25: u'Microsoft-Windows-TerminalServices-LocalSessionManager',
+  }
+
+  # Event identifiers for which the plaso file name is added as source.
+  _STORAGE_EVENT_IDENTIFIERS = frozenset([4624, 4625])
+
+  # Event identifiers of failed attempts, they create failed access edges.
+  _FAILED_EVENT_IDENTIFIERS = frozenset([4625])
+
+  # Event identifiers whose target account belongs to the computer that
+  # recorded the event. Logoffs do not name the machine of the session, so
+  # the account is attached to the event's own computer.
+  _LOCAL_TARGET_EVENT_IDENTIFIERS = frozenset([4634, 4647])
+
+  # Positions of status codes by event_identifier. Events with a status other
+  # than zero are failed authentications and are not extracted.
+  _STATUS_POSITIONS = {
+      4768: 6,
+      4769: 8,
+      4776: 3,
+  }
+
+  @classmethod
+  def GetElasticFilter(cls):
+    """Returns elasticsearch filter of events with extraction plans.
+
+    Returns:
+      dict: terms clause on event_identifier.
+    """
+    return {u'terms': {u'event_identifier': sorted(cls._STRINGS_PLANS)}}
+
   @classmethod
   def Parse(cls, event):
     """Parses event data based on position in event.strings.
@@ -21,54 +162,79 @@ class WinEvtxEventParser(parser_interface.ParserInterface):
     Returns:
       event_data.EventData: event data parsed from event.
     """
+    return cls.ParseBatch([event])[0]
+
+  @classmethod
+  def ParseBatch(cls, events):
+    """Parses event data based on position in event.strings.
+
+    Positions are looked up by event_identifier in _STRINGS_PLANS. Tables are
+    looked up once per batch and storage file names are computed once per
+    pathspec string. Authentication events with a failure status (see
+    _STATUS_POSITIONS) are not parsed.
+
+    Args:
+      events (list[dict]): dict serialized plaso events.
+
+    Returns:
+      list[event_data.EventData]: event data parsed from events, in the same
+          order as events.
+    """
+    plans = cls._STRINGS_PLANS
+    source_names = cls._SOURCE_NAMES
+    storage_event_identifiers = cls._STORAGE_EVENT_IDENTIFIERS
+    failed_event_identifiers = cls._FAILED_EVENT_IDENTIFIERS
+    local_target_event_identifiers = cls._LOCAL_TARGET_EVENT_IDENTIFIERS
+    status_positions = cls._STATUS_POSITIONS
+    parse_string_list = utils.ParseStringList
+    image_names = {}
+    EventData = event_data.EventData  # pylint: disable=invalid-name
+
+    results = []
+    for event in events:
+      event_id = event.get(u'event_identifier')
+      plan = plans.get(event_id)
+      if plan is None:
+        results.append(EventData())
+        continue
+
+      source_name = source_names.get(event_id)
+      if source_name and event.get(u'source_name') != source_name:
+        results.append(EventData())
+        continue
+
+      strings = event.get(u'strings')
+      if not strings:
+        results.append(EventData())
+        continue
+
+      if not isinstance(strings, list):
+        try:
+          strings = parse_string_list(strings)
+        except ValueError:
+          results.append(EventData())
+          continue
+
+      status_position = status_positions.get(event_id)
+      if (status_position is not None and status_position < len(strings) and
+          not _IsSuccessStatus(strings[status_position])):
+        results.append(EventData())
+        continue
+
+      data = EventData(failed=event_id in failed_event_identifiers)
+      if event_id in storage_event_identifiers:
+        storage_file_name = utils.GetImageName(event, cache=image_names)
+        data.Add(event_data.StorageFileName(
+            source=True, value=storage_file_name))
 
-    data = event_data.EventData()
-    event_id = event.get(u'event_identifier')
-    strings = event.get(u'strings')
-    if not strings:
-      return event_data.EventData()
-
-    if not isinstance(strings, list):
-      strings = eval(strings)  # pylint: disable=eval-used
-
-    if event_id == 4624:  # An account was successfully logged on.
-      storage_file_name = utils.GetImageName(event)
-      source_storage_datum = event_data.StorageFileName(
-          source=True, value=storage_file_name)
-      data.Add(source_storage_datum)
-      source_machine_name = event.get(u'computer_name', '')
-      source_machine_name_datum = event_data.MachineName(
-          source=True, value=source_machine_name)
-      data.Add(source_machine_name_datum)
-      field_mapper = {
-          event_data.UserId(source=True): 0,
-          event_data.UserName(source=True): 1,
-          event_data.UserId(target=True): 4,
-          event_data.UserName(target=True): 5,
-          event_data.MachineName(target=True): 11,
-          event_data.Ip(target=True): 18
-      }
-      for datum, field_index in field_mapper.items():
-        datum.value = strings[field_index]
-        data.Add(datum)
-
-    elif event_id == 4648:  # Login with certificate.
-      source_machine_name = event.get(u'computer_name', '')
-      source_machine_name_datum = event_data.MachineName(
-          source=True, value=source_machine_name)
-      data.Add(source_machine_name_datum)
-      field_mapper = {
-          event_data.UserId(source=True): 0,
-          event_data.UserName(source=True): 1,
-          event_data.UserName(target=True): 5,
-          event_data.MachineName(target=True): 8,
-          event_data.Ip(target=True): 12,
-      }
-      for datum, field_index in field_mapper.items():
-        datum.value = strings[field_index]
-        data.Add(datum)
-
-    return data
+      source_machine_name = event.get(u'computer_name', u'')
+      data.Add(event_data.MachineName(source=True, value=source_machine_name))
+      if event_id in local_target_event_identifiers:
+        data.Add(event_data.MachineName(
+            target=True, value=source_machine_name))
+      plan.Apply(strings, data)
+      results.append(data)
+    return results
 
 
 manager.ParserManager.RegisterParser(WinEvtxEventParser)
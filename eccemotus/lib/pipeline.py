@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""Staged processing of events connected by bounded queues.
+
+Every stage runs in its own thread and passes batches of items to the next
+stage through a bounded queue. A slow stage fills its input queue, which
+blocks the previous stages (backpressure), so memory stays bounded while
+waiting for disk or network in one stage overlaps with work in others.
+
+Threads share the interpreter lock, so CPU heavy stages (decoding, parsing)
+can be offloaded to a multiprocessing pool. A bounded number of batches is
+in flight in the pool and results keep their order.
+"""
+
+from __future__ import print_function
+import collections
+import logging
+import sys
+import threading
+import time
+
+try:
+  import Queue as queue  # pylint: disable=import-error
+except ImportError:
+  import queue  # pylint: disable=import-error
+
+
+class StageMetrics(object):
+  """Counters of one pipeline stage.
+
+  Attributes:
+    batches (int): number of produced batches.
+    blocked_time (float): seconds spent waiting for space in the output queue
+        (backpressure from the next stage).
+    busy_time (float): seconds spent processing.
+    depth_samples (int): number of samples of the input queue depth.
+    depth_sum (int): sum of sampled input queue depths.
+    items (int): number of produced items.
+    max_depth (int): the largest sampled input queue depth.
+    name (str): stage name.
+    waiting_time (float): seconds spent waiting for input.
+  """
+
+  def __init__(self, name):
+    """Initializes StageMetrics.
+
+    Args:
+      name (str): stage name.
+    """
+    self.batches = 0
+    self.blocked_time = 0.0
+    self.busy_time = 0.0
+    self.depth_samples = 0
+    self.depth_sum = 0
+    self.items = 0
+    self.max_depth = 0
+    self.name = name
+    self.waiting_time = 0.0
+
+  def AddDepthSample(self, depth):
+    """Records depth of the input queue.
+
+    Args:
+      depth (int): number of batches in the queue.
+    """
+    self.depth_samples += 1
+    self.depth_sum += depth
+    self.max_depth = max(self.max_depth, depth)
+
+  def GetAverageDepth(self):
+    """Returns average sampled depth of the input queue."""
+    if not self.depth_samples:
+      return 0.0
+    return float(self.depth_sum) / self.depth_samples
+
+
+_Stage = collections.namedtuple(u'_Stage', [u'name', u'function', u'pool'])
+
+
+class Pipeline(object):
+  """Runs stages connected by bounded queues.
+
+  Queue operations block without timeouts. When the pipeline stops early
+  (an error or the consumer stopped iterating), every stage still drains its
+  input until the end of stream and passes the end on, so no thread stays
+  blocked on a full queue.
+
+  Attributes:
+    metrics (list[StageMetrics]): metrics of the source, every stage and the
+        consumer, available after Run was iterated.
+  """
+
+  # Marks the end of stream in queues.
+  _END = object()
+
+  def __init__(self, queue_size=8, batch_size=1000, pool_batches=None):
+    """Initializes Pipeline.
+
+    Args:
+      queue_size (int): maximum number of batches in every queue.
+      batch_size (int): number of source items in one batch.
+      pool_batches (None|int): maximum number of batches in flight in a
+          pool, defaults to queue_size.
+    """
+    self._batch_size = batch_size
+    self._error = None
+    self._pool_batches = pool_batches or queue_size
+    self._queue_size = queue_size
+    self._stages = []
+    self._stop = threading.Event()
+    self.metrics = []
+
+  def AddStage(self, name, function, pool=None):
+    """Adds stage after the previously added ones.
+
+    Args:
+      name (str): stage name.
+      function (callable): transforms a list of items to a list of items.
+          Must be picklable (a module level function or functools.partial of
+          it) if pool is used.
+      pool (None|multiprocessing.Pool): if specified, function runs in the
+          pool.
+    """
+    self._stages.append(_Stage(name, function, pool))
+
+  def _Fail(self, exception, metrics):
+    """Records error of stage and stops the pipeline.
+
+    Args:
+      exception (Exception): error.
+      metrics (StageMetrics): metrics of the failed stage.
+    """
+    logging.getLogger(__name__).exception(
+        u'Pipeline stage {0:s} failed'.format(metrics.name))
+    if self._error is None:
+      self._error = exception
+    self._stop.set()
+
+  def _Put(self, output_queue, batch, metrics):
+    """Puts batch to queue, waiting for space.
+
+    Args:
+      output_queue (queue.Queue): output queue.
+      batch (list|object): batch or _END.
+      metrics (StageMetrics): metrics of the producing stage.
+    """
+    start = time.time()
+    output_queue.put(batch)
+    metrics.blocked_time += time.time() - start
+    if batch is not self._END:
+      metrics.batches += 1
+      metrics.items += len(batch)
+
+  def _Get(self, input_queue, metrics):
+    """Gets batches from queue until the end of stream.
+
+    Args:
+      input_queue (queue.Queue): input queue.
+      metrics (StageMetrics): metrics of the consuming stage.
+
+    Yields:
+      list: batch.
+    """
+    while True:
+      metrics.AddDepthSample(input_queue.qsize())
+      start = time.time()
+      batch = input_queue.get()
+      metrics.waiting_time += time.time() - start
+      if batch is self._END:
+        return
+      yield batch
+
+  def _RunSource(self, source, output_queue, metrics):
+    """Batches items of source into the first queue.
+
+    Args:
+      source (iterable): source items.
+      output_queue (queue.Queue): output queue.
+      metrics (StageMetrics): source metrics.
+    """
+    try:
+      batch = []
+      start = time.time()
+      for item in source:
+        batch.append(item)
+        if len(batch) >= self._batch_size:
+          metrics.busy_time += time.time() - start
+          if self._stop.is_set():
+            break
+          self._Put(output_queue, batch, metrics)
+          batch = []
+          start = time.time()
+      else:
+        metrics.busy_time += time.time() - start
+        if batch:
+          self._Put(output_queue, batch, metrics)
+    except Exception as exception:  # pylint: disable=broad-except
+      self._Fail(exception, metrics)
+    self._Put(output_queue, self._END, metrics)
+
+  def _RunStage(self, stage, input_queue, output_queue, metrics):
+    """Transforms batches from input queue into output queue.
+
+    Args:
+      stage (_Stage): stage.
+      input_queue (queue.Queue): input queue.
+      output_queue (queue.Queue): output queue.
+      metrics (StageMetrics): stage metrics.
+    """
+    pending = collections.deque()
+    for batch in self._Get(input_queue, metrics):
+      if self._stop.is_set():
+        continue
+      try:
+        if stage.pool is None:
+          start = time.time()
+          result = stage.function(batch)
+          metrics.busy_time += time.time() - start
+          self._Put(output_queue, result, metrics)
+        else:
+          pending.append(stage.pool.apply_async(stage.function, (batch,)))
+          if len(pending) >= self._pool_batches:
+            self._PutPoolResult(pending.popleft(), output_queue, metrics)
+      except Exception as exception:  # pylint: disable=broad-except
+        self._Fail(exception, metrics)
+
+    try:
+      while pending and not self._stop.is_set():
+        self._PutPoolResult(pending.popleft(), output_queue, metrics)
+    except Exception as exception:  # pylint: disable=broad-except
+      self._Fail(exception, metrics)
+    self._Put(output_queue, self._END, metrics)
+
+  def _PutPoolResult(self, result, output_queue, metrics):
+    """Waits for result of pool and puts it to queue.
+
+    Args:
+      result (multiprocessing.pool.AsyncResult): pending result.
+      output_queue (queue.Queue): output queue.
+      metrics (StageMetrics): stage metrics.
+    """
+    start = time.time()
+    batch = result.get()
+    metrics.busy_time += time.time() - start
+    self._Put(output_queue, batch, metrics)
+
+  def Run(self, source, source_name=u'source', consumer_name=u'consumer'):
+    """Runs pipeline over source items.
+
+    Args:
+      source (iterable): source items, iterated in a separate thread.
+      source_name (str): name of the source in metrics.
+      consumer_name (str): name of the consumer of results in metrics.
+
+    Yields:
+      object: items produced by the last stage, in source order.
+
+    Raises:
+      Exception: error raised by the source or any stage.
+    """
+    self._error = None
+    self._stop.clear()
+    queues = [
+        queue.Queue(maxsize=self._queue_size)
+        for _ in range(len(self._stages) + 1)]
+    self.metrics = [StageMetrics(source_name)]
+    threads = [threading.Thread(
+        target=self._RunSource, args=(source, queues[0], self.metrics[0]))]
+
+    for index, stage in enumerate(self._stages):
+      metrics = StageMetrics(stage.name)
+      self.metrics.append(metrics)
+      threads.append(threading.Thread(
+          target=self._RunStage,
+          args=(stage, queues[index], queues[index + 1], metrics)))
+
+    consumer_metrics = StageMetrics(consumer_name)
+    self.metrics.append(consumer_metrics)
+    for thread in threads:
+      thread.daemon = True
+      thread.start()
+
+    batches = self._Get(queues[-1], consumer_metrics)
+    try:
+      for batch in batches:
+        if self._stop.is_set():
+          break
+        consumer_metrics.batches += 1
+        consumer_metrics.items += len(batch)
+        start = time.time()
+        for item in batch:
+          yield item
+        consumer_metrics.busy_time += time.time() - start
+    finally:
+      self._stop.set()
+      for _ in batches:
+        pass
+      for thread in threads:
+        thread.join()
+
+    if self._error is not None:
+      raise self._error  # pylint: disable=raising-bad-type
+
+  def PrintMetrics(self, output=sys.stdout):
+    """Prints metrics of all stages.
+
+    Args:
+      output (file): output stream.
+    """
+    print(u'Pipeline stages:', file=output)
+    for metrics in self.metrics:
+      print((
+          u'  {0:s}: {1:d} items in {2:d} batches, busy {3:.3f} s, waiting '
+          u'{4:.3f} s, blocked {5:.3f} s, input queue depth avg {6:.1f} max '
+          u'{7:d}').format(
+              metrics.name, metrics.items, metrics.batches,
+              metrics.busy_time, metrics.waiting_time, metrics.blocked_time,
+              metrics.GetAverageDepth(), metrics.max_depth), file=output)
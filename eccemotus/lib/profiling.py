@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""Profiling of processing stages (reading, parsing, graph creation...).
+
+Stages are nested when one stage consumes another one, e.g. building the graph
+iterates over parsed events, which read raw events. Time, cProfile statistics
+and allocations of a nested stage are not accounted to the outer stage.
+
+Memory profiling requires tracemalloc, which is not available on python 2.
+"""
+
+from __future__ import print_function
+import contextlib
+import cProfile
+import sys
+import time
+
+try:
+  import tracemalloc
+except ImportError:
+  tracemalloc = None
+
+
+class Profiler(object):
+  """Collects per stage profiles.
+
+  Without profile and memory profile paths the profiler is disabled and adds
+  no overhead, iterables are not even wrapped.
+
+  Attributes:
+    enabled (bool): whether any profiling is enabled.
+  """
+
+  # Number of stack frames stored for every allocation.
+  _TRACEMALLOC_FRAMES = 1
+
+  def __init__(self, profile_path=None, memory_profile_path=None, top=5):
+    """Initializes Profiler.
+
+    Args:
+      profile_path (str): prefix of cProfile statistics files, one file per
+          stage (e.g. <profile_path>.parse). None disables cProfile.
+      memory_profile_path (str): prefix of tracemalloc snapshot files, one
+          file per stage. None disables memory profiling.
+      top (int): number of hot spots per stage in summary.
+
+    Raises:
+      ImportError: if memory profiling is requested but tracemalloc is not
+          available.
+    """
+    if memory_profile_path and tracemalloc is None:
+      raise ImportError(
+          u'Memory profiling requires tracemalloc (python 3.4 or newer).')
+
+    self.enabled = bool(profile_path or memory_profile_path)
+    self._memory_profile_path = memory_profile_path
+    self._profile_path = profile_path
+    self._top = top
+
+    self._last_snapshot = None
+    self._memory_statistics = {}
+    self._peak_memory = None
+    self._profiles = {}
+    self._stack = []
+    self._stage_names = []
+    self._stage_start = None
+    self._times = {}
+
+  def _Resume(self, name):
+    """Starts measuring stage on top of the stack.
+
+    Args:
+      name (str): stage name.
+    """
+    self._stage_start = time.time()
+    if self._profile_path:
+      self._profiles[name].enable()
+
+  def _Pause(self, name):
+    """Stops measuring stage on top of the stack.
+
+    Args:
+      name (str): stage name.
+    """
+    if self._profile_path:
+      self._profiles[name].disable()
+    self._times[name] += time.time() - self._stage_start
+
+  def _Enter(self, name):
+    """Enters stage, the current stage is paused.
+
+    Args:
+      name (str): stage name.
+    """
+    if name not in self._times:
+      self._stage_names.append(name)
+      self._times[name] = 0.0
+      if self._profile_path:
+        self._profiles[name] = cProfile.Profile()
+
+    if self._stack:
+      self._Pause(self._stack[-1])
+    self._stack.append(name)
+    self._Resume(name)
+
+  def _Exit(self):
+    """Exits the current stage, the outer stage is resumed."""
+    self._Pause(self._stack.pop())
+    if self._stack:
+      self._Resume(self._stack[-1])
+
+  def _TakeSnapshot(self, name):
+    """Takes memory snapshot at the end of stage.
+
+    Args:
+      name (str): stage name.
+    """
+    if not self._memory_profile_path:
+      return
+
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__)])
+    snapshot.dump(u'{0:s}.{1:s}'.format(self._memory_profile_path, name))
+    if self._last_snapshot is None:
+      statistics = snapshot.statistics(u'lineno')
+    else:
+      statistics = snapshot.compare_to(self._last_snapshot, u'lineno')
+    self._memory_statistics[name] = statistics[:self._top]
+    self._last_snapshot = snapshot
+
+  def Start(self):
+    """Starts memory tracing."""
+    if self._memory_profile_path:
+      tracemalloc.start(self._TRACEMALLOC_FRAMES)
+
+  def Stop(self):
+    """Stops memory tracing and writes cProfile statistics files."""
+    if self._memory_profile_path and tracemalloc.is_tracing():
+      self._peak_memory = tracemalloc.get_traced_memory()[1]
+      tracemalloc.stop()
+
+    if self._profile_path:
+      for name, profile in self._profiles.items():
+        profile.dump_stats(u'{0:s}.{1:s}'.format(self._profile_path, name))
+
+  @contextlib.contextmanager
+  def Stage(self, name):
+    """Measures code in with block as stage.
+
+    Args:
+      name (str): stage name.
+
+    Yields:
+      None
+    """
+    if not self.enabled:
+      yield
+      return
+
+    self._Enter(name)
+    try:
+      yield
+    finally:
+      self._Exit()
+      self._TakeSnapshot(name)
+
+  def Iterate(self, name, iterable):
+    """Measures iteration over iterable as stage.
+
+    Args:
+      name (str): stage name.
+      iterable (iterable): iterable, usually generator.
+
+    Returns:
+      iterable: iterable with the same items.
+    """
+    if not self.enabled:
+      return iterable
+    return self._Iterate(name, iterable)
+
+  def _Iterate(self, name, iterable):
+    """Iterates over iterable and measures getting of every item.
+
+    Args:
+      name (str): stage name.
+      iterable (iterable): iterable.
+
+    Yields:
+      object: items of iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+      self._Enter(name)
+      try:
+        item = next(iterator)
+      except StopIteration:
+        break
+      finally:
+        self._Exit()
+      yield item
+    self._TakeSnapshot(name)
+
+  def PrintSummary(self, output=sys.stdout):
+    """Prints time and hot spots of every stage.
+
+    Args:
+      output (file): output stream.
+    """
+    if not self.enabled:
+      return
+
+    print(u'Profile summary:', file=output)
+    for name in self._stage_names:
+      print(u'  {0:s}: {1:.3f} s'.format(name, self._times[name]), file=output)
+
+      if name in self._profiles:
+        hot_spots = sorted(
+            self._profiles[name].getstats(), key=lambda entry: entry.inlinetime,
+            reverse=True)
+        for entry in hot_spots[:self._top]:
+          print(u'    {0:8.3f} s {1!s}'.format(
+              entry.inlinetime, _GetCodeName(entry.code)), file=output)
+
+      for statistic in self._memory_statistics.get(name, []):
+        print(u'    {0!s}'.format(statistic), file=output)
+
+    if self._peak_memory is not None:
+      print(u'  peak traced memory: {0:d} B'.format(self._peak_memory),
+            file=output)
+
+
+def _GetCodeName(code):
+  """Returns readable name of profiled code.
+
+  Args:
+    code (code|str): code object or description of built-in function.
+
+  Returns:
+    str: function name and location.
+  """
+  if not hasattr(code, u'co_name'):
+    return code
+  return u'{0:s} ({1:s}:{2:d})'.format(
+      code.co_name, code.co_filename, code.co_firstlineno)
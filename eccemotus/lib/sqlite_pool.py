@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""Pool of sqlite connections for concurrent readers and a single writer.
+
+The database is switched to write-ahead logging (WAL), where readers see the
+last committed state and are not blocked by a writer. Every thread gets its
+own read connection from the pool, all writes go through one connection
+serialized by a lock, so writers never wait for the sqlite busy timeout.
+
+Statements are compiled once per connection and reused from the statement
+cache of the sqlite3 module, as long as the same SQL text with parameters is
+executed.
+"""
+
+import contextlib
+import sqlite3
+import threading
+
+try:
+  import Queue as queue  # pylint: disable=import-error
+except ImportError:
+  import queue  # pylint: disable=import-error
+
+
+class ConnectionPool(object):
+  """Shares read connections and a write connection between threads.
+
+  Attributes:
+    path (str): path of the database file.
+  """
+
+  def __init__(
+      self, path, max_readers=8, cached_statements=256, row_factory=None,
+      timeout=30.0):
+    """Initializes ConnectionPool and enables WAL mode of the database.
+
+    Args:
+      path (str): path of the database file, created if it does not exist.
+      max_readers (int): maximum number of read connections. Threads wait for
+          a free connection when all of them are used.
+      cached_statements (int): number of compiled statements cached by every
+          connection.
+      row_factory (None|type): row factory of connections, e.g. sqlite3.Row.
+      timeout (float): seconds to wait for locks held by other processes.
+    """
+    self._cached_statements = cached_statements
+    self._idle_readers = queue.Queue()
+    self._lock = threading.Lock()
+    self._max_readers = max_readers
+    self._readers = []
+    self._row_factory = row_factory
+    self._timeout = timeout
+    self._write_lock = threading.Lock()
+    self.path = path
+
+    self._writer = self._Connect()
+    self._writer.execute(u'PRAGMA journal_mode = WAL')
+    # Commits in WAL mode are durable after checkpoints, which is enough for
+    # graphs that can be rebuilt.
+    self._writer.execute(u'PRAGMA synchronous = NORMAL')
+
+  def _Connect(self, read_only=False):
+    """Opens connection usable from any thread.
+
+    Args:
+      read_only (bool): whether writes are refused by the connection.
+
+    Returns:
+      sqlite3.Connection: connection.
+    """
+    connection = sqlite3.connect(
+        self.path, timeout=self._timeout, check_same_thread=False,
+        cached_statements=self._cached_statements)
+    if self._row_factory is not None:
+      connection.row_factory = self._row_factory
+    if read_only:
+      connection.execute(u'PRAGMA query_only = ON')
+    return connection
+
+  def Acquire(self):
+    """Takes read connection, opens new one or waits for a free one.
+
+    Returns:
+      sqlite3.Connection: read connection, must be returned by Release.
+    """
+    try:
+      return self._idle_readers.get_nowait()
+    except queue.Empty:
+      pass
+
+    with self._lock:
+      if len(self._readers) < self._max_readers:
+        connection = self._Connect(read_only=True)
+        self._readers.append(connection)
+        return connection
+    return self._idle_readers.get()
+
+  def Release(self, connection):
+    """Returns read connection to the pool.
+
+    Cursors of the connection should be closed or exhausted, an unfinished
+    query keeps its snapshot of the database.
+
+    Args:
+      connection (sqlite3.Connection): connection from Acquire.
+    """
+    self._idle_readers.put(connection)
+
+  @contextlib.contextmanager
+  def Read(self):
+    """Lends read connection for with block.
+
+    Yields:
+      sqlite3.Connection: read connection.
+    """
+    connection = self.Acquire()
+    try:
+      yield connection
+    finally:
+      self.Release(connection)
+
+  @contextlib.contextmanager
+  def Write(self):
+    """Runs with block as a transaction of the write connection.
+
+    Other writers wait until the transaction is committed, or rolled back if
+    the block raises.
+
+    Yields:
+      sqlite3.Cursor: cursor of the write connection.
+    """
+    with self._write_lock:
+      cursor = self._writer.cursor()
+      committed = False
+      try:
+        yield cursor
+        self._writer.commit()
+        committed = True
+      finally:
+        cursor.close()
+        if not committed:
+          self._writer.rollback()
+
+  def GetStatistics(self):
+    """Returns numbers of connections.
+
+    Returns:
+      dict[str, int]: opened, idle and maximum number of read connections.
+    """
+    with self._lock:
+      return {
+          u'idle_readers': self._idle_readers.qsize(),
+          u'max_readers': self._max_readers,
+          u'readers': len(self._readers)}
+
+  def Close(self):
+    """Closes all connections, none of them may be in use."""
+    with self._lock:
+      for connection in self._readers:
+        connection.close()
+      self._readers = []
+      self._idle_readers = queue.Queue()
+    with self._write_lock:
+      self._writer.close()
@@ -141,3 +141,38 @@ class EventDataTest(unittest.TestCase):
     data.Add(machine_datum)
     is_empty = data.IsEmpty()
     self.assertFalse(is_empty)
+
+
+class ExtractionPlanTest(unittest.TestCase):
+  """Tests for extraction plan."""
+
+  def test_Apply(self):
+    """Tests that applied plan adds the same data as EventData.Add."""
+    plan = event_data.ExtractionPlan([
+        (event_data.UserId(source=True), 0),
+        (event_data.UserName(target=True), 1),
+        (event_data.Ip(target=True), 2),
+        (event_data.MachineName(target=True), 5)])
+    data = event_data.EventData()
+    plan.Apply([u'S-1-0-0', u'dean', u'-'], data)
+
+    self.assertEqual(len(data._index), 2)
+    datum = data.Get(event_data.UserId(source=True))
+    self.assertIsInstance(datum, event_data.UserId)
+    self.assertEqual(datum.value, u'S-1-0-0')
+    datum = data.Get(event_data.UserName(target=True))
+    self.assertEqual(datum.value, u'dean')
+    self.assertTrue(datum.target)
+    self.assertIsNone(data.Get(event_data.Ip(target=True)))
+
+  def test_ApplyConverter(self):
+    """Tests that converted values are added and None values skipped."""
+    plan = event_data.ExtractionPlan([
+        (event_data.Ip(target=True), 0, lambda value: value[7:]),
+        (event_data.Ip(source=True), 1, lambda value: None)])
+    data = event_data.EventData()
+    plan.Apply([u'::ffff:10.0.0.1', u'10.0.0.2'], data)
+
+    self.assertEqual(
+        data.Get(event_data.Ip(target=True)).value, u'10.0.0.1')
+    self.assertIsNone(data.Get(event_data.Ip(source=True)))
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""Tests for lib/event_store.py."""
+
+import os
+import unittest
+
+from eccemotus.lib import event_store
+
+
+class EventStoreTest(unittest.TestCase):
+  """Tests on-disk storage of edge events."""
+
+  def setUp(self):
+    """Creates event store with a small batch size."""
+    self._store = event_store.EventStore()
+    self._store._BATCH_SIZE = 3  # pylint: disable=protected-access
+
+  def tearDown(self):
+    """Closes event store."""
+    if os.path.exists(self._store.path):
+      self._store.Close()
+
+  def test_GetEvents(self):
+    """Tests that events are returned per edge in order of adding."""
+    for index in range(10):
+      self._store.Add(index % 3, {u'id': index, u'timestamp': index * 10})
+
+    self.assertEqual(
+        self._store.GetEvents(1),
+        [{u'id': index, u'timestamp': index * 10} for index in [1, 4, 7]])
+    self.assertEqual(self._store.GetEvents(5), [])
+
+    self._store.Add(1, {u'id': u'x', u'timestamp': None})
+    self.assertEqual(self._store.GetEvents(1)[-1], {
+        u'id': u'x', u'timestamp': None})
+
+  def test_IterateEvents(self):
+    """Tests iterating over events grouped by edges."""
+    for edge_id in [4, 0, 4, 2, 0]:
+      self._store.Add(edge_id, {u'id': edge_id, u'timestamp': 0})
+
+    self.assertEqual(
+        [(edge_id, len(events))
+         for edge_id, events in self._store.IterateEvents()],
+        [(0, 2), (2, 1), (4, 2)])
+
+  def test_GetStatistics(self):
+    """Tests counting events and finding the latest timestamps."""
+    self._store.Add(0, {u'id': 1, u'timestamp': 5})
+    self._store.Add(0, {u'id': 2, u'timestamp': 3, u'count': 4})
+    self._store.Add(1, {u'id': 3, u'timestamp': None})
+    self.assertEqual(self._store.GetStatistics(), {0: (5, 5), 1: (1, 0)})
+
+  def test_Close(self):
+    """Tests that closing removes the database."""
+    self._store.Add(0, {u'id': 1, u'timestamp': 5})
+    self.assertTrue(os.path.exists(self._store.path))
+    self._store.Close()
+    self.assertFalse(os.path.exists(self._store.path))
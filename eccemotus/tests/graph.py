@@ -4,7 +4,9 @@
 import unittest
 
 from eccemotus.lib import event_data
+from eccemotus.lib import event_store
 from eccemotus.lib import graph as graph_lib
+from eccemotus.lib import membership
 
 def GetDummyGraph():
   """Creates small dummy graph.
@@ -87,6 +89,15 @@ class GraphTest(unittest.TestCase):
 
     self.assertEqual(len(graph.nodes), 4)
     self.assertEqual(len(graph.edges), 3)
+    self.assertEqual(graph.edges[-1][u'type'], graph_lib.Graph.EDGE_ACCESS)
+
+    informations = event_data.EventData(
+        data=informations_list, event_id=2, timestamp=1441559606244560,
+        failed=True)
+    graph.AddEventData(informations)
+    self.assertEqual(len(graph.edges), 4)
+    self.assertEqual(
+        graph.edges[-1][u'type'], graph_lib.Graph.EDGE_FAILED_ACCESS)
 
   def test_AddEdge(self):
     """Tests edge adding."""
@@ -106,6 +117,20 @@ class GraphTest(unittest.TestCase):
     edge = graph.edges[0]
     self.assertEqual(len(edge[u'events']), 2)
 
+  def test_AddEdgeDeduplicate(self):
+    """Tests that edge adding with event filter skips duplicate events."""
+    graph = graph_lib.Graph(event_filter=membership.EventIdFilter())
+    node1_id = graph.GetAddNode(u'node_type_1', u'node_value_1')
+    node2_id = graph.GetAddNode(u'node_type_2', u'node_value_2')
+
+    graph.AddEdge(node1_id, node2_id, u'is', 10, 20)
+    graph.AddEdge(node1_id, node2_id, u'is', 10, 20)
+    graph.AddEdge(node2_id, node1_id, u'is', 10, 20)
+    graph.AddEdge(node1_id, node2_id, u'is', 20, 30)
+    self.assertEqual(len(graph.edges), 2)
+    self.assertEqual(len(graph.edges[0][u'events']), 2)
+    self.assertEqual(len(graph.edges[1][u'events']), 1)
+
   def test_AddData(self):
     """Tests data adding."""
     graph = graph_lib.Graph()
@@ -123,6 +148,36 @@ class GraphTest(unittest.TestCase):
     self.assertEqual(graph.nodes[1][u'type'], target_machine.NAME)
     self.assertEqual(graph.nodes[1][u'value'], target_machine.value)
 
+  def test_Merge(self):
+    """Tests merging of graphs."""
+    graph = GetDummyGraph()
+    other = graph_lib.Graph()
+    other.AddData(
+        event_data.MachineName(source=True, value=u'machine3'),
+        event_data.MachineName(target=True, value=u'machine2'), u'access', 30,
+        40)
+    other.AddData(
+        event_data.MachineName(source=True, value=u'machine1'),
+        event_data.MachineName(target=True, value=u'machine2'), u'access', 50,
+        60)
+
+    graph.Merge(other)
+    self.assertEqual(len(graph.nodes), 7)
+    self.assertEqual(len(graph.edges), 6)
+    self.assertEqual(len(other.nodes), 3)
+
+    machine1_id = graph.nodes_ids[(u'machine_name', u'machine1')]
+    machine2_id = graph.nodes_ids[(u'machine_name', u'machine2')]
+    machine3_id = graph.nodes_ids[(u'machine_name', u'machine3')]
+    edge_id = graph.edges_ids[(machine1_id, machine2_id, u'access')]
+    expected_events = [
+        {u'id': 20, u'timestamp': 10}, {u'id': 60, u'timestamp': 50}]
+    self.assertEqual(graph.edges[edge_id][u'events'], expected_events)
+
+    edge_id = graph.edges_ids[(machine3_id, machine2_id, u'access')]
+    expected_events = [{u'id': 40, u'timestamp': 30}]
+    self.assertEqual(graph.edges[edge_id][u'events'], expected_events)
+
   def test_Finalize(self):
     """Tests graph finalization."""
     graph = GetDummyGraph()
@@ -257,6 +312,237 @@ class CreateGraphTest(unittest.TestCase):
     self.assertEqual(len(graph.nodes), 4)
     self.assertEqual(len(graph.edges), 3)
 
+class MergeGraphsTest(unittest.TestCase):
+  """Tests merging of multiple graphs."""
+
+  def test_MergeGraphs(self):
+    """Tests that merged graph is the same as graph created at once."""
+    graph = GetDummyGraph()
+    graph.Finalize()
+    merged_graph = graph_lib.MergeGraphs([GetDummyGraph(), graph_lib.Graph()])
+    self.assertEqual(graph.nodes, merged_graph.nodes)
+    self.assertEqual(graph.edges, merged_graph.edges)
+
+    merged_graph = graph_lib.MergeGraphs([GetDummyGraph(), GetDummyGraph()])
+    self.assertEqual(graph.nodes, merged_graph.nodes)
+    for edge in merged_graph.edges:
+      self.assertEqual(len(edge[u'events']), 2)
+
+    merged_graph = graph_lib.MergeGraphs(
+        [GetDummyGraph(), GetDummyGraph()], deduplicate=True)
+    self.assertEqual(graph.edges, merged_graph.edges)
+
+
+class CompactTest(unittest.TestCase):
+  """Tests graph compaction."""
+
+  def _GetGraph(self):
+    """Creates graph with two frequent access edges and one recent one.
+
+    Returns:
+      graph_lib.Graph: graph.
+    """
+    graph = graph_lib.Graph()
+    for event_id in range(3):
+      graph.AddData(
+          event_data.MachineName(source=True, value=u'machine1'),
+          event_data.MachineName(target=True, value=u'machine2'), u'access',
+          event_id, event_id)
+    graph.AddData(
+        event_data.MachineName(source=True, value=u'machine3'),
+        event_data.MachineName(target=True, value=u'machine4'), u'access',
+        100, 3)
+    for event_id in range(4, 6):
+      graph.AddData(
+          event_data.UserName(source=True, value=u'user5'),
+          event_data.MachineName(target=True, value=u'machine2'), u'access',
+          50, event_id)
+    graph.AddData(
+        event_data.UserName(source=True, value=u'user5'),
+        event_data.MachineName(source=True, value=u'machine5'), u'has',
+        50, 4)
+    for machine, user in [(u'machine1', u'user1'), (u'machine2', u'user2')]:
+      graph.AddData(
+          event_data.MachineName(source=True, value=machine),
+          event_data.UserName(source=True, value=user), u'has', 1, 6)
+      graph.AddData(
+          event_data.MachineName(source=True, value=machine),
+          event_data.UserId(source=True, value=user + u'_id'), u'has', 1, 6)
+    return graph
+
+  def _GetValues(self, graph):
+    """Returns sorted node values of graph."""
+    return sorted(node[u'value'] for node in graph.nodes)
+
+  def test_CompactByCount(self):
+    """Tests keeping edges with the most events."""
+    compacted, report = self._GetGraph().Compact(2)
+    self.assertEqual(self._GetValues(compacted), [u'machine1', u'machine2'])
+    self.assertEqual(len(compacted.edges), 1)
+    self.assertEqual(len(compacted.edges[0][u'events']), 3)
+    self.assertEqual(
+        compacted.nodes[0][u'collapsed'], {u'user_name': 1, u'user_id': 1})
+    self.assertEqual(report, graph_lib.Graph.CompactionReport(
+        kept_nodes=2, dropped_nodes=8, collapsed_nodes=4, kept_edges=1,
+        dropped_edges=2, dropped_events=3))
+
+  def test_CompactByRecency(self):
+    """Tests keeping edges with the latest events."""
+    compacted, report = self._GetGraph().Compact(
+        2, order_by=graph_lib.Graph.COMPACT_BY_RECENCY)
+    self.assertEqual(self._GetValues(compacted), [u'machine3', u'machine4'])
+    self.assertEqual(report.dropped_events, 5)
+    self.assertEqual(report.collapsed_nodes, 0)
+
+  def test_CompactClusterPaths(self):
+    """Tests that access edges from users keep paths to cluster centers."""
+    compacted, report = self._GetGraph().Compact(4)
+    self.assertEqual(
+        self._GetValues(compacted),
+        [u'machine1', u'machine2', u'machine5', u'user5'])
+    self.assertEqual(report.kept_edges, 2)
+    self.assertEqual(len(compacted.edges), 3)
+    clusters = dict(
+        (node[u'value'], node[u'cluster']) for node in compacted.nodes)
+    self.assertEqual(clusters[u'user5'], clusters[u'machine5'])
+
+    compacted, report = self._GetGraph().Compact(100)
+    self.assertEqual(report.kept_edges, 3)
+    self.assertEqual(report.dropped_events, 0)
+    self.assertEqual(len(compacted.nodes), 6)
+    self.assertEqual(report.collapsed_nodes, 4)
+
+  def test_CompactInvalidOrder(self):
+    """Tests that unsupported ordering raises ValueError."""
+    with self.assertRaises(ValueError):
+      self._GetGraph().Compact(10, order_by=u'random')
+
+
+class CollapseClustersTest(unittest.TestCase):
+  """Tests cluster-collapsed view of graph."""
+
+  def _GetGraph(self):
+    """Creates dummy graph with parallel access edges between clusters.
+
+    Returns:
+      graph_lib.Graph: finalized graph.
+    """
+    graph = GetDummyGraph()
+    graph.AddData(
+        event_data.UserName(source=True, value=u'user1'),
+        event_data.UserName(target=True, value=u'user2'), u'access', 30, 40)
+    graph.Finalize()
+    return graph
+
+  def test_CollapseClusters(self):
+    """Tests that every cluster becomes a single node."""
+    collapsed = self._GetGraph().CollapseClusters()
+    self.assertEqual(collapsed.nodes, [
+        {u'id': 0, u'type': u'machine_name', u'value': u'machine1',
+         u'cluster': 0, u'full_cluster': 0,
+         u'collapsed': {u'user_name': 1, u'user_id': 1}},
+        {u'id': 1, u'type': u'machine_name', u'value': u'machine2',
+         u'cluster': 1, u'full_cluster': 1,
+         u'collapsed': {u'user_name': 1, u'user_id': 1}}])
+    self.assertEqual(collapsed.edges, [{
+        u'source': 0, u'target': 1, u'type': u'access',
+        u'events': [
+            {u'id': 20, u'timestamp': 10}, {u'id': 40, u'timestamp': 30}]}])
+
+  def test_CollapseClustersExpanded(self):
+    """Tests that nodes of expanded clusters are kept."""
+    graph = self._GetGraph()
+    collapsed = graph.CollapseClusters(expanded_clusters=[1])
+    self.assertEqual(
+        sorted(node[u'value'] for node in collapsed.nodes),
+        [u'machine1', u'machine2', u'user2', u'userid2'])
+    self.assertEqual(
+        [node[u'full_cluster'] for node in collapsed.nodes], [0, 1, 1, 1])
+    self.assertEqual(len(collapsed.edges), 4)
+
+    expanded = graph.CollapseClusters(expanded_clusters=[0, 1])
+    self.assertEqual(len(expanded.nodes), len(graph.nodes))
+    self.assertEqual(expanded.edges, graph.edges)
+
+
+class EventStoreGraphTest(unittest.TestCase):
+  """Tests graphs with events in the event store."""
+
+  def setUp(self):
+    """Creates event stores."""
+    self._stores = [event_store.EventStore() for _ in range(2)]
+
+  def tearDown(self):
+    """Closes event stores."""
+    for store in self._stores:
+      store.Close()
+
+  def _GetGraph(self, store=None, suffix=u''):
+    """Creates graph with parallel and repeated events.
+
+    Args:
+      store (event_store.EventStore): event store of the graph.
+      suffix (str): suffix of node values.
+
+    Returns:
+      graph_lib.Graph: graph.
+    """
+    graph = graph_lib.Graph(event_store=store)
+    for index in range(20):
+      graph.AddData(
+          event_data.MachineName(
+              source=True, value=u'machine{0:d}'.format(index % 3)),
+          event_data.MachineName(
+              target=True, value=u'machine{0:d}{1:s}'.format(
+                  index % 4, suffix)),
+          graph_lib.Graph.EDGE_ACCESS, index * 10, index, count=index % 2 + 1)
+      graph.AddData(
+          event_data.MachineName(
+              source=True, value=u'machine{0:d}'.format(index % 3)),
+          event_data.UserName(source=True, value=u'user{0:d}'.format(index)),
+          graph_lib.Graph.EDGE_HAS, index * 10, index)
+    return graph
+
+  def _GetEdges(self, graph):
+    """Returns edges of graph with their events."""
+    return list(graph.IterateEdges())
+
+  def test_GetEdgeEvents(self):
+    """Tests that events are read from the store."""
+    graph = self._GetGraph()
+    stored_graph = self._GetGraph(store=self._stores[0])
+    self.assertEqual(stored_graph.nodes, graph.nodes)
+    self.assertEqual(self._GetEdges(stored_graph), graph.edges)
+    for edge_id in range(len(graph.edges)):
+      self.assertEqual(
+          stored_graph.GetEdgeEvents(edge_id), graph.GetEdgeEvents(edge_id))
+
+  def test_Compact(self):
+    """Tests that compaction uses counts and timestamps from the store."""
+    graph = self._GetGraph()
+    stored_graph = self._GetGraph(store=self._stores[0])
+    for order_by in [graph.COMPACT_BY_COUNT, graph.COMPACT_BY_RECENCY]:
+      compacted, report = graph.Compact(4, order_by)
+      stored_compacted, stored_report = stored_graph.Compact(4, order_by)
+      self.assertEqual(stored_report, report)
+      self.assertEqual(stored_compacted.nodes, compacted.nodes)
+      self.assertEqual(stored_compacted.edges, compacted.edges)
+
+  def test_MergeCollapse(self):
+    """Tests merging and collapsing of graphs with event stores."""
+    graph = self._GetGraph()
+    graph.Merge(self._GetGraph(suffix=u'x'))
+    stored_graph = self._GetGraph(store=self._stores[0])
+    stored_graph.Merge(
+        self._GetGraph(store=self._stores[1], suffix=u'x'))
+    self.assertEqual(stored_graph.nodes, graph.nodes)
+    self.assertEqual(self._GetEdges(stored_graph), graph.edges)
+
+    collapsed = stored_graph.CollapseClusters()
+    self.assertIsNone(collapsed.event_store)
+    self.assertEqual(collapsed.edges, graph.CollapseClusters().edges)
+
+
 class LoadGraphTest(unittest.TestCase):
   """Tests graph loading from json."""
 
@@ -269,3 +555,46 @@ class LoadGraphTest(unittest.TestCase):
     self.assertEqual(graph.edges, loaded_graph.edges)
     self.assertEqual(graph.nodes_ids, loaded_graph.nodes_ids)
     self.assertEqual(graph.edges_ids, loaded_graph.edges_ids)
+
+  def test_LoadGraphV2(self):
+    """Tests restoring graph from schema version 2."""
+    graph = GetDummyGraph()
+    graph.AddData(
+        event_data.MachineName(source=True, value=u'machine1'),
+        event_data.MachineName(target=True, value=u'machine2'), u'access', 5,
+        21, count=3)
+    serialized = graph.Serialize(graph_lib.SCHEMA_V2)
+    self.assertEqual(serialized[u'version'], graph_lib.SCHEMA_V2)
+    self.assertEqual(serialized[u'links'][0], {
+        u'source': 0, u'target': 1, u'type': u'access',
+        u'event_ids': [20, 21], u'timestamps': [10, -5],
+        u'event_counts': [1, 3]})
+    self.assertNotIn(u'event_counts', serialized[u'links'][1])
+
+    loaded_graph = graph_lib.LoadGraph(serialized)
+    self.assertEqual(graph.nodes, loaded_graph.nodes)
+    self.assertEqual(graph.edges, loaded_graph.edges)
+    self.assertEqual(graph.edges_ids, loaded_graph.edges_ids)
+    self.assertEqual(
+        graph.Serialize(graph_lib.SCHEMA_V1), graph.MinimalSerialize())
+
+    with self.assertRaises(ValueError):
+      graph_lib.LoadGraph({u'version': 3})
+    with self.assertRaises(ValueError):
+      graph.Serialize(3)
+
+  def test_EncodeLink(self):
+    """Tests that events without integer timestamps are kept."""
+    edge = {
+        u'source': 0, u'target': 1, u'type': u'has',
+        u'events': [{u'id': 1, u'timestamp': None}]}
+    self.assertIs(graph_lib.EncodeLink(edge), edge)
+    self.assertIs(graph_lib.DecodeLink(edge), edge)
+
+    edge[u'events'] = [{u'id': 1, u'timestamp': 2, u'note': u'x'}]
+    self.assertIs(graph_lib.EncodeLink(edge), edge)
+
+    edge[u'events'] = []
+    link = graph_lib.EncodeLink(edge)
+    self.assertEqual(link[u'event_ids'], [])
+    self.assertEqual(graph_lib.DecodeLink(link), edge)
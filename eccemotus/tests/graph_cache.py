@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Tests for lib/graph_cache.py."""
+
+import unittest
+
+from eccemotus.lib import event_data
+from eccemotus.lib import graph as graph_lib
+from eccemotus.lib import graph_cache
+
+
+def _GetGraph(edge_count):
+  """Creates graph with access edges between machines.
+
+  Args:
+    edge_count (int): number of edges.
+
+  Returns:
+    graph_lib.Graph: graph.
+  """
+  graph = graph_lib.Graph()
+  for index in range(edge_count):
+    graph.AddData(
+        event_data.MachineName(source=True, value=u'machine{0:d}'.format(
+            index)),
+        event_data.MachineName(target=True, value=u'machine'), u'access',
+        index, index * 10)
+  return graph
+
+
+class EstimateGraphSizeTest(unittest.TestCase):
+  """Tests estimating memory used by graphs."""
+
+  def test_EstimateGraphSize(self):
+    """Tests that estimates grow with the graph and sampling is close."""
+    small_graph = _GetGraph(10)
+    large_graph = _GetGraph(1000)
+    small_size = graph_cache.EstimateGraphSize(small_graph)
+    large_size = graph_cache.EstimateGraphSize(large_graph)
+    self.assertGreater(small_size, 0)
+    self.assertGreater(large_size, small_size * 50)
+
+    exact_size = graph_cache.EstimateGraphSize(large_graph, samples=1000)
+    self.assertLess(abs(large_size - exact_size), exact_size // 10)
+
+
+class GraphCacheTest(unittest.TestCase):
+  """Tests LRU cache of graphs."""
+
+  def test_GetPut(self):
+    """Tests hits, misses and evictions of least recently used graphs."""
+    cache = graph_cache.GraphCache(30)
+    graphs = [graph_lib.Graph() for _ in range(3)]
+    self.assertIsNone(cache.Get(0))
+    self.assertTrue(cache.Put(0, graphs[0], size=10))
+    self.assertTrue(cache.Put(1, graphs[1], size=10))
+    self.assertIs(cache.Get(0), graphs[0])
+
+    # Graph 1 is the least recently used one.
+    self.assertTrue(cache.Put(2, graphs[2], size=15))
+    self.assertIsNone(cache.Get(1))
+    self.assertIs(cache.Get(2), graphs[2])
+    self.assertEqual(cache.GetStatistics(), {
+        u'entries': 2, u'evictions': 1, u'hits': 2, u'max_size': 30,
+        u'misses': 2, u'size': 25})
+
+  def test_PutReplace(self):
+    """Tests replacing graph and not caching too large graphs."""
+    cache = graph_cache.GraphCache(30)
+    cache.Put(0, graph_lib.Graph(), size=10)
+    cache.Put(0, graph_lib.Graph(), size=20)
+    self.assertEqual(cache.size, 20)
+
+    self.assertFalse(cache.Put(0, graph_lib.Graph(), size=31))
+    self.assertIsNone(cache.Get(0))
+    self.assertEqual(cache.size, 0)
+
+  def test_GetOrLoad(self):
+    """Tests that graphs are loaded only on misses."""
+    cache = graph_cache.GraphCache(1024 * 1024)
+    loaded = []
+
+    def Load():
+      """Loads graph."""
+      graph = _GetGraph(5)
+      loaded.append(graph)
+      return graph
+
+    graph = cache.GetOrLoad((1, u'revision'), Load)
+    self.assertIs(cache.GetOrLoad((1, u'revision'), Load), graph)
+    self.assertEqual(loaded, [graph])
+    self.assertEqual(cache.size, graph_cache.EstimateGraphSize(graph))
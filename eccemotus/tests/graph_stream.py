@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""Tests for lib/graph_stream.py."""
+
+import io
+import random
+import unittest
+
+from eccemotus.lib import event_data
+from eccemotus.lib import event_store
+from eccemotus.lib import graph as graph_lib
+from eccemotus.lib import graph_stream
+from eccemotus.lib import json_codec
+from eccemotus.tests import graph as graph_test
+
+
+def GetRandomGraph(seed, count, event_store=None):
+  """Creates graph with random clusters.
+
+  Args:
+    seed (int): seed of random generator.
+    count (int): number of added data pairs.
+    event_store (event_store.EventStore): on-disk storage of edge events.
+
+  Returns:
+    graph_lib.Graph: random graph.
+  """
+  generator = random.Random(seed)
+  data_classes = [
+      event_data.MachineName, event_data.Ip, event_data.UserName,
+      event_data.UserId]
+  graph = graph_lib.Graph(event_store=event_store)
+  for i in range(count):
+    source_class = generator.choice(data_classes)
+    target_class = generator.choice(data_classes)
+    edge_type = generator.choice([
+        graph_lib.Graph.EDGE_ACCESS, graph_lib.Graph.EDGE_HAS,
+        graph_lib.Graph.EDGE_IS])
+    graph.AddData(
+        source_class(
+            source=True, value=u'source{0:d}'.format(generator.randint(0, 30))),
+        target_class(
+            target=True, value=u'target{0:d}'.format(generator.randint(0, 30))),
+        edge_type, i, i)
+  return graph
+
+
+class GraphStreamReaderTest(unittest.TestCase):
+  """Tests incremental reading of serialized graphs."""
+
+  def _ReadItems(self, data, chunk_size):
+    """Reads items of serialized graph.
+
+    Args:
+      data (bytes): serialized graph.
+      chunk_size (int): number of bytes read at once.
+
+    Returns:
+      tuple[dict[str, list], dict[str, object]]: array items by array name
+          and other top level members.
+    """
+    reader = graph_stream.GraphStreamReader(
+        io.BytesIO(data), chunk_size=chunk_size)
+    items = {}
+    for name, item in reader.Iterate():
+      items.setdefault(name, []).append(item)
+    return items, reader.attributes
+
+  def test_Iterate(self):
+    """Tests that items are the same as in loaded document."""
+    graph = graph_test.GetDummyGraph()
+    serialized = graph.MinimalSerialize()
+    serialized[u'name'] = u'dummy č'
+    serialized[u'count'] = 1234
+    serialized[u'empty'] = []
+    data = json_codec.DumpBytes(serialized)
+
+    for chunk_size in [1, 3, 7, 1024]:
+      items, attributes = self._ReadItems(data, chunk_size)
+      self.assertEqual(items[u'nodes'], graph.nodes)
+      self.assertEqual(items[u'links'], graph.edges)
+      self.assertNotIn(u'empty', items)
+      self.assertEqual(
+          attributes, {u'name': u'dummy č', u'count': 1234})
+
+  def test_IterateJavascript(self):
+    """Tests reading graph wrapped in javascript."""
+    graph = graph_test.GetDummyGraph()
+    data = (
+        b'var graph=' + json_codec.DumpBytes(graph.MinimalSerialize()) +
+        b';\n')
+    for chunk_size in [1, 5, 1024]:
+      items, _ = self._ReadItems(data, chunk_size)
+      self.assertEqual(items[u'nodes'], graph.nodes)
+      self.assertEqual(items[u'links'], graph.edges)
+
+  def test_IterateLargeValue(self):
+    """Tests that values larger than a chunk are decoded once complete."""
+    link = {
+        u'source': 0, u'target': 1, u'type': u'access',
+        u'note': u'a"b\\c[{' * 500,
+        u'events': [{u'id': u'x{0:d}'.format(i), u'timestamp': i}
+                    for i in range(500)]}
+    data = json_codec.DumpBytes({u'nodes': [], u'links': [link, link]})
+
+    decoded = []
+    reader = graph_stream.GraphStreamReader(io.BytesIO(data), chunk_size=64)
+    json_decoder = reader._json_decoder  # pylint: disable=protected-access
+    raw_decode = json_decoder.raw_decode
+
+    def _CountingRawDecode(*args):
+      decoded.append(args[1])
+      return raw_decode(*args)
+
+    json_decoder.raw_decode = _CountingRawDecode
+    items = [item for name, item in reader.Iterate() if name == u'links']
+    self.assertEqual(items, [link, link])
+    # Keys and both links, each link decoded at most three times.
+    self.assertLessEqual(len(decoded), 10)
+
+    for chunk_size in [1, 7, 1024]:
+      items, _ = self._ReadItems(data, chunk_size)
+      self.assertEqual(items[u'links'], [link, link])
+
+  def test_IterateInvalid(self):
+    """Tests that invalid documents raise ValueError."""
+    for data in [b'', b'[1, 2]', b'var x={}', b'{"nodes": [{"id": 0}',
+                 b'{"nodes": [1 2]}', b'{"nodes": [[1 2], 3]}',
+                 b'{"nodes": ["a\\"]}']:
+      with self.assertRaises(ValueError):
+        self._ReadItems(data, 4)
+
+
+class DisjointSetTest(unittest.TestCase):
+  """Tests disjoint set."""
+
+  def test_Union(self):
+    """Tests joining and finding sets."""
+    disjoint_set = graph_stream.DisjointSet()
+    disjoint_set.Union(0, 5)
+    disjoint_set.Union(2, 3)
+    disjoint_set.Union(5, 3)
+
+    root = disjoint_set.Find(0)
+    for element in [2, 3, 5]:
+      self.assertEqual(disjoint_set.Find(element), root)
+    self.assertEqual(disjoint_set.Find(1), 1)
+    self.assertEqual(disjoint_set.Find(4), 4)
+    self.assertEqual(disjoint_set.Find(100), 100)
+
+
+class GetSummaryTest(unittest.TestCase):
+  """Tests streaming summary."""
+
+  def _GetExpectedSummary(self, graph):
+    """Computes summary of graph in memory.
+
+    Args:
+      graph (graph_lib.Graph): graph.
+
+    Returns:
+      dict[int, dict[str, list[str]]]: summary of finalized graph.
+    """
+    loaded_graph = graph_lib.LoadGraph(
+        json_codec.Loads(json_codec.DumpBytes(graph.MinimalSerialize())))
+    loaded_graph.Finalize()
+    return loaded_graph.Summary()
+
+  def test_GetSummary(self):
+    """Tests that streaming summary equals in memory summary."""
+    graphs = [graph_test.GetDummyGraph(), graph_lib.Graph()]
+    graphs.extend(GetRandomGraph(seed, 200) for seed in range(5))
+    for graph in graphs:
+      for version in [graph_lib.SCHEMA_V1, graph_lib.SCHEMA_V2]:
+        data = json_codec.DumpBytes(graph.Serialize(version))
+        summary = graph_stream.GetSummary(io.BytesIO(data))
+        self.assertEqual(summary, self._GetExpectedSummary(graph))
+
+
+class WriteGraphTest(unittest.TestCase):
+  """Tests streaming serialization."""
+
+  def test_WriteGraph(self):
+    """Tests that streamed serialization equals MinimalSerialize."""
+    for seed in range(3):
+      graph = GetRandomGraph(seed, 200)
+      expected = json_codec.DumpBytes(graph.MinimalSerialize())
+
+      output = io.BytesIO()
+      graph_stream.WriteGraph(graph, output)
+      self.assertEqual(output.getvalue(), expected)
+
+      output = io.BytesIO()
+      graph_stream.WriteGraph(graph, output, graph_lib.SCHEMA_V2)
+      self.assertEqual(
+          output.getvalue(),
+          json_codec.DumpBytes(graph.Serialize(graph_lib.SCHEMA_V2)))
+
+      store = event_store.EventStore()
+      try:
+        stored_graph = GetRandomGraph(seed, 200, event_store=store)
+        self.assertFalse(any(edge[u'events'] for edge in stored_graph.edges))
+        output = io.BytesIO()
+        graph_stream.WriteGraph(stored_graph, output)
+      finally:
+        store.Close()
+      self.assertEqual(output.getvalue(), expected)
+
+    output = io.BytesIO()
+    graph_stream.WriteGraph(graph_lib.Graph(), output)
+    self.assertEqual(
+        output.getvalue(),
+        json_codec.DumpBytes(graph_lib.Graph().MinimalSerialize()))
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""Tests for lib/json_codec.py."""
+
+import unittest
+
+from eccemotus.lib import json_codec
+
+
+class JsonCodecTest(unittest.TestCase):
+  """Tests for JSON codec."""
+
+  _DOCUMENT = {u'data_type': u'syslog:line', u'timestamp': 1440854525000000,
+               u'strings': [u'S-1-5-7', u'žluťoučk\xfd']}
+
+  def _testRoundTrip(self):
+    """Checks that encoded document decodes to the same document."""
+    encoded = json_codec.DumpBytes(self._DOCUMENT)
+    self.assertIsInstance(encoded, bytes)
+    self.assertEqual(json_codec.Loads(encoded), self._DOCUMENT)
+    self.assertEqual(
+        json_codec.Loads(json_codec.Dumps(self._DOCUMENT)), self._DOCUMENT)
+
+  def test_Backends(self):
+    """Tests encoding and decoding with every available backend."""
+    decoders, encoders = json_codec.GetAvailableBackends()
+    self.assertIn(u'json', decoders)
+    self.assertIn(u'json', encoders)
+    old_decoder = json_codec.GetDecoderName()
+    old_encoder = json_codec.GetEncoderName()
+    try:
+      for decoder in decoders:
+        for encoder in encoders:
+          json_codec.SetDecoder(decoder)
+          json_codec.SetEncoder(encoder)
+          self._testRoundTrip()
+    finally:
+      json_codec.SetDecoder(old_decoder)
+      json_codec.SetEncoder(old_encoder)
+
+  def test_SetDecoder(self):
+    """Tests that unknown backend is rejected."""
+    with self.assertRaises(ValueError):
+      json_codec.SetDecoder(u'unknown')
+    with self.assertRaises(ValueError):
+      json_codec.SetEncoder(u'unknown')
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Tests for eccemotus_ui/lateral.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from eccemotus.lib import json_codec
+from eccemotus.tests import graph as graph_test
+
+try:
+  from eccemotus_ui import lateral
+except ImportError:
+  lateral = None
+
+
+@unittest.skipIf(lateral is None, u'flask is missing')
+class GetGraphTest(unittest.TestCase):
+  """Tests serving of graph payloads."""
+
+  def setUp(self):
+    """Creates database with a graph."""
+    self._directory = tempfile.mkdtemp()
+    lateral.app.config[u'DATABASE'] = os.path.join(
+        self._directory, u'test.sql')
+    graph = json_codec.DumpBytes(
+        graph_test.GetDummyGraph().MinimalSerialize()).decode(u'utf-8')
+    with lateral.app.app_context():
+      lateral.Prepare()
+      lateral.AddGraph(u'dummy', graph)
+    self._client = lateral.app.test_client()
+
+  def tearDown(self):
+    """Closes and removes database."""
+    lateral.app.extensions.pop(u'database_pool').Close()
+    shutil.rmtree(self._directory)
+
+  def _GetStatus(self, if_none_match):
+    """Requests the graph with an If-None-Match header.
+
+    Args:
+      if_none_match (str): value of the header.
+
+    Returns:
+      int: status code of the response.
+    """
+    response = self._client.get(
+        u'/api/graph/1', headers={u'If-None-Match': if_none_match})
+    return response.status_code
+
+  def test_IfNoneMatch(self):
+    """Tests that matching validators get not modified responses."""
+    response = self._client.get(u'/api/graph/1')
+    self.assertEqual(response.status_code, 200)
+    etag = response.headers[u'ETag']
+
+    self.assertEqual(self._GetStatus(etag), 304)
+    self.assertEqual(self._GetStatus(u'W/' + etag), 304)
+    self.assertEqual(self._GetStatus(u'"other", ' + etag), 304)
+    self.assertEqual(self._GetStatus(u'"other"'), 200)
+
+  def test_IfNoneMatchAny(self):
+    """Tests that "*" matches any current representation."""
+    self.assertEqual(self._GetStatus(u'*'), 304)
+    self.assertEqual(self._GetStatus(u'"other", *'), 304)
+    response = self._client.get(
+        u'/api/graph/2', headers={u'If-None-Match': u'*'})
+    self.assertEqual(response.status_code, 404)
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""Tests for lib/line_reader.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from eccemotus.lib import line_reader
+
+
+class MappedLineReaderTest(unittest.TestCase):
+  """Tests reading lines of memory mapped files."""
+
+  _DATA = (
+      b'{"data_type": "a"}\n'
+      b'{"data_type": "b"}\n'
+      b'\n'
+      b'{"data_type": "c", "note": "a"}\n'
+      b'{"data_type": "a", "last": true}')
+
+  def setUp(self):
+    """Creates directory for files."""
+    self._directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    """Removes directory for files."""
+    shutil.rmtree(self._directory)
+
+  def _ReadLines(self, data, literals=None, start_offset=0):
+    """Reads lines of file with data.
+
+    Args:
+      data (bytes): content of file.
+      literals (None|list[bytes]): literals of returned lines.
+      start_offset (int): byte offset of the first line.
+
+    Returns:
+      tuple[list[tuple[int, bytes]], int]: lines with offsets and offset
+          after reading.
+    """
+    path = os.path.join(self._directory, u'events.json_line')
+    with open(path, u'wb') as output_file:
+      output_file.write(data)
+
+    with open(path, u'rb') as input_file:
+      reader = line_reader.MappedLineReader(
+          input_file, literals=literals, start_offset=start_offset)
+      lines = list(reader.Iterate())
+    return lines, reader.offset
+
+  def test_IterateAll(self):
+    """Tests reading all lines."""
+    lines, offset = self._ReadLines(self._DATA)
+    self.assertEqual(lines, [
+        (0, b'{"data_type": "a"}'),
+        (19, b'{"data_type": "b"}'),
+        (39, b'{"data_type": "c", "note": "a"}'),
+        (71, b'{"data_type": "a", "last": true}')])
+    self.assertEqual(offset, len(self._DATA))
+    for line_offset, line in lines:
+      self.assertEqual(
+          self._DATA[line_offset:line_offset + len(line)], line)
+
+  def test_IterateMatching(self):
+    """Tests that only lines with literals are returned."""
+    lines, offset = self._ReadLines(self._DATA, literals=[b'"a"'])
+    self.assertEqual(
+        [line_offset for line_offset, _ in lines], [0, 39, 71])
+    self.assertEqual(offset, len(self._DATA))
+
+    lines, _ = self._ReadLines(self._DATA, literals=[b'"c"', b'"b"'])
+    self.assertEqual(
+        [line_offset for line_offset, _ in lines], [19, 39])
+
+    lines, offset = self._ReadLines(self._DATA, literals=[b'"x"'])
+    self.assertEqual(lines, [])
+    self.assertEqual(offset, len(self._DATA))
+
+    lines, _ = self._ReadLines(self._DATA, literals=[])
+    self.assertEqual(lines, [])
+
+  def test_Resume(self):
+    """Tests that reading continues from the offset of a previous reading."""
+    path = os.path.join(self._directory, u'events.json_line')
+    with open(path, u'wb') as output_file:
+      output_file.write(self._DATA)
+
+    with open(path, u'rb') as input_file:
+      reader = line_reader.MappedLineReader(input_file, literals=[b'"a"'])
+      lines = reader.Iterate()
+      first_line = next(lines)
+      lines.close()
+    self.assertEqual(first_line, (0, b'{"data_type": "a"}'))
+    self.assertEqual(reader.offset, 19)
+
+    lines, _ = self._ReadLines(
+        self._DATA, literals=[b'"a"'], start_offset=reader.offset)
+    self.assertEqual(
+        [line_offset for line_offset, _ in lines], [39, 71])
+
+  def test_Empty(self):
+    """Tests reading empty file."""
+    self.assertEqual(self._ReadLines(b''), ([], 0))
+    self.assertEqual(self._ReadLines(b'', literals=[b'"a"']), ([], 0))
+    self.assertEqual(self._ReadLines(b'\n\n'), ([], 2))
+
+  def _ReadPipe(self, data, literals=None, start_offset=0):
+    """Reads lines of pipe with data.
+
+    Args:
+      data (bytes): data written to the pipe.
+      literals (None|list[bytes]): literals of returned lines.
+      start_offset (int): byte offset of the first line.
+
+    Returns:
+      tuple[list[tuple[int, bytes]], int]: lines with offsets and offset
+          after reading.
+    """
+    read_descriptor, write_descriptor = os.pipe()
+    os.write(write_descriptor, data)
+    os.close(write_descriptor)
+    with os.fdopen(read_descriptor, u'rb') as input_file:
+      reader = line_reader.MappedLineReader(
+          input_file, literals=literals, start_offset=start_offset)
+      self.assertFalse(reader.SeekTimeRange(0, 10))
+      lines = list(reader.Iterate())
+    return lines, reader.offset
+
+  def test_Pipe(self):
+    """Tests that pipes are read line by line like mapped files."""
+    for literals in [None, [b'"a"'], [b'"c"', b'"b"'], [b'"x"']]:
+      for start_offset in [0, 19]:
+        self.assertEqual(
+            self._ReadPipe(self._DATA, literals, start_offset),
+            self._ReadLines(self._DATA, literals, start_offset))
+    self.assertEqual(self._ReadPipe(self._DATA, literals=[])[0], [])
+    self.assertEqual(self._ReadPipe(b''), ([], 0))
+
+
+class TimestampTest(unittest.TestCase):
+  """Tests finding time ranges in json_line files."""
+
+  def setUp(self):
+    """Creates directory for files."""
+    self._directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    """Removes directory for files."""
+    shutil.rmtree(self._directory)
+
+  def _WriteFile(self, timestamps):
+    """Writes file with one line per timestamp.
+
+    Args:
+      timestamps (list[int|None]): timestamps of lines, None for a line
+          without timestamp.
+
+    Returns:
+      str: path of the file.
+    """
+    path = os.path.join(self._directory, u'events.json_line')
+    with open(path, u'wb') as output_file:
+      for timestamp in timestamps:
+        if timestamp is None:
+          output_file.write(b'{"data_type": "x"}\n')
+        else:
+          output_file.write(
+              u'{{"timestamp": {0:d}, "data_type": "x"}}\n'.format(
+                  timestamp).encode(u'utf-8'))
+    return path
+
+  def _ReadTimestamps(self, path, since, until):
+    """Reads timestamps of lines in time range found by seeking.
+
+    Args:
+      path (str): path of the file.
+      since (None|int): the smallest timestamp.
+      until (None|int): the largest timestamp.
+
+    Returns:
+      tuple[bool, list[int|None]]: result of seeking and timestamps of read
+          lines.
+    """
+    with open(path, u'rb') as input_file:
+      reader = line_reader.MappedLineReader(input_file)
+      is_sorted = reader.SeekTimeRange(since, until)
+      timestamps = [
+          line_reader.GetRawTimestamp(line) for _, line in reader.Iterate()]
+    return is_sorted, timestamps
+
+  def test_GetRawTimestamp(self):
+    """Tests getting timestamps of serialized events."""
+    self.assertEqual(
+        line_reader.GetRawTimestamp(b'{"timestamp": 1440409600617570}'),
+        1440409600617570)
+    self.assertEqual(
+        line_reader.GetRawTimestamp(b'{"a":1,"timestamp":-5,"b":2}'), -5)
+    self.assertEqual(
+        line_reader.GetRawTimestamp(
+            b'{"timestamp_desc": "x", "timestamp": 7}'), 7)
+    for line in [b'{"data_type": "x"}', b'{"timestamp": 1.5}',
+                 b'{"timestamp": 1, "extra": {"timestamp": 2}}']:
+      self.assertIsNone(line_reader.GetRawTimestamp(line))
+
+  def test_SeekTimeRange(self):
+    """Tests that only lines in time range are read from sorted file."""
+    timestamps = [i // 3 * 10 for i in range(300)]
+    timestamps[100] = None
+    path = self._WriteFile(timestamps)
+
+    for since, until in [
+        (None, None), (500, None), (None, 505), (495, 505), (500, 500),
+        (-10, 0), (2990, 5000), (3000, None), (None, -1), (600, 500)]:
+      is_sorted, read = self._ReadTimestamps(path, since, until)
+      self.assertTrue(is_sorted)
+      expected = [
+          timestamp for timestamp in timestamps if timestamp is not None and
+          (since is None or timestamp >= since) and
+          (until is None or timestamp <= until)]
+      self.assertEqual(
+          [timestamp for timestamp in read if timestamp is not None],
+          expected)
+
+  def test_SeekTimeRangeUnsorted(self):
+    """Tests that unsorted files are not narrowed."""
+    timestamps = [(i * 7919) % 300 for i in range(300)]
+    path = self._WriteFile(timestamps)
+    is_sorted, read = self._ReadTimestamps(path, 100, 200)
+    self.assertFalse(is_sorted)
+    self.assertEqual(read, timestamps)
+
+    path = self._WriteFile([None] * 10)
+    is_sorted, read = self._ReadTimestamps(path, 100, 200)
+    self.assertFalse(is_sorted)
+    self.assertEqual(read, [None] * 10)
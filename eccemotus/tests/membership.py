@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Tests for lib/membership.py."""
+
+import unittest
+
+from eccemotus.lib import membership
+
+# pylint: disable=protected-access
+
+class BloomFilterTest(unittest.TestCase):
+  """Tests for Bloom filter."""
+
+  def test_Add(self):
+    """Tests adding keys."""
+    bloom_filter = membership.BloomFilter(100, error_rate=0.01)
+    self.assertTrue(bloom_filter.Add(b'key1'))
+    self.assertFalse(bloom_filter.Add(b'key1'))
+    self.assertTrue(bloom_filter.Add(b'key2'))
+    self.assertEqual(bloom_filter.count, 2)
+    self.assertTrue(bloom_filter.Contains(b'key1'))
+    self.assertFalse(bloom_filter.Contains(b'key3'))
+
+    with self.assertRaises(ValueError):
+      _ = membership.BloomFilter(0)
+
+  def test_ErrorRate(self):
+    """Tests that false positive rate is close to the required one."""
+    bloom_filter = membership.BloomFilter(1000, error_rate=0.01)
+    for i in range(1000):
+      bloom_filter.Add(u'in{0:d}'.format(i).encode(u'utf-8'))
+
+    false_positives = sum(
+        bloom_filter.Contains(u'out{0:d}'.format(i).encode(u'utf-8'))
+        for i in range(10000))
+    self.assertLess(false_positives, 300)
+
+
+class ScalableBloomFilterTest(unittest.TestCase):
+  """Tests for scalable Bloom filter."""
+
+  def test_Add(self):
+    """Tests that filter grows."""
+    bloom_filter = membership.ScalableBloomFilter(initial_capacity=10)
+    for i in range(100):
+      bloom_filter.Add(u'key{0:d}'.format(i).encode(u'utf-8'))
+
+    self.assertGreater(len(bloom_filter._filters), 1)
+    for i in range(100):
+      self.assertTrue(
+          bloom_filter.Contains(u'key{0:d}'.format(i).encode(u'utf-8')))
+
+
+class EventIdFilterTest(unittest.TestCase):
+  """Tests for event id filter."""
+
+  def test_AddIfNew(self):
+    """Tests exact and Bloom filter mode."""
+    event_filter = membership.EventIdFilter(max_exact_size=3)
+    self.assertTrue(event_filter.AddIfNew((1, u'a')))
+    self.assertFalse(event_filter.AddIfNew((1, u'a')))
+    self.assertTrue(event_filter.AddIfNew((2, u'a')))
+    self.assertTrue(event_filter.AddIfNew((1, 5)))
+    self.assertTrue(event_filter.IsExact())
+
+    self.assertTrue(event_filter.AddIfNew((1, 6)))
+    self.assertFalse(event_filter.IsExact())
+    self.assertEqual(len(event_filter._exact), 0)
+    self.assertFalse(event_filter.AddIfNew((1, u'a')))
+    self.assertFalse(event_filter.AddIfNew((1, 6)))
+    self.assertTrue(event_filter.AddIfNew((3, u'a')))
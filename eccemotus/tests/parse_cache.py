@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Tests for lib/parse_cache.py."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from eccemotus.lib import event_data
+from eccemotus.lib import parse_cache
+
+
+def _GetParsedEvents(count):
+  """Creates parsed events.
+
+  Args:
+    count (int): number of events.
+
+  Returns:
+    list[event_data.EventData]: parsed events.
+  """
+  parsed_events = []
+  for index in range(count):
+    parsed_events.append(event_data.EventData(
+        data=[
+            event_data.MachineName(source=True, value=u'machine{0:d}'.format(
+                index)),
+            event_data.UserName(target=True, value=u'user@machine'),
+            event_data.Ip(target=True, value=u'10.0.0.1')],
+        event_data_type=u'windows:evtx:record', event_id=u'id{0:d}'.format(
+            index), timestamp=index * 1000000, count=index % 3 + 1,
+        failed=index % 5 == 0))
+  return parsed_events
+
+
+def _ToTuples(parsed_events):
+  """Converts parsed events to comparable tuples."""
+  return [
+      (data.event_data_type, data.event_id, data.timestamp, data.count,
+       data.failed, sorted(
+           (datum.__class__.__name__, datum.source, datum.target, datum.value)
+           for datum in data.Items()))
+      for data in parsed_events]
+
+
+class ParsedEventCacheTest(unittest.TestCase):
+  """Tests caching of parsed events."""
+
+  def setUp(self):
+    """Creates directory for cache files."""
+    self._directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    """Removes directory for cache files."""
+    shutil.rmtree(self._directory)
+
+  def test_WriteRead(self):
+    """Tests that read events equal written ones."""
+    cache_directory = os.path.join(self._directory, u'cache')
+    cache = parse_cache.ParsedEventCache(cache_directory, [u'file', 1])
+    self.assertFalse(cache.Exists())
+
+    parsed_events = _GetParsedEvents(2500)
+    self.assertEqual(list(cache.Iterate(parsed_events)), parsed_events)
+    self.assertTrue(cache.Exists())
+    self.assertEqual(os.listdir(cache_directory), [
+        os.path.basename(cache.path)])
+
+    read_events = list(cache.Iterate([]))
+    self.assertEqual(_ToTuples(read_events), _ToTuples(parsed_events))
+    self.assertEqual(
+        read_events[0].Get(event_data.UserName(target=True)).value,
+        u'user@machine')
+
+  def test_Key(self):
+    """Tests that different keys use different cache files."""
+    cache = parse_cache.ParsedEventCache(self._directory, [u'file', 1])
+    self.assertEqual(
+        cache.path,
+        parse_cache.ParsedEventCache(self._directory, [u'file', 1]).path)
+    self.assertNotEqual(
+        cache.path,
+        parse_cache.ParsedEventCache(self._directory, [u'file', 2]).path)
+
+  def test_Interrupted(self):
+    """Tests that interrupted writing leaves no cache."""
+    cache = parse_cache.ParsedEventCache(self._directory, u'key')
+    parsed_events = cache.Write(_GetParsedEvents(10))
+    next(parsed_events)
+    parsed_events.close()
+    self.assertFalse(cache.Exists())
+    self.assertEqual(os.listdir(self._directory), [])
+
+  def test_GetFileFingerprint(self):
+    """Tests that fingerprint depends on file content."""
+    path = os.path.join(self._directory, u'events.json_line')
+    fingerprints = set()
+    for data in [b'a' * 100, b'a' * 99 + b'b', b'b' + b'a' * 99]:
+      with open(path, u'wb') as output_file:
+        output_file.write(data)
+      os.utime(path, (0, 0))
+      fingerprints.add(
+          parse_cache.GetFileFingerprint(path, sample_size=10))
+    self.assertEqual(len(fingerprints), 3)
+    self.assertTrue(parse_cache.GetParserVersion())
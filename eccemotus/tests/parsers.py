@@ -4,6 +4,7 @@
 import unittest
 
 from eccemotus.lib import event_data
+from eccemotus.lib import graph as graph_lib
 from eccemotus.lib.parsers import manager
 
 
@@ -54,6 +55,156 @@ class ParserManagerTest(unittest.TestCase):
     ]
     self._testParser(expected, self._win_evtx_event)
 
+  def test_WinEvtxStringifiedStrings(self):
+    """Tests windows:evtx:record with strings as returned by elasticsearch."""
+    event = dict(self._win_evtx_event)
+    event[u'strings'] = repr(event[u'strings'])
+    expected = [
+        event_data.UserId(
+            source=True, value=u'S-1-0-0@REGISTRAR.internal.greendale.edu'),
+        event_data.MachineName(target=True, value=u'STUDENT-PC1'),
+        event_data.Ip(target=True, value=u'192.168.1.11'),
+        event_data.UserName(target=True, value=u'ANONYMOUS LOGON@STUDENT-PC1')
+    ]
+    self._testParser(expected, event)
+
+    event[u'event_identifier'] = 1102
+    parsed_event = manager.ParserManager.Parse(event)
+    self.assertTrue(parsed_event.IsEmpty())
+
+  def test_WinEvtxEventIdentifiers(self):
+    """Tests windows:evtx:record event identifiers other than 4624."""
+    event = dict(self._win_evtx_event)
+    event[u'event_identifier'] = 4776
+    event[u'strings'] = [
+        u'MICROSOFT_AUTHENTICATION_PACKAGE_V1_0', u'dean', u'STUDENT-PC1',
+        u'0x0']
+    expected = [
+        event_data.UserName(target=True, value=u'dean@STUDENT-PC1'),
+        event_data.MachineName(target=True, value=u'STUDENT-PC1')]
+    self._testParser(expected, event)
+
+    # Failed validation of credentials.
+    event[u'strings'] = [
+        u'MICROSOFT_AUTHENTICATION_PACKAGE_V1_0', u'mallory', u'ATTACKER',
+        u'0xc000006a']
+    self.assertTrue(manager.ParserManager.Parse(event).IsEmpty())
+
+    # Logged off accounts belong to the computer that recorded the event.
+    event[u'event_identifier'] = 4634
+    event[u'strings'] = [
+        u'S-1-5-21-1000', u'dean', u'GREENDALE', u'0x0000000000094a1b', u'3']
+    parsed_event = manager.ParserManager.Parse(event)
+    self.assertIsNone(parsed_event.Get(event_data.UserName(source=True)))
+    expected = [
+        event_data.UserName(
+            target=True, value=u'dean@REGISTRAR.internal.greendale.edu'),
+        event_data.UserId(
+            target=True,
+            value=u'S-1-5-21-1000@REGISTRAR.internal.greendale.edu'),
+        event_data.MachineName(
+            target=True, value=u'REGISTRAR.internal.greendale.edu')]
+    self._testParser(expected, event)
+
+    event[u'event_identifier'] = 4625
+    event[u'strings'] = [
+        u'S-1-0-0', u'-', u'-', u'0x0', u'S-1-0-0', u'mallory', u'GREENDALE',
+        u'0xc000006d', u'%%2313', u'0xc000006a', u'3', u'NtLmSsp ', u'NTLM',
+        u'ATTACKER', u'-', u'-', u'0', u'0x0', u'-', u'::ffff:192.168.1.66',
+        u'49273']
+    parsed_event = manager.ParserManager.Parse(event)
+    self.assertTrue(parsed_event.failed)
+    expected = [
+        event_data.UserName(target=True, value=u'mallory@ATTACKER'),
+        event_data.MachineName(target=True, value=u'ATTACKER'),
+        event_data.Ip(target=True, value=u'192.168.1.66')]
+    self._testParser(expected, event)
+
+    event[u'event_identifier'] = 4768
+    event[u'strings'] = [
+        u'dean', u'GREENDALE', u'S-1-5-21-1000', u'krbtgt', u'S-1-5-21-502',
+        u'0x40810010', u'0x0', u'0x12', u'2', u'::ffff:192.168.1.11', u'49273']
+    parsed_event = manager.ParserManager.Parse(event)
+    self.assertFalse(parsed_event.failed)
+    expected = [
+        event_data.UserName(target=True, value=u'dean@192.168.1.11'),
+        event_data.UserId(target=True, value=u'S-1-5-21-1000@192.168.1.11'),
+        event_data.Ip(target=True, value=u'192.168.1.11')]
+    self._testParser(expected, event)
+
+    # Pre-authentication failed.
+    event[u'strings'][6] = u'0x18'
+    self.assertTrue(manager.ParserManager.Parse(event).IsEmpty())
+
+    event[u'event_identifier'] = 4769
+    event[u'strings'] = [
+        u'dean@GREENDALE', u'GREENDALE', u'REGISTRAR$', u'S-1-5-21-1001',
+        u'0x40810000', u'0x12', u'::ffff:192.168.1.11', u'49274',
+        u'0x00000000']
+    expected = [
+        event_data.UserName(
+            target=True, value=u'dean@GREENDALE@192.168.1.11'),
+        event_data.Ip(target=True, value=u'192.168.1.11')]
+    self._testParser(expected, event)
+
+    # Service ticket was refused.
+    event[u'strings'][8] = u'0x1b'
+    self.assertTrue(manager.ParserManager.Parse(event).IsEmpty())
+
+  def test_WinEvtxLogoffHosts(self):
+    """Tests that logoffs of the same account on two hosts are not linked."""
+    events = []
+    for computer_name in [u'dc1', u'ws7']:
+      for event_identifier, strings in [
+          (4634, [u'S-1-5-21-1000', u'alice', u'GREENDALE', u'0x1', u'3']),
+          (4647, [u'S-1-5-21-1000', u'alice', u'GREENDALE', u'0x1']),
+          (4672, [u'S-1-5-21-1000', u'alice', u'GREENDALE', u'0x1', u'-'])]:
+        event = dict(self._win_evtx_event)
+        event.pop(u'uuid', None)
+        event[u'computer_name'] = computer_name
+        event[u'event_identifier'] = event_identifier
+        event[u'strings'] = strings
+        event[u'offset'] = len(events)
+        events.append(event)
+
+    graph = graph_lib.CreateGraph(manager.ParserManager.ParseBatch(events))
+    components = list(range(len(graph.nodes)))
+
+    def _GetComponent(node_id):
+      while components[node_id] != node_id:
+        node_id = components[node_id]
+      return node_id
+
+    for edge in graph.edges:
+      components[_GetComponent(edge[u'source'])] = _GetComponent(
+          edge[u'target'])
+
+    dc1_id = graph.nodes_ids[(u'machine_name', u'dc1')]
+    ws7_id = graph.nodes_ids[(u'machine_name', u'ws7')]
+    self.assertNotEqual(_GetComponent(dc1_id), _GetComponent(ws7_id))
+    self.assertNotIn((u'user_name', u'alice@UNKNOWN'), graph.nodes_ids)
+
+  def test_WinEvtxRemoteDesktop(self):
+    """Tests windows:evtx:record remote desktop events."""
+    event = dict(self._win_evtx_event)
+    event[u'event_identifier'] = 21
+    event[u'source_name'] = (
+        u'Microsoft-Windows-TerminalServices-LocalSessionManager')
+    event[u'strings'] = [u'GREENDALE\\dean', u'2', u'192.168.1.11']
+    expected = [
+        event_data.UserName(target=True, value=u'GREENDALE\\dean@192.168.1.11'),
+        event_data.Ip(target=True, value=u'192.168.1.11')]
+    self._testParser(expected, event)
+
+    event[u'strings'] = [u'GREENDALE\\dean', u'1', u'LOCAL']
+    parsed_event = manager.ParserManager.Parse(event)
+    self.assertIsNone(parsed_event.Get(event_data.Ip(target=True)))
+
+    # Identifier 21 of a different provider is not a remote desktop logon.
+    event[u'source_name'] = u'Microsoft-Windows-Security-Auditing'
+    parsed_event = manager.ParserManager.Parse(event)
+    self.assertTrue(parsed_event.IsEmpty())
+
   def test_Bsm(self):
     """Tests parser for bsm:event data_type."""
     expected = [
@@ -89,6 +240,137 @@ class ParserManagerTest(unittest.TestCase):
     ]
     self._testParser(expected, self._sys_log_ssh)
 
+    event = dict(self._sys_log_ssh)
+    event[u'message'] = (
+        u'Successful login of user: deanfrom 2001:db8::6:52673using '
+        u'authentication method: keyboard-interactivessh pid: 6844')
+    expected = [
+        event_data.Ip(source=True, value=u'2001:db8::6'),
+        event_data.UserName(target=True, value=u'dean@acserver')]
+    self._testParser(expected, event)
+
+  def test_SysLogLineAuthenticationMethods(self):
+    """Tests syslog:line with other authentication methods and IPv6."""
+    event = dict(self._sys_log_event)
+    for message, user_name, ip_address in [
+        (u'[sshd, pid: 6686] Accepted publickey for root from 10.0.8.7 port '
+         u'52667 ssh2: RSA a5:ed:32:56', u'root', u'10.0.8.7'),
+        (u'[sshd, pid: 6686] Accepted keyboard-interactive/pam for dean from '
+         u'fe80::5054:ff:fe12:3456 port 52668 ssh2', u'dean',
+         u'fe80::5054:ff:fe12:3456')]:
+      event[u'message'] = message
+      expected = [
+          event_data.Ip(source=True, value=ip_address),
+          event_data.UserName(
+              target=True,
+              value=user_name + u'@acserver.dd/images/user/usr/')]
+      self._testParser(expected, event)
+
+    event[u'message'] = (
+        u'[sshd, pid: 6686] Failed password for dean from 10.0.8.6 port 52666')
+    parsed_event = manager.ParserManager.Parse(event)
+    self.assertIsNone(parsed_event.Get(event_data.Ip(source=True)))
+
+  def test_ParseBatch(self):
+    """Tests that batch parsing gives the same results as Parse in order."""
+    events = [
+        self._sys_log_event, self._win_evtx_event, {u'data_type': u'unknown'},
+        self._linux_utmp_event, self._sys_log_event, self._bsm_event,
+        self._sys_log_ssh]
+    parsed_batch = manager.ParserManager.ParseBatch(events)
+    self.assertEqual(len(parsed_batch), len(events))
+
+    for event, parsed_event in zip(events, parsed_batch):
+      expected_event = manager.ParserManager.Parse(event)
+      self.assertEqual(parsed_event.event_id, expected_event.event_id)
+      self.assertEqual(
+          parsed_event.event_data_type, expected_event.event_data_type)
+      self.assertEqual(
+          sorted(str(datum) for datum in parsed_event.Items()),
+          sorted(str(datum) for datum in expected_event.Items()))
+
+    self.assertTrue(parsed_batch[2].IsEmpty())
+    self.assertEqual(manager.ParserManager.ParseBatch([]), [])
+
+  def test_ParseBatchStringifiedPathspec(self):
+    """Tests batch parsing of events with pathspec from elasticsearch."""
+    events = []
+    for event in [
+        self._win_evtx_event, self._sys_log_event, self._sys_log_ssh]:
+      event = dict(event)
+      event[u'pathspec'] = repr(event[u'pathspec'])
+      events.extend([event, event])
+
+    parsed_batch = manager.ParserManager.ParseBatch(events)
+    for event, parsed_event in zip(events, parsed_batch):
+      self.assertFalse(parsed_event.IsEmpty())
+      self.assertEqual(
+          sorted(str(datum) for datum in parsed_event.Items()),
+          sorted(
+              str(datum)
+              for datum in manager.ParserManager.Parse(event).Items()))
+
+  def test_GetElasticFilter(self):
+    """Tests that elasticsearch filter matches events of every parser."""
+    elastic_filter = manager.ParserManager.GetElasticFilter()
+    should = elastic_filter[u'bool'][u'should']
+    self.assertEqual(elastic_filter[u'bool'][u'minimum_should_match'], 1)
+    self.assertEqual(
+        len(should), len(list(manager.ParserManager.GetParsedTypes())))
+
+    clauses = {}
+    for clause in should:
+      if u'term' in clause:
+        clauses[clause[u'term'][u'data_type']] = None
+      else:
+        data_type_clause, parser_clause = clause[u'bool'][u'filter']
+        clauses[data_type_clause[u'term'][u'data_type']] = parser_clause
+
+    self.assertIsNone(clauses[u'linux:utmp:event'])
+    self.assertIn(
+        self._win_evtx_event[u'event_identifier'],
+        clauses[u'windows:evtx:record'][u'terms'][u'event_identifier'])
+    self.assertIn(
+        clauses[u'syslog:line'][u'match_phrase'][u'message'],
+        self._sys_log_event[u'message'])
+    self.assertIn(
+        clauses[u'syslog:ssh:login'][u'match_phrase'][u'message'],
+        self._sys_log_ssh[u'message'])
+    self.assertEqual(
+        clauses[u'bsm:event'][u'match_phrase'][u'event_type'],
+        self._bsm_event[u'event_type'])
+
+  def test_GetEventId(self):
+    """Tests event identifiers."""
+    event_id = manager.ParserManager.GetEventId(self._sys_log_event)
+    self.assertEqual(event_id, u'c21fbdaf6cb24fceac1984b160135a93')
+
+    event = dict(self._sys_log_event)
+    event[u'timesketch_id'] = u'AVbTlWpYFqBtaxOhVSxF'
+    event_id = manager.ParserManager.GetEventId(event)
+    self.assertEqual(event_id, u'AVbTlWpYFqBtaxOhVSxF')
+
+    event = dict(self._sys_log_event)
+    del event[u'uuid']
+    event_id = manager.ParserManager.GetEventId(event)
+    self.assertEqual(len(event_id), 32)
+    self.assertEqual(event_id, manager.ParserManager.GetEventId(dict(event)))
+
+    # Only fields locating the event in its source are hashed.
+    event[u'username'] = u'dean'
+    self.assertEqual(event_id, manager.ParserManager.GetEventId(event))
+
+    event[u'offset'] = 1
+    self.assertNotEqual(event_id, manager.ParserManager.GetEventId(event))
+
+    # Events without location fields are told apart by all their fields.
+    first = {u'data_type': u'x', u'timestamp': 1, u'user': u'alice'}
+    second = dict(first, user=u'bob')
+    event_id = manager.ParserManager.GetEventId(first)
+    self.assertNotEqual(event_id, manager.ParserManager.GetEventId(second))
+    first[manager.ParserManager.COUNT_KEY] = 5
+    self.assertEqual(event_id, manager.ParserManager.GetEventId(first))
+
   # Events I am testing on. Putting them in specific tests would be too ugly.
   _linux_utmp_event = {
       u'__container_type__': u'event',
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Tests for lib/pipeline.py."""
+
+import multiprocessing
+import unittest
+
+from eccemotus.lib import pipeline
+
+
+def _Double(batch):
+  """Returns doubled items of batch."""
+  return [item * 2 for item in batch]
+
+
+def _Odd(batch):
+  """Returns odd items of batch."""
+  return [item for item in batch if item % 2]
+
+
+def _Fail(batch):
+  """Raises ValueError for batch containing 500."""
+  if 500 in batch:
+    raise ValueError(u'500')
+  return batch
+
+
+class PipelineTest(unittest.TestCase):
+  """Tests running of staged pipelines."""
+
+  def _CreatePipeline(self, pool=None):
+    """Creates pipeline with stages doubling and filtering items.
+
+    Args:
+      pool (None|multiprocessing.Pool): pool of the doubling stage.
+
+    Returns:
+      pipeline.Pipeline: pipeline.
+    """
+    stages = pipeline.Pipeline(queue_size=2, batch_size=7)
+    stages.AddStage(u'odd', _Odd)
+    stages.AddStage(u'double', _Double, pool=pool)
+    return stages
+
+  def test_Run(self):
+    """Tests that items are processed in order."""
+    stages = self._CreatePipeline()
+    items = list(stages.Run(range(1000), consumer_name=u'list'))
+    self.assertEqual(items, _Double(_Odd(range(1000))))
+
+    self.assertEqual(
+        [metrics.name for metrics in stages.metrics],
+        [u'source', u'odd', u'double', u'list'])
+    source, odd, double, consumer = stages.metrics
+    self.assertEqual(source.items, 1000)
+    self.assertEqual(source.batches, 143)
+    self.assertEqual(odd.items, 500)
+    self.assertEqual(double.items, 500)
+    self.assertEqual(consumer.items, 500)
+    for metrics in stages.metrics[1:]:
+      self.assertEqual(metrics.batches, 143)
+      self.assertLessEqual(metrics.max_depth, 2)
+      self.assertLessEqual(metrics.GetAverageDepth(), 2)
+
+    self.assertEqual(list(stages.Run([])), [])
+
+  def test_RunPool(self):
+    """Tests stage running in a process pool."""
+    pool = multiprocessing.Pool(2)
+    try:
+      stages = self._CreatePipeline(pool=pool)
+      items = list(stages.Run(range(1000)))
+    finally:
+      pool.terminate()
+      pool.join()
+    self.assertEqual(items, _Double(_Odd(range(1000))))
+
+  def test_RunError(self):
+    """Tests that errors of stages and source are raised by Run."""
+    stages = pipeline.Pipeline(queue_size=1, batch_size=10)
+    stages.AddStage(u'fail', _Fail)
+    with self.assertRaises(ValueError):
+      list(stages.Run(range(10000)))
+    self.assertLess(stages.metrics[-1].items, 10000)
+
+    def _Source():
+      for item in range(100):
+        yield item
+      raise KeyError(u'source')
+
+    stages = pipeline.Pipeline(queue_size=1, batch_size=10)
+    with self.assertRaises(KeyError):
+      list(stages.Run(_Source()))
+
+  def test_Close(self):
+    """Tests that closing results stops the pipeline."""
+    stages = self._CreatePipeline()
+    items = stages.Run(range(100000))
+    self.assertEqual(next(items), 2)
+    items.close()
+    self.assertLess(stages.metrics[0].items, 100000)
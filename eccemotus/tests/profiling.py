@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Tests for lib/profiling.py."""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from eccemotus.lib import profiling
+
+
+def _Numbers(count):
+  """Yields numbers from 0 to count."""
+  for number in range(count):
+    yield number
+
+
+class ProfilerTest(unittest.TestCase):
+  """Tests profiling of stages."""
+
+  def setUp(self):
+    """Creates directory for profiles."""
+    self._directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    """Removes directory for profiles."""
+    shutil.rmtree(self._directory)
+
+  def test_Disabled(self):
+    """Tests that disabled profiler does not wrap anything."""
+    profiler = profiling.Profiler()
+    numbers = _Numbers(3)
+    self.assertIs(profiler.Iterate(u'numbers', numbers), numbers)
+    with profiler.Stage(u'stage'):
+      pass
+
+    output = io.StringIO()
+    profiler.PrintSummary(output)
+    self.assertEqual(output.getvalue(), u'')
+
+  def test_Profile(self):
+    """Tests nested stages and written statistics."""
+    profile_path = os.path.join(self._directory, u'profile')
+    profiler = profiling.Profiler(profile_path=profile_path, top=100)
+    profiler.Start()
+    with profiler.Stage(u'sum'):
+      numbers = profiler.Iterate(u'numbers', _Numbers(100))
+      total = sum(numbers)
+    profiler.Stop()
+
+    self.assertEqual(total, 4950)
+    self.assertEqual(
+        sorted(os.listdir(self._directory)),
+        [u'profile.numbers', u'profile.sum'])
+
+    output = io.StringIO()
+    profiler.PrintSummary(output)
+    summary = output.getvalue()
+    self.assertIn(u'  sum: ', summary)
+    self.assertIn(u'  numbers: ', summary)
+    self.assertIn(u'_Numbers', summary)
+
+  @unittest.skipIf(profiling.tracemalloc is None, u'tracemalloc is missing')
+  def test_MemoryProfile(self):
+    """Tests memory snapshots of stages."""
+    memory_profile_path = os.path.join(self._directory, u'memory')
+    profiler = profiling.Profiler(memory_profile_path=memory_profile_path)
+    profiler.Start()
+    with profiler.Stage(u'allocate'):
+      data = [list(range(10)) for _ in range(1000)]
+    profiler.Stop()
+
+    self.assertEqual(len(data), 1000)
+    self.assertEqual(os.listdir(self._directory), [u'memory.allocate'])
+    output = io.StringIO()
+    profiler.PrintSummary(output)
+    self.assertIn(u'peak traced memory', output.getvalue())
+
+  @unittest.skipIf(profiling.tracemalloc is not None, u'tracemalloc exists')
+  def test_MemoryProfileUnavailable(self):
+    """Tests that memory profiling requires tracemalloc."""
+    with self.assertRaises(ImportError):
+      profiling.Profiler(memory_profile_path=u'memory')
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Tests for lib/sqlite_pool.py."""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from eccemotus.lib import sqlite_pool
+
+
+class ConnectionPoolTest(unittest.TestCase):
+  """Tests sharing of sqlite connections."""
+
+  def setUp(self):
+    """Creates pool with a table."""
+    self._directory = tempfile.mkdtemp()
+    self._pool = sqlite_pool.ConnectionPool(
+        os.path.join(self._directory, u'test.sql'), max_readers=2)
+    with self._pool.Write() as c:
+      c.execute(u'CREATE TABLE items (value INTEGER)')
+
+  def tearDown(self):
+    """Closes pool and removes database."""
+    self._pool.Close()
+    shutil.rmtree(self._directory)
+
+  def _Count(self, connection):
+    """Counts rows of the table."""
+    return connection.execute(u'SELECT COUNT(*) FROM items').fetchone()[0]
+
+  def test_WAL(self):
+    """Tests that the database uses write-ahead logging."""
+    with self._pool.Read() as connection:
+      self.assertEqual(
+          connection.execute(u'PRAGMA journal_mode').fetchone()[0], u'wal')
+
+  def test_ReadWhileWriting(self):
+    """Tests that readers see committed data and are not blocked."""
+    with self._pool.Read() as connection:
+      with self._pool.Write() as c:
+        c.execute(u'INSERT INTO items VALUES (1)')
+        self.assertEqual(self._Count(connection), 0)
+      self.assertEqual(self._Count(connection), 1)
+
+  def test_WriteRollback(self):
+    """Tests that failed transactions are rolled back."""
+    with self.assertRaises(ValueError):
+      with self._pool.Write() as c:
+        c.execute(u'INSERT INTO items VALUES (1)')
+        raise ValueError(u'failed')
+    with self._pool.Read() as connection:
+      self.assertEqual(self._Count(connection), 0)
+
+  def test_ReadOnly(self):
+    """Tests that read connections refuse writes."""
+    with self._pool.Read() as connection:
+      with self.assertRaises(sqlite3.OperationalError):
+        connection.execute(u'INSERT INTO items VALUES (1)')
+
+  def test_Acquire(self):
+    """Tests reusing connections and waiting for a free one."""
+    first = self._pool.Acquire()
+    second = self._pool.Acquire()
+    self.assertIsNot(first, second)
+
+    acquired = []
+    thread = threading.Thread(
+        target=lambda: acquired.append(self._pool.Acquire()))
+    thread.start()
+    self._pool.Release(first)
+    thread.join()
+    self.assertEqual(acquired, [first])
+
+    self._pool.Release(first)
+    self._pool.Release(second)
+    self.assertEqual(self._pool.GetStatistics(), {
+        u'idle_readers': 2, u'max_readers': 2, u'readers': 2})
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 """Tests for utils."""
 
+import re
 import unittest
 
 from eccemotus.lib.parsers import utils
@@ -51,3 +52,38 @@ class UtilsTest(unittest.TestCase):
     plaso_file_name = utils.GetImageName(event)
     expected_plso_file_name = u'image.dd/images/user/home/'
     self.assertEqual(plaso_file_name, expected_plso_file_name)
+
+  def test_ParseStringList(self):
+    """Tests parsing of string representation of list of strings."""
+    strings = utils.ParseStringList(
+        u"[u'S-1-0-0', u'-', u'NtLmSsp ', u'192.168.1.11']")
+    self.assertEqual(strings, [u'S-1-0-0', u'-', u'NtLmSsp ', u'192.168.1.11'])
+
+    strings = utils.ParseStringList(u'["a", \'b\']')
+    self.assertEqual(strings, [u'a', u'b'])
+
+    strings = utils.ParseStringList(u' [ ] ')
+    self.assertEqual(strings, [])
+
+    strings = utils.ParseStringList(u"[u'it\\'s', u'caf\\xe9']")
+    self.assertEqual(strings, [u'it\'s', u'caf\xe9'])
+
+    for text in [u'S-1-0-0', u'[1, 2]', u"[u'a'] + [u'b']", u"[u'a'",
+                 u"[__import__('os')]"]:
+      with self.assertRaises(ValueError):
+        utils.ParseStringList(text)
+
+  def test_MessageMatcher(self):
+    """Tests prefiltered and cached message matching."""
+    matcher = utils.MessageMatcher(
+        u'Accepted ', re.compile(r'Accepted \S+ for (?P<user>\S+)'),
+        [u'user'], cache_size=2)
+
+    self.assertIsNone(matcher.Match(u'session opened for user root'))
+    self.assertIsNone(matcher.Match(u'Accepted '))
+    self.assertEqual(
+        matcher.Match(u'[sshd] Accepted password for dean'), (u'dean',))
+    self.assertEqual(
+        matcher.Match(u'[sshd] Accepted password for dean'), (u'dean',))
+    self.assertEqual(
+        matcher.Match(u'Accepted publickey for root'), (u'root',))
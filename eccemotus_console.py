@@ -3,30 +3,86 @@
 
 from __future__ import print_function
 import argparse
-import json
+import calendar
+import datetime
+import functools
 import os
 import shutil
+import sys
 from  eccemotus import eccemotus_lib as eccemotus  # pylint: disable=no-name-in-module
+from eccemotus.lib import event_store
+from eccemotus.lib import graph as graph_lib
+from eccemotus.lib import graph_stream
+from eccemotus.lib import json_codec
+from eccemotus.lib import parse_cache
+from eccemotus.lib import profiling
+from eccemotus.lib.parsers import manager
 
 
-def CreateGraph(generator, args):
+def CreateGraph(generator, args, decoder=None, cache_key=None):
   """Handles creating and saving graph from data generator.
 
   Args:
-    generator (iterable[dict]): plaso events, usually
-        eccemotus.FileDataGenerator or eccemotus.ElasticDataGenerator.
+    generator (iterable): plaso events, usually eccemotus.FileDataGenerator
+        or eccemotus.ElasticDataGenerator, or raw items for decoder.
     args (argparse.Namespace): command line arguments.
+    decoder (None|callable): transforms a list of raw items to a list of
+        events, used only with --pipeline.
+    cache_key (object): JSON serializable description of the input for
+        --parse-cache.
   """
-  graph = eccemotus.GetGraph(generator, args.verbose)
-  serialized = graph.MinimalSerialize()
-
-  with open(args.output, u'w') as output_file:
-    if args.javascript:
-      print(u'var graph=', end='', file=output_file)
-      json.dump(serialized, output_file)
-      print(u';', file=output_file)
+  cache = None
+  if args.parse_cache:
+    cache = parse_cache.ParsedEventCache(args.parse_cache, cache_key)
+
+  store = None
+  if args.out_of_core:
+    store = event_store.EventStore()
+
+  try:
+    if args.pipeline:
+      with args.profiler.Stage(u'pipeline'):
+        graph = eccemotus.GetGraphPipelined(
+            generator, decoder=decoder, verbose=args.verbose,
+            deduplicate=args.deduplicate, workers=args.workers,
+            metrics_output=sys.stderr, event_store=store, parse_cache=cache)
     else:
-      json.dump(serialized, output_file)
+      graph = eccemotus.GetGraph(
+          generator, args.verbose, args.deduplicate, profiler=args.profiler,
+          event_store=store, parse_cache=cache)
+    SaveGraph(graph, args)
+  finally:
+    if store is not None:
+      store.Close()
+
+
+def SaveGraph(graph, args):
+  """Saves graph to output file.
+
+  Args:
+    graph (graph_lib.Graph): graph to be saved.
+    args (argparse.Namespace): command line arguments.
+  """
+  if args.max_nodes:
+    graph, report = graph.Compact(args.max_nodes, args.compact_by)
+    print(
+        u'Compacted graph: kept {0:d} nodes and {1:d} access edges, dropped '
+        u'{2:d} nodes ({3:d} users collapsed into cluster centers) and {4:d} '
+        u'access edges with {5:d} events.'.format(
+            report.kept_nodes, report.kept_edges, report.dropped_nodes,
+            report.collapsed_nodes, report.dropped_edges,
+            report.dropped_events))
+
+  with args.profiler.Stage(u'serialize'):
+    with open(args.output, u'wb') as output_file:
+      if args.javascript:
+        output_file.write(b'var graph=')
+      if graph.event_store is None:
+        json_codec.Dump(graph.Serialize(args.schema), output_file)
+      else:
+        graph_stream.WriteGraph(graph, output_file, args.schema)
+      if args.javascript:
+        output_file.write(b';\n')
 
 
 def ElasticToGraph(args):
@@ -36,8 +92,20 @@ def ElasticToGraph(args):
     args (argparse.Namespace): command line arguments.
   """
   client = eccemotus.GetClient(args.host, args.port)
-  generator = eccemotus.ElasticDataGenerator(client, args.indices, args.verbose)
-  CreateGraph(generator, args)
+  if args.aggregate:
+    generator = eccemotus.ElasticAggregatedDataGenerator(
+        client, args.indices, args.aggregate * 1000000, verbose=args.verbose,
+        since=args.since, until=args.until)
+  else:
+    generator = eccemotus.ElasticDataGenerator(
+        client, args.indices, verbose=args.verbose, since=args.since,
+        until=args.until)
+  # Elasticsearch gives no fingerprint of indices, remove the cache when
+  # they change.
+  cache_key = [
+      u'elasticsearch', args.host, args.port, sorted(args.indices),
+      args.since, args.until, args.aggregate]
+  CreateGraph(generator, args, cache_key=cache_key)
 
 
 def FileToGraph(args):
@@ -46,8 +114,78 @@ def FileToGraph(args):
   Args:
     args (argparse.Namespace): command line arguments.
   """
-  generator = eccemotus.FileDataGenerator(args.input, args.verbose)
-  CreateGraph(generator, args)
+  data_types = manager.ParserManager.GetParsedTypes()
+  cache_key = None
+  if args.parse_cache and not os.path.isfile(args.input):
+    # Fingerprinting would consume the input of a pipe.
+    print(
+        u'Parse cache is not used, {0:s} is not a regular file.'.format(
+            args.input), file=sys.stderr)
+    args.parse_cache = None
+  if args.parse_cache:
+    cache_key = [
+        u'file', parse_cache.GetFileFingerprint(args.input), args.since,
+        args.until, sorted(data_types)]
+
+  if args.pipeline:
+    generator = eccemotus.FileLineGenerator(
+        args.input, args.verbose, data_types=data_types, since=args.since,
+        until=args.until)
+    decoder = functools.partial(
+        eccemotus.DecodeLines, since=args.since, until=args.until)
+    CreateGraph(generator, args, decoder=decoder, cache_key=cache_key)
+  else:
+    generator = eccemotus.FileDataGenerator(
+        args.input, args.verbose, data_types=data_types, since=args.since,
+        until=args.until)
+    CreateGraph(generator, args, cache_key=cache_key)
+
+
+# Accepted formats of UTC date and time on command line.
+_TIME_FORMATS = (
+    u'%Y-%m-%d', u'%Y-%m-%dT%H:%M:%S', u'%Y-%m-%d %H:%M:%S',
+    u'%Y-%m-%dT%H:%M:%S.%f', u'%Y-%m-%d %H:%M:%S.%f')
+
+
+def ParseTimestamp(text):
+  """Parses time given on command line.
+
+  Args:
+    text (str): plaso timestamp (microseconds since epoch) or UTC date and
+        time (e.g. 2015-08-24 or 2015-08-24T10:30:00).
+
+  Returns:
+    int: timestamp in microseconds since epoch.
+
+  Raises:
+    argparse.ArgumentTypeError: if the text is not a valid time.
+  """
+  if text.lstrip(u'-').isdigit():
+    return int(text)
+
+  for time_format in _TIME_FORMATS:
+    try:
+      parsed = datetime.datetime.strptime(text, time_format)
+    except ValueError:
+      continue
+    return (calendar.timegm(parsed.timetuple()) * 1000000 +
+            parsed.microsecond)
+
+  raise argparse.ArgumentTypeError(u'Invalid time: {0:s}'.format(text))
+
+
+def Merge(args):
+  """Merges graphs created from separate exports into one graph.
+
+  Partial graphs can be created in parallel (e.g. one f2g per host's export on
+  different cores or machines) and reduced by this command.
+
+  Args:
+    args (argparse.Namespace): command line arguments.
+  """
+  with args.profiler.Stage(u'merge'):
+    graph = eccemotus.MergeGraphFiles(args.inputs, args.deduplicate)
+  SaveGraph(graph, args)
 
 
 def Render(args):
@@ -81,6 +219,9 @@ def Render(args):
   shutil.copy(
       os.path.join(base_static, u'lateral-map.js'),
       os.path.join(static, u'lateral-map.js'))
+  shutil.copy(
+      os.path.join(base_static, u'lateral-worker.js'),
+      os.path.join(static, u'lateral-worker.js'))
 
   print(u'open {0:s}'.format(os.path.join(directory, u'index.html')))
 
@@ -93,9 +234,14 @@ def Summary(args):
   Args:
     args (argparse.Namespace): command line arguments.
   """
-  graph = eccemotus.LoadGraph(args.input)
-  graph.Finalize()
-  summary = graph.Summary()
+  with args.profiler.Stage(u'summary'):
+    if args.streaming:
+      summary = eccemotus.GetStreamingSummary(args.input)
+    else:
+      graph = eccemotus.LoadGraph(args.input)
+      graph.Finalize()
+      summary = graph.Summary()
+
   for cluster_id in sorted(summary):
     print(u'Cluster #{0:d}'.format(cluster_id))
     intend = u'  '
@@ -109,6 +255,19 @@ def Summary(args):
 
 if __name__ == u'__main__':
   parser = argparse.ArgumentParser(prog=u'eccemotus')
+
+  profile_help = (
+      u'Profiles stages of the command (e.g. generator, parse, graph and '
+      u'serialize for f2g) with cProfile. Statistics of every stage are '
+      u'written to PROFILE.<stage>.')
+  parser.add_argument(u'--profile', action=u'store', help=profile_help)
+
+  memory_profile_help = (
+      u'Traces memory allocations with tracemalloc (python 3) and writes '
+      u'snapshot at the end of every stage to MEMORY_PROFILE.<stage>.')
+  parser.add_argument(
+      u'--memory-profile', action=u'store', help=memory_profile_help)
+
   subparsers = parser.add_subparsers()
 
   # elastic-search to graph
@@ -133,6 +292,88 @@ if __name__ == u'__main__':
   verbose_help = u'Print progress.'
   sub_e2g.add_argument(u'--verbose', action=u'store_true', help=verbose_help)
 
+  deduplicate_help = (
+      u'Add events with the same id (uuid or timesketch_id) to an edge only '
+      u'once. Useful for overlapping exports.')
+  sub_e2g.add_argument(
+      u'--deduplicate', action=u'store_true', help=deduplicate_help)
+
+  schema_help = (
+      u'Version of JSON schema of the output. Version 2 stores events of '
+      u'links as arrays of ids and delta encoded timestamps, which is several '
+      u'times smaller. Use 1 for tools that do not read version 2.')
+  schema_choices = [graph_lib.SCHEMA_V1, graph_lib.SCHEMA_V2]
+  sub_e2g.add_argument(
+      u'--schema', action=u'store', type=int, default=graph_lib.SCHEMA_V2,
+      choices=schema_choices, help=schema_help)
+
+  max_nodes_help = (
+      u'Keeps only the most important access edges and clusters they touch, '
+      u'so the graph has at most this many nodes. Useful for rendering.')
+  sub_e2g.add_argument(
+      u'--max-nodes', action=u'store', type=int, default=0,
+      help=max_nodes_help)
+
+  compact_by_help = (
+      u'Ranking of access edges for --max-nodes: by number of events '
+      u'(count) or by the latest event (recency).')
+  compact_by_choices = [u'count', u'recency']
+  sub_e2g.add_argument(
+      u'--compact-by', action=u'store', default=u'count',
+      choices=compact_by_choices, help=compact_by_help)
+
+  since_help = (
+      u'Skip events older than this time, given as a plaso timestamp '
+      u'(microseconds) or UTC date and time (YYYY-MM-DD[THH:MM:SS]). Files '
+      u'sorted by timestamp (psort output) are read only in the time range, '
+      u'elasticsearch gets a range filter. Sortedness is only checked on a '
+      u'sample of lines, so the input file must be fully sorted: events of a '
+      u'file that only looks sorted may be missed.')
+  sub_e2g.add_argument(
+      u'--since', action=u'store', type=ParseTimestamp, default=None,
+      help=since_help)
+
+  until_help = u'Skip events newer than this time, see --since.'
+  sub_e2g.add_argument(
+      u'--until', action=u'store', type=ParseTimestamp, default=None,
+      help=until_help)
+
+  pipeline_help = (
+      u'Read, decode and parse events concurrently in stages connected by '
+      u'bounded queues and print per stage metrics.')
+  sub_e2g.add_argument(
+      u'--pipeline', action=u'store_true', help=pipeline_help)
+
+  workers_help = (
+      u'Number of processes for decoding and parsing with --pipeline (0 '
+      u'runs them in threads).')
+  sub_e2g.add_argument(
+      u'--workers', action=u'store', type=int, default=0, help=workers_help)
+
+  out_of_core_help = (
+      u'Store events of edges in a temporary sqlite database (in TMPDIR) '
+      u'instead of memory. Only nodes and edges are kept in memory, events '
+      u'are read back while the graph is written.')
+  sub_e2g.add_argument(
+      u'--out-of-core', action=u'store_true', help=out_of_core_help)
+
+  parse_cache_help = (
+      u'Directory with cache of parsed events. The first build writes parsed '
+      u'events there, later builds from the same input (file content or '
+      u'elasticsearch indices) with the same parsers and options read them '
+      u'instead of decoding and parsing. Remove the cache of elasticsearch '
+      u'indices when they change.')
+  sub_e2g.add_argument(
+      u'--parse-cache', action=u'store', default=None, help=parse_cache_help)
+
+  aggregate_help = (
+      u'Aggregate events of structured data types (linux:utmp:event) in '
+      u'elasticsearch into time buckets of AGGREGATE seconds instead of '
+      u'reading every event. Edges get one event per bucket with count.')
+  sub_e2g.add_argument(
+      u'--aggregate', action=u'store', type=int, default=0,
+      help=aggregate_help)
+
   output_help = u'Output file name.'
   sub_e2g.add_argument(
       u'--output', action=u'store', help=output_help, required=True)
@@ -151,11 +392,74 @@ if __name__ == u'__main__':
 
   sub_f2g.add_argument(u'--verbose', action=u'store_true', help=verbose_help)
 
+  sub_f2g.add_argument(
+      u'--deduplicate', action=u'store_true', help=deduplicate_help)
+
+  sub_f2g.add_argument(
+      u'--schema', action=u'store', type=int, default=graph_lib.SCHEMA_V2,
+      choices=schema_choices, help=schema_help)
+
+  sub_f2g.add_argument(
+      u'--max-nodes', action=u'store', type=int, default=0,
+      help=max_nodes_help)
+
+  sub_f2g.add_argument(
+      u'--compact-by', action=u'store', default=u'count',
+      choices=compact_by_choices, help=compact_by_help)
+
+  sub_f2g.add_argument(
+      u'--since', action=u'store', type=ParseTimestamp, default=None,
+      help=since_help)
+
+  sub_f2g.add_argument(
+      u'--until', action=u'store', type=ParseTimestamp, default=None,
+      help=until_help)
+
+  sub_f2g.add_argument(
+      u'--pipeline', action=u'store_true', help=pipeline_help)
+
+  sub_f2g.add_argument(
+      u'--workers', action=u'store', type=int, default=0, help=workers_help)
+
+  sub_f2g.add_argument(
+      u'--out-of-core', action=u'store_true', help=out_of_core_help)
+
+  sub_f2g.add_argument(
+      u'--parse-cache', action=u'store', default=None, help=parse_cache_help)
+
   input_help = u'Input file in json_line format. See plaso json_line.'
   sub_f2g.add_argument(u'input', action=u'store', help=input_help)
 
   sub_f2g.add_argument(u'output', action=u'store', help=output_help)
 
+  merge_help = u'Merges JSON serialized graphs (outputs of f2g or e2g).'
+  sub_merge = subparsers.add_parser(u'merge', help=merge_help)
+  sub_merge.set_defaults(routine=Merge)
+
+  sub_merge.add_argument(
+      u'--javascript', action=u'store_true', help=javascript_help)
+
+  sub_merge.add_argument(
+      u'--deduplicate', action=u'store_true', help=deduplicate_help)
+
+  sub_merge.add_argument(
+      u'--schema', action=u'store', type=int, default=graph_lib.SCHEMA_V2,
+      choices=schema_choices, help=schema_help)
+
+  sub_merge.add_argument(
+      u'--max-nodes', action=u'store', type=int, default=0,
+      help=max_nodes_help)
+
+  sub_merge.add_argument(
+      u'--compact-by', action=u'store', default=u'count',
+      choices=compact_by_choices, help=compact_by_help)
+
+  sub_merge.add_argument(u'output', action=u'store', help=output_help)
+
+  inputs_help = u'JSON serialized graphs to be merged.'
+  sub_merge.add_argument(
+      u'inputs', metavar=u'input', nargs=u'+', help=inputs_help)
+
   render_help = u'Creates html visualization.'
   sub_render = subparsers.add_parser(u'render', help=render_help)
   sub_render.set_defaults(routine=Render)
@@ -173,5 +477,23 @@ if __name__ == u'__main__':
   input_help = u'JSON serialized graph (output of f2g or e2g).'
   sub_summary.add_argument(u'input', action=u'store', help=input_help)
 
+  streaming_help = (
+      u'Reads the graph incrementally instead of loading it into memory. '
+      u'Works also with --javascript output.')
+  sub_summary.add_argument(
+      u'--streaming', action=u'store_true', default=False,
+      help=streaming_help)
+
   parsed_args = parser.parse_args()
-  parsed_args.routine(parsed_args)
+  try:
+    parsed_args.profiler = profiling.Profiler(
+        parsed_args.profile, parsed_args.memory_profile)
+  except ImportError as exception:
+    parser.error(u'{0!s}'.format(exception))
+
+  parsed_args.profiler.Start()
+  try:
+    parsed_args.routine(parsed_args)
+  finally:
+    parsed_args.profiler.Stop()
+    parsed_args.profiler.PrintSummary(sys.stderr)
@@ -5,35 +5,94 @@ This code also serves as an example usage of eccemotus library. Be aware that it
 lacks a lot of graceful error handling and recovery.
 """
 
-import json
+import gzip
+import hashlib
+import io
 import sqlite3
-from flask import Flask, g, jsonify, redirect, render_template, request, url_for
+import threading
+from flask import (
+    Flask, Response, abort, g, redirect, render_template, request, url_for)
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+try:
+  import waitress
+except ImportError:
+  waitress = None
 
 from eccemotus import eccemotus_lib as eccemotus
+from eccemotus.lib import graph as graph_lib
+from eccemotus.lib import graph_cache as graph_cache_lib
+from eccemotus.lib import json_codec
+from eccemotus.lib import sqlite_pool
 
 app = Flask(__name__)
 
+# Views of graph with payloads compressed when the graph is added: the whole
+# graph and the graph with all clusters collapsed (the first view in browser).
+VIEW_FULL = u'full'
+VIEW_COLLAPSED = u'collapsed'
+
+# Compression levels of stored payloads and of payloads compressed per
+# request.
+GZIP_LEVEL = 9
+GZIP_LEVEL_DYNAMIC = 6
+BROTLI_QUALITY = 9
+BROTLI_QUALITY_DYNAMIC = 5
+
+# Default limit of estimated memory used by loaded graphs (512 MiB).
+GRAPH_CACHE_SIZE = 512 * 1024 * 1024
+
+# Loaded graphs by (graph id, revision), shared by all requests.
+graph_cache = graph_cache_lib.GraphCache(GRAPH_CACHE_SIZE)
+
+# Default number of threads of the production server, which is also the
+# number of read connections to the database.
+THREADS = 8
+
+_database_pool_lock = threading.Lock()
+
 # Routines for managing database.
 
+def GetDatabasePool():
+  """Returns pool of connections to the database, opens it on the first call.
+
+  Returns:
+    sqlite_pool.ConnectionPool: connections to database in app.config.
+  """
+  with _database_pool_lock:
+    pool = app.extensions.get(u'database_pool')
+    if pool is None:
+      pool = sqlite_pool.ConnectionPool(
+          app.config[u'DATABASE'],
+          max_readers=app.config.get(u'DATABASE_READERS', THREADS),
+          row_factory=sqlite3.Row)
+      app.extensions[u'database_pool'] = pool
+    return pool
+
 def GetDatabase():
-  """Connect to database or reuse existing connection for this session.
+  """Takes read connection from the pool or reuses it in this session.
+
+  Writes go through GetDatabasePool().Write().
 
   Returns:
-    sqlite3.Connection: access to database.
+    sqlite3.Connection: read only access to database.
   """
   database = getattr(g, u'database', None)
   if database is None:
-    database = sqlite3.connect(app.config[u'DATABASE'])
-    database.row_factory = sqlite3.Row
+    database = GetDatabasePool().Acquire()
     g.database = database
   return database
 
 @app.teardown_appcontext
 def CloseConnection(_):
-  """Closes database connection if it was opened."""
+  """Returns read connection to the pool if it was taken."""
   database = getattr(g, u'database', None)
   if database is not None:
-    database.close()
+    GetDatabasePool().Release(database)
 
 @app.route(u'/drop')
 def Drop():
@@ -44,10 +103,9 @@ def Drop():
   Return:
     str: u'dropped'.
   """
-  database = GetDatabase()
-  c = database.cursor()
-  c.execute(u'''DROP TABLE IF EXISTS graphs''')
-  database.commit()
+  with GetDatabasePool().Write() as c:
+    c.execute(u'''DROP TABLE IF EXISTS graphs''')
+    c.execute(u'''DROP TABLE IF EXISTS payloads''')
   return u'dropped'
 
 @app.route(u'/prepare')
@@ -57,13 +115,176 @@ def Prepare():
   Returns:
     str: u'prepared'.
   """
-  database = GetDatabase()
-  c = database.cursor()
-  c.execute((u'''CREATE TABLE IF NOT EXISTS graphs'''
-             u'''(id INTEGER PRIMARY KEY, name TEXT, graph BLOB )'''))
-  database.commit()
+  with GetDatabasePool().Write() as c:
+    c.execute((u'''CREATE TABLE IF NOT EXISTS graphs'''
+               u'''(id INTEGER PRIMARY KEY, name TEXT, graph BLOB, '''
+               u'''revision TEXT)'''))
+    # Databases created before revisions get the column, payloads of their
+    # graphs are created on the first request.
+    columns = [row[1] for row in c.execute(u'PRAGMA table_info(graphs)')]
+    if u'revision' not in columns:
+      c.execute(u'ALTER TABLE graphs ADD COLUMN revision TEXT')
+    c.execute((u'''CREATE TABLE IF NOT EXISTS payloads'''
+               u'''(graph_id INTEGER, view TEXT, encoding TEXT, '''
+               u'''payload BLOB, PRIMARY KEY (graph_id, view, encoding))'''))
   return u'prepared'
 
+# Compressed payloads.
+
+def GzipCompress(data, level=GZIP_LEVEL):
+  """Compresses data to gzip format.
+
+  Args:
+    data (bytes): data.
+    level (int): compression level.
+
+  Returns:
+    bytes: gzip compressed data. The header has no time, so the same data
+        gives the same bytes.
+  """
+  output = io.BytesIO()
+  with gzip.GzipFile(
+      fileobj=output, mode=u'wb', compresslevel=level, mtime=0) as gzip_file:
+    gzip_file.write(data)
+  return output.getvalue()
+
+def BrotliCompress(data, quality=BROTLI_QUALITY):
+  """Compresses data to brotli format.
+
+  Args:
+    data (bytes): data.
+    quality (int): compression quality.
+
+  Returns:
+    bytes: brotli compressed data.
+  """
+  return brotli.compress(data, quality=quality)
+
+def GetEncodings():
+  """Returns supported content encodings in order of preference.
+
+  Returns:
+    list[str]: encodings, br only if brotli is installed.
+  """
+  encodings = [u'gzip', u'identity']
+  if brotli is not None:
+    encodings.insert(0, u'br')
+  return encodings
+
+def Compress(data, encoding, dynamic=False):
+  """Encodes data with content encoding.
+
+  Args:
+    data (bytes): data.
+    encoding (str): content encoding, one of GetEncodings().
+    dynamic (bool): whether the data is compressed per request, which uses
+        faster compression.
+
+  Returns:
+    bytes: encoded data.
+  """
+  if encoding == u'br':
+    return BrotliCompress(
+        data, BROTLI_QUALITY_DYNAMIC if dynamic else BROTLI_QUALITY)
+  if encoding == u'gzip':
+    return GzipCompress(data, GZIP_LEVEL_DYNAMIC if dynamic else GZIP_LEVEL)
+  return data
+
+def GetPayload(data):
+  """Serializes response of graph API.
+
+  Args:
+    data (dict|str): serialized graph or its JSON.
+
+  Returns:
+    bytes: utf-8 encoded JSON object with graph.
+  """
+  if not isinstance(data, dict):
+    return (u'{"graph": ' + data + u'}').encode(u'utf-8')
+  return json_codec.DumpBytes({u'graph': data})
+
+def CreatePayloads(graph):
+  """Loads graph and compresses payloads of its views.
+
+  This is done before a write transaction, so that other writers do not wait
+  for compression.
+
+  Args:
+    graph (str): JSON serialized graph, as stored in the database.
+
+  Returns:
+    tuple[str, graph_lib.Graph, list[tuple[str, str, bytes]]]: revision of the
+        graph (hash of its serialization), finalized graph and payloads as
+        view, encoding and compressed data.
+  """
+  revision = hashlib.sha1(graph.encode(u'utf-8')).hexdigest()
+  loaded_graph = graph_lib.LoadGraph(json_codec.Loads(graph))
+  loaded_graph.Finalize()
+  views = {
+      VIEW_FULL: GetPayload(graph),
+      VIEW_COLLAPSED: GetPayload(
+          loaded_graph.CollapseClusters().Serialize())}
+  payloads = [
+      (view, encoding, Compress(payload, encoding))
+      for view, payload in views.items() for encoding in GetEncodings()]
+  return revision, loaded_graph, payloads
+
+def WritePayloads(c, graph_id, revision, payloads):
+  """Replaces revision and payloads of graph in the database.
+
+  Args:
+    c (sqlite3.Cursor): cursor of a write transaction.
+    graph_id (int): id of graph in the database.
+    revision (str): revision of the graph.
+    payloads (list[tuple[str, str, bytes]]): payloads from CreatePayloads.
+  """
+  c.execute(u'DELETE FROM payloads WHERE graph_id = ?', (graph_id, ))
+  c.executemany(
+      u'INSERT INTO payloads (graph_id, view, encoding, payload) '
+      u'VALUES (?, ?, ?, ?)',
+      [(graph_id, view, encoding, sqlite3.Binary(payload))
+       for view, encoding, payload in payloads])
+  c.execute(
+      u'UPDATE graphs SET revision = ? WHERE id = ?', (revision, graph_id))
+
+def StorePayloads(graph_id, graph):
+  """Stores revision and compressed payloads of views of graph.
+
+  Args:
+    graph_id (int): id of graph in the database.
+    graph (str): JSON serialized graph, as stored in the database.
+
+  Returns:
+    str: revision of the graph, hash of its serialization.
+  """
+  revision, loaded_graph, payloads = CreatePayloads(graph)
+  with GetDatabasePool().Write() as c:
+    WritePayloads(c, graph_id, revision, payloads)
+  graph_cache.Put((graph_id, revision), loaded_graph)
+  return revision
+
+def GetLoadedGraph(graph_id, revision):
+  """Returns graph from the cache or loads it from the database.
+
+  Cached graphs are finalized and must not be modified.
+
+  Args:
+    graph_id (int): id of graph in the database.
+    revision (str): revision of the graph.
+
+  Returns:
+    graph_lib.Graph: finalized graph.
+  """
+  def Load():
+    """Loads and finalizes graph."""
+    c = GetDatabase().cursor()
+    c.execute(u'SELECT graph from graphs where id = ?', (graph_id, ))
+    graph = graph_lib.LoadGraph(json_codec.Loads(c.fetchone()['graph']))
+    graph.Finalize()
+    return graph
+
+  return graph_cache.GetOrLoad((graph_id, revision), Load)
+
 # Views.
 
 @app.route(u'/graph/<graph_id>')
@@ -88,26 +309,113 @@ def ViewGraph(graph_id):
   return render_template(u'graph.html', graph=graphs[0])
 
 
+def ParseClusterIds(text):
+  """Parses comma separated list of cluster ids.
+
+  Args:
+    text (str): cluster ids, e.g. u'1,5,7'.
+
+  Returns:
+    list[int]: cluster ids.
+
+  Raises:
+    ValueError: if some id is not an integer.
+  """
+  return [int(cluster_id) for cluster_id in text.split(u',') if cluster_id]
+
 @app.route(u'/api/graph/<graph_id>')
 def GetGraph(graph_id):
   """Returns graph data for graph with graph_id.
 
+  The whole graph and the graph with all clusters collapsed are served from
+  payloads compressed when the graph was added, other views are compressed
+  per request. The best encoding accepted by the client is used (br, gzip or
+  identity). Responses have strong ETags derived from the graph revision,
+  view and encoding, so a cached response is revalidated with 304.
+
+  Query parameters:
+    collapse: if set (e.g. collapse=1), every cluster is returned as a single
+        node (see Graph.CollapseClusters).
+    expand: comma separated ids of clusters (full_cluster property of nodes)
+        that are not collapsed.
+
   Args:
     graph_id (str|int): id of graph to retrieve from the database.
 
   Returns:
-    str: jsonified graph data.
+    flask.Response: JSON object with graph data under "graph" key.
   """
+  try:
+    graph_id = int(graph_id)
+  except ValueError:
+    abort(404)
   database = GetDatabase()
   c = database.cursor()
-  c.execute(u'SELECT id, name, graph from graphs where id = ?', (graph_id, ))
-  graph = c.fetchall()
-  if len(graph) != 1:
-    return None
-
+  c.execute(u'SELECT revision from graphs where id = ?', (graph_id, ))
+  graphs = c.fetchall()
+  if len(graphs) != 1:
+    abort(404)
   # The string is not unicode because Row cursor can not be indexed with
   # unicode.
-  return jsonify(graph=json.loads(graph[0]['graph']))
+  revision = graphs[0]['revision']
+  if revision is None:
+    c.execute(u'SELECT graph from graphs where id = ?', (graph_id, ))
+    revision = StorePayloads(graph_id, c.fetchone()['graph'])
+
+  view = VIEW_FULL
+  expanded_clusters = []
+  if request.args.get(u'collapse'):
+    try:
+      expanded_clusters = ParseClusterIds(request.args.get(u'expand', u''))
+    except ValueError:
+      abort(400)
+    view = VIEW_COLLAPSED
+    if expanded_clusters:
+      view = u'{0:s}-{1:s}'.format(VIEW_COLLAPSED, u','.join(
+          str(cluster_id) for cluster_id in sorted(set(expanded_clusters))))
+
+  encoding = request.accept_encodings.best_match(
+      GetEncodings(), default=u'identity')
+  etag = u'{0:s}-{1:s}-{2:s}'.format(revision, view, encoding)
+  # If-None-Match is compared weakly and "*" matches any current
+  # representation (RFC 7232, section 3.2).
+  if_none_match = request.if_none_match
+  if if_none_match.star_tag or if_none_match.contains_weak(etag):
+    response = Response(status=304)
+  else:
+    c.execute(
+        u'SELECT payload from payloads where graph_id = ? and view = ? and '
+        u'encoding = ?', (graph_id, view, encoding))
+    stored = c.fetchone()
+    if stored is not None:
+      payload = bytes(stored['payload'])
+    else:
+      collapsed_graph = GetLoadedGraph(graph_id, revision).CollapseClusters(
+          expanded_clusters)
+      payload = Compress(
+          GetPayload(collapsed_graph.Serialize()), encoding, dynamic=True)
+    response = Response(payload, mimetype=u'application/json')
+    if encoding != u'identity':
+      response.headers[u'Content-Encoding'] = encoding
+
+  response.set_etag(etag)
+  response.headers[u'Vary'] = u'Accept-Encoding'
+  # Cached responses are always revalidated, a rebuilt graph with the same
+  # id gets a new revision.
+  response.headers[u'Cache-Control'] = u'no-cache'
+  return response
+
+@app.route(u'/api/cache')
+def GetCacheStatistics():
+  """Returns statistics of the cache of loaded graphs.
+
+  Returns:
+    flask.Response: JSON object with numbers of cached graphs, hits, misses
+        and evictions and estimated and maximum size in bytes.
+  """
+  return Response(
+      json_codec.DumpBytes(graph_cache.GetStatistics()),
+      mimetype=u'application/json')
 
 def ListGraphs():
   """Lists graphs in database
@@ -124,14 +432,19 @@ def ListGraphs():
 def AddGraph(name, graph):
   """Adds graph to database.
 
+  The graph and its payloads are written in one transaction, so readers
+  never see a graph without payloads.
+
   Args:
     name (str): graph name.
     graph (str): duped JSON representation of graph.
   """
-  database = GetDatabase()
-  c = database.cursor()
-  c.execute(u'INSERT INTO graphs (name, graph) VALUES (?,?)', (name, graph))
-  database.commit()
+  revision, loaded_graph, payloads = CreatePayloads(graph)
+  with GetDatabasePool().Write() as c:
+    c.execute(u'INSERT INTO graphs (name, graph) VALUES (?,?)', (name, graph))
+    graph_id = c.lastrowid
+    WritePayloads(c, graph_id, revision, payloads)
+  graph_cache.Put((graph_id, revision), loaded_graph)
 
 @app.route(u'/', methods=[u'GET', u'POST'])
 def Index():
@@ -153,7 +466,7 @@ def Index():
       graph_name = request.form[u'name']
       data_generator = eccemotus.FileDataGenerator(fname, verbose=True)
       graph = eccemotus.GetGraph(data_generator, verbose=True)
-      graph_JSON = json.dumps(graph.MinimalSerialize())
+      graph_JSON = json_codec.Dumps(graph.Serialize())
       AddGraph(graph_name, graph_JSON)
       return redirect(url_for(u'Index'))
 
@@ -168,7 +481,7 @@ def Index():
       data_generator = eccemotus.ElasticDataGenerator(
           client, indexes, verbose=True)
       graph = eccemotus.GetGraph(data_generator, verbose=True)
-      graph_JSON = json.dumps(graph.MinimalSerialize())
+      graph_JSON = json_codec.Dumps(graph.Serialize())
       AddGraph(graph_name, graph_JSON)
       return redirect(url_for(u'Index'))
 
@@ -176,17 +489,35 @@ def Index():
   return render_template(u'index.html', graphs=graphs)
 
 
-def Run(host=u'127.0.0.1', port=5012, database=u'eccemotus.sql'):
+def Run(
+    host=u'127.0.0.1', port=5012, database=u'eccemotus.sql',
+    graph_cache_size=GRAPH_CACHE_SIZE, production=False, threads=THREADS):
   """Start flask app.
 
+  The development server runs in debug mode and reloads changed code. The
+  production server serves requests by a pool of threads, waitress if it is
+  installed and the threaded werkzeug server otherwise.
+
   Args:
     host (str): flask app ip address.
     port (int): port for the flask app.
     database (str): name for sqlite3 database you want to use. If it does not
         exist, if will be created.
+    graph_cache_size (int): limit of estimated memory used by cached graphs in
+        bytes.
+    production (bool): whether to run the production server.
+    threads (int): number of threads of the production server and of read
+        connections to the database.
   """
   app.config[u'DATABASE'] = database
+  app.config[u'DATABASE_READERS'] = threads
+  graph_cache.max_size = graph_cache_size
   with app.app_context():
     Prepare()
-  app.run(debug=True, host=host, port=port)
 
+  if not production:
+    app.run(debug=True, host=host, port=port)
+  elif waitress is not None:
+    waitress.serve(app, host=host, port=port, threads=threads)
+  else:
+    app.run(debug=False, host=host, port=port, threaded=True)
@@ -3,6 +3,11 @@ var LateralMap = (function() {
      * Module providing lateral map visualization.
      */
 
+    // Locations of scripts required by the layout worker. They are resolved
+    // while this script is being loaded, because document.currentScript is
+    // not available later. In the worker itself there is no document.
+    var scriptUrls = findScriptUrls();
+
     var Map = function(width=1200, height=1100) {
         this.height = height;
         this.width = width;
@@ -11,53 +16,138 @@ var LateralMap = (function() {
     Map.prototype.setData = function(data) {
         /**
          * Makes revertible data manipulation possible.
+         *
+         * data is never modified. Working data consist of shallow copies of
+         * nodes and links, so it can be cheaply restored from data. Sorted
+         * timestamps of every link are indexed once here, so time filtering
+         * does not have to scan events. Links of schema version 1 (events)
+         * and 2 (event_ids, timestamps and event_counts arrays) are read.
          */
-        // Permanent copy of data.
-        this.backupData = JSON.parse(JSON.stringify(data));
+        // Permanent data.
+        this.backupData = data;
+        this.timeIndex = buildTimeIndex(data.links);
         // Working data.
-        this.graph = JSON.parse(JSON.stringify(data));
+        this.reset();
     }
 
     Map.prototype.reset = function() {
         /**
          * Reset working data to initial data.
          */
-        this.graph = JSON.parse(JSON.stringify(this.backupData));
+        var THAT = this;
+        this.graph = {
+            nodes: this.backupData.nodes.map(function(d) {
+                return Object.assign({}, d);
+            }),
+            links: this.backupData.links.map(function(d, i) {
+                return THAT.filteredLink(
+                    i, 0, THAT.timeIndex[i].timestamps.length);
+            })
+        };
+    }
+
+    Map.prototype.filteredLink = function(linkIndex, from, to) {
+        /**
+         * Creates working copy of link with events from <from, to) range of
+         * its sorted timestamps.
+         *
+         * Events are materialized on the first access and kept on the link,
+         * so repeated reads of link.events return the same array.
+         */
+        var original = this.backupData.links[linkIndex];
+        var order = this.timeIndex[linkIndex].order;
+        var counts = this.timeIndex[linkIndex].counts;
+        var getEvent = this.timeIndex[linkIndex].getEvent;
+        var link = {
+            source: original.source,
+            target: original.target,
+            type: original.type,
+            eventCount: counts[to] - counts[from]
+        };
+        Object.defineProperty(link, 'events', {
+            configurable: true,
+            get: function() {
+                var events = new Array(to - from);
+                for(var i = from; i < to; i++) {
+                    events[i - from] = getEvent(order[i]);
+                }
+                Object.defineProperty(link, 'events', {
+                    value: events,
+                    writable: true
+                });
+                return events;
+            }
+        });
+        return link;
+    }
+
+    Map.prototype.timeRange = function() {
+        /**
+         * Returns the smallest and the largest timestamp in data.
+         */
+        var range = {min: Infinity, max: -Infinity};
+        this.timeIndex.forEach(function(entry) {
+            var timestamps = entry.timestamps;
+            if(timestamps.length) {
+                range.min = Math.min(range.min, timestamps[0]);
+                range.max = Math.max(
+                    range.max, timestamps[timestamps.length - 1]);
+            }
+        });
+        return range;
     }
 
     Map.prototype.setForces = function() {
         /**
-         * Set up simulation forces that control positions of elements.
-         * There are three forces.
-         *   link: force generated by edges. Connected nodes want to be close.
-         *   charge: nodes are repelled.
-         *   machine: nodes representing machine names are strongly repelled.
-         *   centering: pulling graph to the center of plane (not screen).
-         *       This is not really a force, but clever translation.
+         * Set up the simulation that controls positions of elements.
+         *
+         * The simulation (see createSimulation) runs in a Web Worker if
+         * possible, so the page stays responsive while a large graph settles.
+         * The worker posts node positions back and this thread only renders
+         * them. If the worker can not be started (e.g. the page is opened
+         * from file://), the simulation runs on this thread.
          */
         var THAT = this;
-        this.simulation = d3.forceSimulation(this.graph.nodes).on('tick', function() {
-                THAT.tick();
-            })
-            .force('link', d3.forceLink(this.graph.links)
-                .id(function(d) {
-                    return d.id;
-                })
-                .strength(function(d) {
-                    return linkStrength(d);
-                })
-                .distance(function(d) {
-                    return linkLength(d);
-                })
-            )
-            .force('charge', d3.forceManyBody()
-                .distanceMax(500)
-                .strength(-200))
-            .force('machine', filteredManyBody()
-                .distanceMax(1000)
-                .strength(-20000))
-            .force('centering', d3.forceCenter(this.width / 2, this.height / 2))
-            .stop();
+
+        // Links reference nodes by id. Rendering needs the node objects.
+        var nodesById = {};
+        this.graph.nodes.forEach(function(d, i) {
+            d.index = i;
+            nodesById[d.id] = d;
+        });
+        this.graph.links.forEach(function(d, i) {
+            d.index = i;
+            if(typeof d.source != 'object') {
+                d.source = nodesById[d.source];
+            }
+            if(typeof d.target != 'object') {
+                d.target = nodesById[d.target];
+            }
+        });
+
+        if(this.simulation) {
+            // Filtering changes links, the running layout is reused.
+            this.simulation.update(this.graph.nodes, this.graph.links);
+            return;
+        }
+
+        var onTick = function() {
+            THAT.tick();
+        };
+        if(typeof Worker != 'undefined' && scriptUrls.worker) {
+            try {
+                this.simulation = new WorkerLayout(
+                    this.graph.nodes, this.graph.links, this.width,
+                    this.height, onTick);
+            } catch(error) {
+                this.simulation = null;
+            }
+        }
+        if(!this.simulation) {
+            this.simulation = new InlineLayout(
+                this.graph.nodes, this.graph.links, this.width, this.height,
+                onTick);
+        }
     }
 
     Map.prototype.setElements = function() {
@@ -80,7 +170,8 @@ var LateralMap = (function() {
             .attr('stroke', linkColor)
             .attr('stroke-opacity', 0.5)
             .style('marker-start', function(d) {
-                return d.type == 'access' ? 'url(#mid-arrow)' : '';
+                return d.type == 'access' || d.type == 'failed_access' ?
+                    'url(#mid-arrow)' : '';
             })
             .attr('stroke-width', THAT.vars.linkWidth)
             .on('mouseover', function(d) {
@@ -106,7 +197,7 @@ var LateralMap = (function() {
 
         this.linkLabels = this.glinks.append('text')
             .text(function(d) {
-                return d.events.length;
+                return d.eventCount;
             })
             .style('opacity', 0.5)
             .style('font-size', THAT.vars.fontSize)
@@ -134,16 +225,14 @@ var LateralMap = (function() {
             if(!d3.event.active) {
                 THAT.simulation.alphaTarget(0.02).restart();
             }
-            d.fx = d.x;
-            d.fy = d.y;
+            THAT.simulation.fix(d, d.x, d.y);
         }
 
         function dragged(d) {
             /**
              * Event handler for mouse dragging.
              */
-            d.fx = d3.event.x;
-            d.fy = d3.event.y;
+            THAT.simulation.fix(d, d3.event.x, d3.event.y);
         }
 
         function dragEnded(d) {
@@ -151,8 +240,7 @@ var LateralMap = (function() {
              * Event handler for mouse dragging.
              */
             if(!d3.event.active) THAT.simulation.alphaTarget(0);
-            d.fx = null;
-            d.fy = null;
+            THAT.simulation.unfix(d);
         }
 
         this.nodes = this.gnodes.append('rect')
@@ -249,21 +337,21 @@ var LateralMap = (function() {
          * Remove edges that did not happen between  fromTime and toTime.
          * Note that other methods have to be called for this to have actual
          * effect. This is done by setFileter function.
+         *
+         * Events of each link are found by binary search in its sorted
+         * timestamps.
          */
+        fromTime = Number(fromTime);
+        toTime = Number(toTime);
         var newLinks = new Array();
-        var THAT = this;
-        this.backupData.links.forEach(function(d) {
-            var newEvents = new Array();
-            d.events.forEach(function(e) {
-                if(e.timestamp >= fromTime && e.timestamp <= toTime) {
-                    newEvents.push(e);
-                }
-            });
-            if(newEvents.length > 0) {
-                d.events = newEvents;
-                newLinks.push(d);
+        for(var i = 0; i < this.timeIndex.length; i++) {
+            var timestamps = this.timeIndex[i].timestamps;
+            var from = lowerBound(timestamps, fromTime);
+            var to = upperBound(timestamps, toTime);
+            if(to > from) {
+                newLinks.push(this.filteredLink(i, from, to));
             }
-        });
+        }
         this.graph.links = newLinks;
     }
 
@@ -309,10 +397,16 @@ var LateralMap = (function() {
         /**
          * Merge nodes in given cluster.
          *
-         * They are not actually merged. Nodes are hidden and edges are
-         * dynamically redirected.
+         * For graphs rendered by renderRemote, the server is asked for graph
+         * with the cluster collapsed. Otherwise they are not actually merged.
+         * Nodes are hidden and edges are dynamically redirected.
          */
         cluster_id = parseInt(cluster_id);
+        if(this.dataUrl){
+            this.expanded.delete(this.fullCluster(cluster_id));
+            this.fetchLevel();
+            return;
+        }
         // mark cluster a merged
         this.merged.add(cluster_id);
         this.clusterRoutine();
@@ -320,9 +414,14 @@ var LateralMap = (function() {
 
     Map.prototype.expand = function(cluster_id){
         /**
-         * Merge nodes in given cluster.
+         * Expand nodes in given cluster.
          */
         cluster_id = parseInt(cluster_id);
+        if(this.dataUrl){
+            this.expanded.add(this.fullCluster(cluster_id));
+            this.fetchLevel();
+            return;
+        }
         // mark cluster a merged
         if(this.merged.has(cluster_id)){
             this.merged.delete(cluster_id);
@@ -330,20 +429,117 @@ var LateralMap = (function() {
         this.clusterRoutine();
     }
 
+    Map.prototype.mergeAll = function(){
+        /**
+         * Merge all clusters.
+         */
+        var THAT = this;
+        if(this.dataUrl){
+            this.expanded.clear();
+            this.fetchLevel();
+            return;
+        }
+        this.graph.nodes.forEach(function(d){
+            THAT.merge(d.cluster);
+        });
+    }
+
+    Map.prototype.expandAll = function(){
+        /**
+         * Expand all clusters (for remote graphs the currently loaded ones).
+         */
+        var THAT = this;
+        if(this.dataUrl){
+            this.backupData.nodes.forEach(function(d){
+                THAT.expanded.add(d.full_cluster);
+            });
+            this.fetchLevel();
+            return;
+        }
+        this.graph.nodes.forEach(function(d){
+            THAT.expand(d.cluster);
+        });
+    }
+
+    Map.prototype.fullCluster = function(cluster_id){
+        /**
+         * Returns id of cluster in the full (server side) graph.
+         */
+        var node = this.backupData.nodes[cluster_id];
+        return node ? node.full_cluster : cluster_id;
+    }
+
+    Map.prototype.renderRemote = function(url, element, renderButtons=false){
+        /**
+         * Renders graph from web API (/api/graph/<id>) with collapsed clusters.
+         *
+         * Clusters are collapsed on the server. merge and expand fetch graph
+         * again with the current set of expanded clusters, so the browser
+         * holds and simulates only the current level of detail.
+         */
+        this.dataUrl = url;
+        this.expanded = new Set();
+        this.element = element;
+        this.remoteButtons = renderButtons;
+        this.fetchLevel();
+    }
+
+    Map.prototype.fetchLevel = function(){
+        /**
+         * Fetches and renders graph with clusters in this.expanded expanded.
+         *
+         * Nodes that stay visible keep their positions. Nodes of a newly
+         * expanded cluster start at position of the collapsed cluster node.
+         */
+        var THAT = this;
+        var url = this.dataUrl + '?collapse=1&expand=' +
+            Array.from(this.expanded).join(',');
+        d3.json(url, function(error, data){
+            if(error){
+                console.error(error);
+                return;
+            }
+            THAT.renderLevel(data.graph);
+        });
+    }
+
+    Map.prototype.renderLevel = function(data){
+        /**
+         * Renders new level of detail of remote graph.
+         */
+        var positions = {};
+        var clusterPositions = {};
+        if(this.graph){
+            this.graph.nodes.forEach(function(d){
+                positions[d.type + ':' + d.value] = d;
+                clusterPositions[d.full_cluster] = d;
+            });
+        }
+        data.nodes.forEach(function(d){
+            var old = positions[d.type + ':' + d.value] ||
+                clusterPositions[d.full_cluster];
+            if(old){
+                d.x = old.x;
+                d.y = old.y;
+            }
+        });
+
+        var transform = this.transform;
+        this.render(data, this.element, this.remoteButtons);
+        if(transform){
+            this.svg.call(this.zoom.transform, transform);
+        }
+    }
+
     Map.prototype.renderButtons = function(){
         /**
          * Renders button for basic control (merging, filtering, stopping).
          */
         var THAT = this;
-        var minTimestamp = 2439118792937500;
-        var maxTimestamp = 0;
+        var range = this.timeRange();
+        var minTimestamp = isFinite(range.min) ? range.min : 0;
+        var maxTimestamp = isFinite(range.max) ? range.max : 0;
 
-        this.graph.links.forEach(function(link) {
-            link.events.forEach(function(e) {
-                minTimestamp = Math.min(minTimestamp, e.timestamp);
-                maxTimestamp = Math.max(maxTimestamp, e.timestamp);
-            })
-        })
         d3.select(this.element).select('#button-holder').remove();
         this.timelineHolder = d3.select(this.element).append('p')
             .attr('id', 'button-holder');
@@ -360,6 +556,46 @@ var LateralMap = (function() {
             .attr('step', 1000000*60*60*24)
             .attr('value', maxTimestamp);
 
+        // Sliders filter while being dragged. Filtering is cheap, so only
+        // redrawing is limited to once per animation frame.
+        var SLIDER_STEPS = 1000;
+        var filterRequested = false;
+        var sliderTime = function(slider) {
+            var position = slider.property('value') / SLIDER_STEPS;
+            return Math.round(
+                minTimestamp + position * (maxTimestamp - minTimestamp));
+        };
+        var sliderMoved = function() {
+            fromTimeInput.property('value', sliderTime(fromSlider));
+            toTimeInput.property('value', sliderTime(toSlider));
+            if(filterRequested) {
+                return;
+            }
+            filterRequested = true;
+            window.requestAnimationFrame(function() {
+                filterRequested = false;
+                THAT.setFilter(
+                    fromTimeInput.property('value'),
+                    toTimeInput.property('value'));
+            });
+        };
+
+        var fromSlider = this.timelineHolder.append('input')
+            .attr('type', 'range')
+            .attr('id', 'from_time_slider')
+            .attr('min', 0)
+            .attr('max', SLIDER_STEPS)
+            .attr('value', 0)
+            .on('input', sliderMoved);
+
+        var toSlider = this.timelineHolder.append('input')
+            .attr('type', 'range')
+            .attr('id', 'to_time_slider')
+            .attr('min', 0)
+            .attr('max', SLIDER_STEPS)
+            .attr('value', SLIDER_STEPS)
+            .on('input', sliderMoved);
+
         this.timelineHolder.append('button')
             .attr('type', 'button')
             .attr('id', 'filter_button')
@@ -380,6 +616,8 @@ var LateralMap = (function() {
                 THAT.setFilter(minTimestamp, maxTimestamp);
                 fromTimeInput.property('value', minTimestamp);
                 toTimeInput.property('value', maxTimestamp);
+                fromSlider.property('value', 0);
+                toSlider.property('value', SLIDER_STEPS);
             });
 
         var MergeInput = this.timelineHolder.append('input')
@@ -406,9 +644,7 @@ var LateralMap = (function() {
             .attr('type', 'button')
             .text('Merge All')
             .on('click.defualt', function(){
-                THAT.graph.nodes.forEach(function(d){
-                    THAT.merge(d.cluster);
-                })
+                THAT.mergeAll();
             })
 
         this.timelineHolder.append('button')
@@ -416,9 +652,7 @@ var LateralMap = (function() {
             .attr('id', 'merge_button')
             .text('Expand All')
             .on('click.defualt', function(){
-                THAT.graph.nodes.forEach(function(d){
-                    THAT.expand(d.cluster);
-                })
+                THAT.expandAll();
             })
 
 
@@ -460,12 +694,13 @@ var LateralMap = (function() {
         this.element = element;
 
         this.setData(data);
-        this.setForces();
 
+        // Node sizes are needed by the collision detection in simulation.
         this.graph.nodes.forEach(function(d) {
             d.height = 20;
             d.width = Math.min(THAT.vars.textLength, d.value.length) * 10 + 2;
         });
+        this.setForces();
 
         if(renderButtons){
             this.renderButtons();
@@ -491,7 +726,7 @@ var LateralMap = (function() {
             .attr('fill', '#000');
 
         this.oldScale = 1;
-        this.svg.call(d3.zoom()
+        this.zoom = d3.zoom()
             .scaleExtent([1 / 5, 20])
             .on('zoom', function() {
                 if(typeof THAT.transform != 'undefined'){
@@ -499,7 +734,8 @@ var LateralMap = (function() {
                 }
                 THAT.transform = d3.event.transform;
                 THAT.zoomed()
-            }));
+            });
+        this.svg.call(this.zoom);
 
         this.setElements();
 
@@ -632,27 +868,14 @@ var LateralMap = (function() {
 
     Map.prototype.tick = function() {
         /**
-         * Handles one tick of simulation.
+         * Renders current positions of nodes.
+         *
+         * Positions are computed by the simulation, this only moves elements.
          */
         var THAT = this;
         if (this.stopped){
             return;
         }
-        // Using quadtree for fast collision detection.
-        var q = d3.quadtree()
-            .x(function(d) {
-                return d.x;
-            })
-            .y(function(d) {
-                return d.y;
-            })
-            .addAll(this.graph.nodes);
-
-        for(var i = 0; i < this.graph.nodes.length; i++) {
-            // Visit every node and check for collisions.
-            q.visit(collide(this.graph.nodes[i], this.oldScale));
-        }
-
         // Moving links.
         this.links
             .attr('x1', function(d) {
@@ -703,6 +926,378 @@ var LateralMap = (function() {
     }
 
 
+    function createSimulation(nodes, links, width, height) {
+        /**
+         * Creates stopped simulation with forces that control positions of
+         * elements. This is shared by the layout worker and InlineLayout.
+         * There are four forces.
+         *   link: force generated by edges. Connected nodes want to be close.
+         *   charge: nodes are repelled.
+         *   machine: nodes representing machine names are strongly repelled.
+         *   centering: pulling graph to the center of plane (not screen).
+         *       This is not really a force, but clever translation.
+         * Collisions between nodes are resolved after every tick.
+         */
+        return d3.forceSimulation(nodes)
+            .force('link', d3.forceLink(links)
+                .id(function(d) {
+                    return d.id;
+                })
+                .strength(function(d) {
+                    return linkStrength(d);
+                })
+                .distance(function(d) {
+                    return linkLength(d);
+                })
+            )
+            .force('charge', d3.forceManyBody()
+                .distanceMax(500)
+                .strength(-200))
+            .force('machine', filteredManyBody()
+                .distanceMax(1000)
+                .strength(-20000))
+            .force('centering', d3.forceCenter(width / 2, height / 2))
+            .on('tick.collide', function() {
+                collideAll(nodes);
+            })
+            .stop();
+    }
+
+    function collideAll(nodes) {
+        /**
+         * Detects and resolves collisions between all nodes.
+         */
+        // Using quadtree for fast collision detection.
+        var q = d3.quadtree()
+            .x(function(d) {
+                return d.x;
+            })
+            .y(function(d) {
+                return d.y;
+            })
+            .addAll(nodes);
+
+        for(var i = 0; i < nodes.length; i++) {
+            // Visit every node and check for collisions.
+            q.visit(collide(nodes[i], 1));
+        }
+    }
+
+    var InlineLayout = function(nodes, links, width, height, onTick) {
+        /**
+         * Runs the simulation on the main thread.
+         *
+         * Used when the layout worker is not available.
+         */
+        this.width = width;
+        this.height = height;
+        this.onTick = onTick;
+        this.update(nodes, links);
+    };
+
+    InlineLayout.prototype.update = function(nodes, links) {
+        /**
+         * Replaces simulated nodes and links. Positions are kept.
+         */
+        if(this.simulation) {
+            this.simulation.stop();
+        }
+        this.simulation = createSimulation(
+            nodes, links, this.width, this.height)
+            .on('tick.render', this.onTick);
+    }
+
+    InlineLayout.prototype.alphaTarget = function(value) {
+        this.simulation.alphaTarget(value);
+        return this;
+    }
+
+    InlineLayout.prototype.restart = function() {
+        this.simulation.restart();
+        return this;
+    }
+
+    InlineLayout.prototype.stop = function() {
+        this.simulation.stop();
+        return this;
+    }
+
+    InlineLayout.prototype.fix = function(node, x, y) {
+        node.fx = x;
+        node.fy = y;
+    }
+
+    InlineLayout.prototype.unfix = function(node) {
+        node.fx = null;
+        node.fy = null;
+    }
+
+    var WorkerLayout = function(nodes, links, width, height, onTick) {
+        /**
+         * Runs the simulation in a Web Worker (lateral-worker.js).
+         *
+         * The worker posts node positions as transferable Float32Array
+         * [x0, y0, x1, y1, ...] in order of nodes. Positions are copied to
+         * nodes and rendered at most once per animation frame.
+         */
+        var THAT = this;
+        this.width = width;
+        this.height = height;
+        this.onTick = onTick;
+        this.positions = null;
+        this.frameRequested = false;
+        this.worker = new Worker(scriptUrls.worker);
+        this.worker.onmessage = function(event) {
+            if(event.data.type == 'tick') {
+                THAT.positions = event.data.positions;
+                THAT.requestFrame();
+            }
+        };
+        this.update(nodes, links);
+    };
+
+    WorkerLayout.prototype.update = function(nodes, links) {
+        /**
+         * Replaces simulated nodes and links. Positions are kept.
+         */
+        this.nodes = nodes;
+        // Positions computed for the previous nodes are not valid anymore.
+        this.positions = null;
+        this.worker.postMessage({
+            type: 'init',
+            d3Url: scriptUrls.d3,
+            mapUrl: scriptUrls.map,
+            nodes: nodes.map(function(d) {
+                return {
+                    id: d.id,
+                    type: d.type,
+                    width: d.width,
+                    height: d.height,
+                    x: d.x,
+                    y: d.y
+                };
+            }),
+            links: links.map(function(d) {
+                return {
+                    source: d.source.id,
+                    target: d.target.id,
+                    type: d.type
+                };
+            }),
+            width: this.width,
+            height: this.height
+        });
+    }
+
+    WorkerLayout.prototype.requestFrame = function() {
+        /**
+         * Schedules rendering of the last received positions.
+         */
+        var THAT = this;
+        if(this.frameRequested) {
+            return;
+        }
+        this.frameRequested = true;
+        var schedule = window.requestAnimationFrame || function(callback) {
+            return setTimeout(callback, 16);
+        };
+        schedule(function() {
+            THAT.frameRequested = false;
+            var positions = THAT.positions;
+            THAT.positions = null;
+            // Positions posted before update() are for different nodes.
+            if(positions && positions.length == 2 * THAT.nodes.length) {
+                for(var i = 0; i < THAT.nodes.length; i++) {
+                    THAT.nodes[i].x = positions[2 * i];
+                    THAT.nodes[i].y = positions[2 * i + 1];
+                }
+            }
+            THAT.onTick();
+        });
+    }
+
+    WorkerLayout.prototype.alphaTarget = function(value) {
+        this.worker.postMessage({type: 'alphaTarget', value: value});
+        return this;
+    }
+
+    WorkerLayout.prototype.restart = function() {
+        this.worker.postMessage({type: 'restart'});
+        return this;
+    }
+
+    WorkerLayout.prototype.stop = function() {
+        this.worker.postMessage({type: 'stop'});
+        return this;
+    }
+
+    WorkerLayout.prototype.fix = function(node, x, y) {
+        // Local position is updated too, so dragging does not wait for worker.
+        node.x = x;
+        node.y = y;
+        this.worker.postMessage({type: 'fix', index: node.index, x: x, y: y});
+        this.requestFrame();
+    }
+
+    WorkerLayout.prototype.unfix = function(node) {
+        this.worker.postMessage({type: 'unfix', index: node.index});
+    }
+
+    function findScriptUrls() {
+        /**
+         * Finds absolute urls of d3, this script and the layout worker.
+         *
+         * The worker is expected next to this script.
+         */
+        var urls = {d3: null, map: null, worker: null};
+        if(typeof document == 'undefined' || !document.currentScript) {
+            return urls;
+        }
+        urls.map = document.currentScript.src;
+        var scripts = document.getElementsByTagName('script');
+        for(var i = 0; i < scripts.length; i++) {
+            if(/d3(\.min)?\.js$/.test(scripts[i].src)) {
+                urls.d3 = scripts[i].src;
+            }
+        }
+        if(urls.map && urls.d3) {
+            urls.worker = urls.map.replace(/[^\/]*$/, 'lateral-worker.js');
+        }
+        return urls;
+    }
+
+    function readEvents(link) {
+        /**
+         * Reads events of link of schema version 1 or 2.
+         *
+         * Version 2 links have event_ids, timestamps delta encoded from the
+         * previous event and optional event_counts instead of events. Returns
+         * timestamps (Float64Array) and counts (Float64Array) in order of
+         * events and getEvent(i), which returns i-th event as an object of
+         * version 1. Version 2 events are created only when they are needed.
+         */
+        if(link.event_ids) {
+            var ids = link.event_ids;
+            var deltas = link.timestamps;
+            var eventCounts = link.event_counts;
+            var timestamps = new Float64Array(ids.length);
+            var counts = new Float64Array(ids.length);
+            var timestamp = 0;
+            for(var i = 0; i < ids.length; i++) {
+                timestamp += deltas[i];
+                timestamps[i] = timestamp;
+                counts[i] = eventCounts ? eventCounts[i] : 1;
+            }
+            return {
+                timestamps: timestamps,
+                counts: counts,
+                getEvent: function(i) {
+                    var event = {id: ids[i], timestamp: timestamps[i]};
+                    if(counts[i] != 1) {
+                        event.count = counts[i];
+                    }
+                    return event;
+                }
+            };
+        }
+
+        var events = link.events;
+        var timestamps = new Float64Array(events.length);
+        var counts = new Float64Array(events.length);
+        for(var i = 0; i < events.length; i++) {
+            timestamps[i] = events[i].timestamp;
+            var count = events[i].count;
+            counts[i] = count === undefined ? 1 : count;
+        }
+        return {
+            timestamps: timestamps,
+            counts: counts,
+            getEvent: function(i) {
+                return events[i];
+            }
+        };
+    }
+
+    function buildTimeIndex(links) {
+        /**
+         * Creates sorted timestamps for events of every link.
+         *
+         * Returns array with one entry per link. timestamps (Float64Array)
+         * are sorted timestamps of link's events and order (Uint32Array) maps
+         * position in timestamps to position of event in link. getEvent
+         * returns event at position in link (see readEvents). counts
+         * (Float64Array) are prefix sums of event counts in sorted order, so
+         * pre-aggregated events (with count) are counted fully.
+         */
+        return links.map(function(link) {
+            var events = readEvents(link);
+            var linkTimestamps = events.timestamps;
+            var length = linkTimestamps.length;
+            var order = new Uint32Array(length);
+            var sorted = true;
+            for(var i = 0; i < length; i++) {
+                order[i] = i;
+                if(i && linkTimestamps[i - 1] > linkTimestamps[i]) {
+                    sorted = false;
+                }
+            }
+            var timestamps = linkTimestamps;
+            if(!sorted) {
+                order.sort(function(a, b) {
+                    return linkTimestamps[a] - linkTimestamps[b];
+                });
+                timestamps = new Float64Array(length);
+                for(var i = 0; i < length; i++) {
+                    timestamps[i] = linkTimestamps[order[i]];
+                }
+            }
+            var counts = new Float64Array(length + 1);
+            for(var i = 0; i < length; i++) {
+                counts[i + 1] = counts[i] + events.counts[order[i]];
+            }
+            return {
+                timestamps: timestamps,
+                order: order,
+                counts: counts,
+                getEvent: events.getEvent
+            };
+        });
+    }
+
+    function lowerBound(array, value) {
+        /**
+         * Returns first position in sorted array with item >= value.
+         */
+        var low = 0;
+        var high = array.length;
+        while(low < high) {
+            var middle = (low + high) >>> 1;
+            if(array[middle] < value) {
+                low = middle + 1;
+            } else {
+                high = middle;
+            }
+        }
+        return low;
+    }
+
+    function upperBound(array, value) {
+        /**
+         * Returns first position in sorted array with item > value.
+         */
+        var low = 0;
+        var high = array.length;
+        while(low < high) {
+            var middle = (low + high) >>> 1;
+            if(array[middle] <= value) {
+                low = middle + 1;
+            } else {
+                high = middle;
+            }
+        }
+        return low;
+    }
+
     function collide(node, scale) {
         /**
          * Returns visitor that detects and resolves collisions with node.
@@ -835,6 +1430,7 @@ var LateralMap = (function() {
             'has': 1,
             'is': 1,
             'access': 0.2,
+            'failed_access': 0.2,
         }
         if(link.type in maper) {
             return maper[link.type];
@@ -851,6 +1447,7 @@ var LateralMap = (function() {
             'has': 10,
             'is': 10,
             'access': 100,
+            'failed_access': 100,
         }
         if(link.type in maper) {
             return maper[link.type];
@@ -864,6 +1461,7 @@ var LateralMap = (function() {
             'is': d3.color('red'),
             'has': d3.color('blue'),
             'access': d3.color('green'),
+            'failed_access': d3.color('gray'),
         }
         if(link.type in maper) {
             return maper[link.type];
@@ -878,6 +1476,10 @@ var LateralMap = (function() {
          * This function must be called after each render.
          */
         var THAT = this;
+        if(!this.nodes){
+            // Not rendered yet, setElements binds the callbacks later.
+            return;
+        }
         if(this.customLinkClickCallback){
             this.links.on('click.custom', function(d){
                 if (d3.event.ctrlKey) {
@@ -917,5 +1519,7 @@ var LateralMap = (function() {
     }
     var exports = {}
     exports.Map = Map;
+    // Used by lateral-worker.js.
+    exports.createSimulation = createSimulation;
     return exports;
 }());
\ No newline at end of file
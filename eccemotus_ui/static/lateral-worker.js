@@ -0,0 +1,60 @@
+/**
+ * Web Worker running the force simulation for LateralMap.
+ *
+ * The main thread sends the graph in an 'init' message and controls the
+ * simulation with 'alphaTarget', 'restart', 'stop', 'fix' and 'unfix'
+ * messages. After every tick, node positions are posted back as a transferable
+ * Float32Array [x0, y0, x1, y1, ...] in order of nodes.
+ */
+
+var simulation = null;
+var nodes = [];
+
+function postPositions() {
+    /**
+     * Sends current node positions to the main thread.
+     */
+    var positions = new Float32Array(nodes.length * 2);
+    for(var i = 0; i < nodes.length; i++) {
+        positions[2 * i] = nodes[i].x;
+        positions[2 * i + 1] = nodes[i].y;
+    }
+    self.postMessage({type: 'tick', positions: positions}, [positions.buffer]);
+}
+
+self.onmessage = function(event) {
+    var message = event.data;
+    switch(message.type) {
+        case 'init':
+            if(typeof LateralMap == 'undefined') {
+                // Forces are defined in lateral-map.js so they are shared with
+                // the main thread fallback.
+                importScripts(message.d3Url, message.mapUrl);
+            }
+            if(simulation) {
+                simulation.stop();
+            }
+            nodes = message.nodes;
+            simulation = LateralMap.createSimulation(
+                nodes, message.links, message.width, message.height)
+                .on('tick.post', postPositions);
+            break;
+        case 'alphaTarget':
+            simulation.alphaTarget(message.value);
+            break;
+        case 'restart':
+            simulation.restart();
+            break;
+        case 'stop':
+            simulation.stop();
+            break;
+        case 'fix':
+            nodes[message.index].fx = message.x;
+            nodes[message.index].fy = message.y;
+            break;
+        case 'unfix':
+            nodes[message.index].fx = null;
+            nodes[message.index].fy = null;
+            break;
+    }
+};
@@ -19,5 +19,29 @@ if __name__ == u'__main__':
   parser.add_argument(
       u'--database', action=u'store', default=u'eccemotus.sql', help=db_help)
 
+  cache_help = (
+      u'Memory limit of graphs cached by the server in MiB ({0:d}).'.format(
+          lateral.GRAPH_CACHE_SIZE // (1024 * 1024)))
+  parser.add_argument(
+      u'--graph-cache-size', action=u'store', type=int,
+      default=lateral.GRAPH_CACHE_SIZE // (1024 * 1024), help=cache_help)
+
+  production_help = (
+      u'Run multi-threaded production server (waitress if it is installed) '
+      u'instead of the debug server.')
+  parser.add_argument(
+      u'--production', action=u'store_true', default=False,
+      help=production_help)
+
+  threads_help = (
+      u'Number of threads of the production server and of read connections '
+      u'to the database ({0:d}).'.format(lateral.THREADS))
+  parser.add_argument(
+      u'--threads', action=u'store', type=int, default=lateral.THREADS,
+      help=threads_help)
+
   args = parser.parse_args()
-  lateral.Run(args.host, args.port, args.database)
+  lateral.Run(
+      args.host, args.port, args.database,
+      graph_cache_size=args.graph_cache_size * 1024 * 1024,
+      production=args.production, threads=args.threads)
@@ -0,0 +1,549 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Script to measure performance of eccemotus hot paths.
+
+Every benchmark compares the per item cost of a baseline implementation with
+the current one on synthetic data derived from the test events.
+"""
+
+from __future__ import print_function
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+# Change PYTHONPATH to include eccemotus.
+sys.path.insert(0, u'.')
+
+# pylint: disable=wrong-import-position
+from eccemotus.lib import event_data
+from eccemotus.lib import graph as graph_lib
+from eccemotus.lib import json_codec
+from eccemotus.lib import line_reader
+from eccemotus.lib import pipeline
+from eccemotus.lib.parsers import manager
+from eccemotus.lib.parsers import syslog_line
+from eccemotus.lib.parsers import utils
+from eccemotus.lib.parsers import win_evtx
+from eccemotus.tests import parsers as parsers_test
+
+# pylint: disable=protected-access
+SAMPLE_EVENTS = [
+    parsers_test.ParserManagerTest._linux_utmp_event,
+    parsers_test.ParserManagerTest._win_evtx_event,
+    parsers_test.ParserManagerTest._bsm_event,
+    parsers_test.ParserManagerTest._sys_log_event,
+    parsers_test.ParserManagerTest._sys_log_ssh,
+]
+
+
+def Measure(name, function, count, repeat=3):
+  """Measures function and prints per item cost.
+
+  Args:
+    name (str): name of the measured variant.
+    function (callable): function processing count items.
+    count (int): number of items processed by one call of function.
+    repeat (int): number of measurements, the best one is reported.
+
+  Returns:
+    float: best per item cost in microseconds.
+  """
+  best = min(timeit.repeat(function, number=1, repeat=repeat))
+  per_item = best * 1e6 / count
+  print(u'  {0:30s} {1:10.3f} us/item'.format(name, per_item))
+  return per_item
+
+
+def PrintSpeedup(before, after):
+  """Prints ratio of before and after costs.
+
+  Args:
+    before (float): baseline cost.
+    after (float): current cost.
+  """
+  print(u'  {0:30s} {1:10.2f}x'.format(u'speedup', before / after))
+
+
+def WriteJsonLineFile(path, events, count):
+  """Writes events in json_line format.
+
+  Args:
+    path (str): output file name.
+    events (list[dict]): events to be repeated.
+    count (int): number of lines.
+  """
+  with open(path, u'w') as output_file:
+    for i in range(count):
+      output_file.write(json.dumps(events[i % len(events)]))
+      output_file.write(u'\n')
+
+
+def BenchmarkJson(args, directory):
+  """Measures per line cost of reading json_line file.
+
+  Args:
+    args (argparse.Namespace): command line arguments.
+    directory (str): directory for temporary files.
+  """
+  path = os.path.join(directory, u'events.json_line')
+  WriteJsonLineFile(path, SAMPLE_EVENTS, args.count)
+
+  def Baseline():
+    """Text mode reading and standard json module."""
+    with open(path, u'r') as input_file:
+      for line in input_file:
+        json.loads(line)
+
+  def Current():
+    """Binary reading decoded by json_codec."""
+    with open(path, u'rb') as input_file:
+      for line in input_file:
+        json_codec.Loads(line)
+
+  print(u'json_line decoding ({0:s}):'.format(json_codec.GetDecoderName()))
+  before = Measure(u'text + json.loads', Baseline, args.count)
+  after = Measure(u'bytes + json_codec.Loads', Current, args.count)
+  PrintSpeedup(before, after)
+
+
+# Typical event that no parser is interested in.
+_FILE_STAT_EVENT = {
+    u'data_type': u'fs:stat',
+    u'display_name': u'TSK:/Windows/System32/config/SOFTWARE',
+    u'file_entry_type': u'file',
+    u'file_size': [23855104],
+    u'file_system_type': u'NTFS',
+    u'filename': u'/Windows/System32/config/SOFTWARE',
+    u'inode': 48591,
+    u'is_allocated': True,
+    u'parser': u'filestat',
+    u'pathspec': {u'location': u'/media/greendale_images/registrar.dd'},
+    u'timestamp': 1440409600617570,
+    u'timestamp_desc': u'Content Modification Time',
+}
+
+
+def BenchmarkLines(args, directory):
+  """Measures per line cost of reading events for f2g.
+
+  One in hundred events is parsed, the rest are file system events.
+
+  Args:
+    args (argparse.Namespace): command line arguments.
+    directory (str): directory for temporary files.
+  """
+  path = os.path.join(directory, u'events.json_line')
+  events = [_FILE_STAT_EVENT] * 99 + SAMPLE_EVENTS[1:2]
+  WriteJsonLineFile(path, events, args.count)
+  literals = [
+      b'"' + data_type.encode(u'utf-8') + b'"'
+      for data_type in manager.ParserManager.GetParsedTypes()]
+
+  def Baseline():
+    """Binary line iteration decoding every line."""
+    with open(path, u'rb') as input_file:
+      for line in input_file:
+        json_codec.Loads(line)
+
+  def Current():
+    """Memory mapped reading with data_type prefilter."""
+    with open(path, u'rb') as input_file:
+      reader = line_reader.MappedLineReader(input_file, literals=literals)
+      for _, line in reader.Iterate():
+        json_codec.Loads(line)
+
+  print(u'json_line reading, 1% parsed ({0:s}):'.format(
+      json_codec.GetDecoderName()))
+  before = Measure(u'readline + decode all', Baseline, args.count)
+  after = Measure(u'mmap + data_type prefilter', Current, args.count)
+  PrintSpeedup(before, after)
+
+
+def BenchmarkWindow(args, directory):
+  """Measures per line cost of reading one week of a sorted year long file.
+
+  Args:
+    args (argparse.Namespace): command line arguments.
+    directory (str): directory for temporary files.
+  """
+  path = os.path.join(directory, u'events.json_line')
+  year = 365 * 24 * 3600 * 1000000
+  start = _FILE_STAT_EVENT[u'timestamp']
+  events = []
+  for i in range(args.count):
+    event = dict(_FILE_STAT_EVENT)
+    event[u'timestamp'] = start + year * i // args.count
+    events.append(event)
+  WriteJsonLineFile(path, events, args.count)
+  since = start + year // 2
+  until = since + year // 52
+
+  def Baseline():
+    """Decoding every line and comparing its timestamp."""
+    with open(path, u'rb') as input_file:
+      for line in input_file:
+        timestamp = json_codec.Loads(line)[u'timestamp']
+        if since <= timestamp <= until:
+          pass
+
+  def Current():
+    """Binary search of the time range."""
+    with open(path, u'rb') as input_file:
+      reader = line_reader.MappedLineReader(input_file)
+      reader.SeekTimeRange(since, until)
+      for _, line in reader.Iterate():
+        json_codec.Loads(line)
+
+  print(u'json_line reading, one week of sorted year ({0:s}):'.format(
+      json_codec.GetDecoderName()))
+  before = Measure(u'decode all + compare', Baseline, args.count)
+  after = Measure(u'binary search seek', Current, args.count)
+  PrintSpeedup(before, after)
+
+
+def BenchmarkPipeline(args, unused_directory):
+  """Measures per event cost of building graph from a source with latency.
+
+  The source waits 20 ms for every 1000 events, like pages of elasticsearch
+  scroll.
+
+  Args:
+    args (argparse.Namespace): command line arguments.
+    unused_directory (str): directory for temporary files.
+  """
+  def Source():
+    """Yields sample events with simulated latency."""
+    for i in range(args.count):
+      if not i % 1000:
+        time.sleep(0.02)
+      yield SAMPLE_EVENTS[i % len(SAMPLE_EVENTS)]
+
+  def ParseEvents(raw_events):
+    """Parses batch of events."""
+    return [
+        parsed for parsed in manager.ParserManager.ParseBatch(raw_events)
+        if not parsed.IsEmpty()]
+
+  def Baseline():
+    """Chained generators."""
+    parsed_events = (
+        parsed for batch in BatchGenerator(Source(), 1000)
+        for parsed in ParseEvents(batch))
+    graph_lib.CreateGraph(parsed_events)
+
+  def Current():
+    """Stages connected by bounded queues."""
+    stages = pipeline.Pipeline()
+    stages.AddStage(u'parse', ParseEvents)
+    graph_lib.CreateGraph(stages.Run(Source()))
+
+  print(u'graph from source with 20 ms latency per 1000 events:')
+  before = Measure(u'chained generators', Baseline, args.count)
+  after = Measure(u'pipeline', Current, args.count)
+  PrintSpeedup(before, after)
+
+
+def BatchGenerator(items, batch_size):
+  """Groups items to lists.
+
+  Args:
+    items (iterable): items.
+    batch_size (int): maximum number of items in one list.
+
+  Yields:
+    list: at most batch_size consecutive items.
+  """
+  batch = []
+  for item in items:
+    batch.append(item)
+    if len(batch) >= batch_size:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+
+def LegacyWinEvtxParse(event):
+  """Parses windows:evtx:record as WinEvtxEventParser did before plans.
+
+  Args:
+    event (dict): dict serialized plaso event.
+
+  Returns:
+    event_data.EventData: event data parsed from event.
+  """
+  # pylint: disable=eval-used
+  data = event_data.EventData()
+  event_id = event.get(u'event_identifier')
+  strings = event.get(u'strings')
+  if not strings:
+    return event_data.EventData()
+
+  if not isinstance(strings, list):
+    strings = eval(strings)
+
+  if event_id == 4624:
+    storage_file_name = utils.GetImageName(event)
+    data.Add(event_data.StorageFileName(source=True, value=storage_file_name))
+    data.Add(event_data.MachineName(
+        source=True, value=event.get(u'computer_name', '')))
+    field_mapper = {
+        event_data.UserId(source=True): 0,
+        event_data.UserName(source=True): 1,
+        event_data.UserId(target=True): 4,
+        event_data.UserName(target=True): 5,
+        event_data.MachineName(target=True): 11,
+        event_data.Ip(target=True): 18
+    }
+    for datum, field_index in field_mapper.items():
+      datum.value = strings[field_index]
+      data.Add(datum)
+  return data
+
+
+def BenchmarkEvtx(args, unused_directory):
+  """Measures per event cost of parsing windows:evtx:record logon events.
+
+  Args:
+    args (argparse.Namespace): command line arguments.
+    unused_directory (str): directory for temporary files.
+  """
+  event = parsers_test.ParserManagerTest._win_evtx_event
+  stringified_event = dict(event)
+  stringified_event[u'strings'] = repr(event[u'strings'])
+  parse = win_evtx.WinEvtxEventParser.Parse
+
+  for name, sample in [
+      (u'list strings', event), (u'stringified strings', stringified_event)]:
+    print(u'windows:evtx:record 4624, {0:s}:'.format(name))
+    before = Measure(
+        u'field_mapper + eval',
+        lambda: [LegacyWinEvtxParse(sample) for _ in range(args.count)],
+        args.count)
+    after = Measure(
+        u'extraction plan',
+        lambda: [parse(sample) for _ in range(args.count)], args.count)
+    PrintSpeedup(before, after)
+
+
+_LEGACY_SYSLOG_REGEXP = re.compile(
+    r'.*Accepted password for (?P<user>\S+) '
+    r'from (?P<ip>(?:[0-9]{1,3}\.){3}[0-9]{1,3}) port (?P<port>(\d+)).*')
+
+# Typical auth.log lines that are not logins.
+_SYSLOG_NOISE = [
+    u'[CRON, pid: {0:d}] pam_unix(cron:session): session opened for user '
+    u'root by (uid=0)',
+    u'[CRON, pid: {0:d}] pam_unix(cron:session): session closed for user root',
+    u'[sshd, pid: {0:d}] Received disconnect from 10.0.8.6 port 52666:11: '
+    u'disconnected by user',
+    u'[sshd, pid: {0:d}] pam_unix(sshd:session): session closed for user dean',
+    u'[sudo, pid: {0:d}] dean : TTY=pts/0 ; PWD=/home/dean ; USER=root ; '
+    u'COMMAND=/usr/bin/apt-get update',
+    u'[kernel] audit: type=1400 audit({0:d}.112:71): apparmor="DENIED" '
+    u'operation="open" profile="/usr/sbin/cups-browsed" '
+    u'name="/usr/share/cups/locale/" pid={0:d} comm="cups-browsed" '
+    u'requested_mask="r" denied_mask="r" fsuid=0 ouid=0',
+]
+
+
+def LegacySysLogParse(event):
+  """Parses syslog:line as SysLogParser did before literal prefiltering.
+
+  Args:
+    event (dict): dict serialized plaso event.
+
+  Returns:
+    event_data.EventData: event data parsed from event.
+  """
+  match = _LEGACY_SYSLOG_REGEXP.match(event.get(u'message', ''))
+  if not match:
+    return event_data.EventData()
+
+  data = event_data.EventData()
+  data.Add(event_data.StorageFileName(
+      target=True, value=utils.GetImageName(event)))
+  data.Add(event_data.UserName(target=True, value=match.group(u'user')))
+  data.Add(event_data.Ip(source=True, value=match.group(u'ip')))
+  return data
+
+
+def BenchmarkSyslog(args, unused_directory):
+  """Measures per event cost of parsing syslog:line events.
+
+  One in hundred events is a login, the rest is repeated noise with varying
+  pids.
+
+  Args:
+    args (argparse.Namespace): command line arguments.
+    unused_directory (str): directory for temporary files.
+  """
+  login_event = parsers_test.ParserManagerTest._sys_log_event
+  events = []
+  for i in range(args.count):
+    event = dict(login_event)
+    if i % 100:
+      noise = _SYSLOG_NOISE[i % len(_SYSLOG_NOISE)]
+      event[u'message'] = noise.format(1000 + i % 50)
+    events.append(event)
+  messages = [event[u'message'] for event in events]
+  matcher = syslog_line.SysLogParser._MATCHER
+  parse = syslog_line.SysLogParser.Parse
+
+  print(u'syslog:line messages, 1% logins:')
+  before = Measure(
+      u'.* regexp match',
+      lambda: [_LEGACY_SYSLOG_REGEXP.match(message) for message in messages],
+      args.count)
+  after = Measure(
+      u'literal + cached search',
+      lambda: [matcher.Match(message) for message in messages], args.count)
+  PrintSpeedup(before, after)
+
+  print(u'syslog:line events, 1% logins:')
+  before = Measure(
+      u'.* regexp match',
+      lambda: [LegacySysLogParse(event) for event in events], args.count)
+  after = Measure(
+      u'literal + cached search',
+      lambda: [parse(event) for event in events], args.count)
+  PrintSpeedup(before, after)
+
+
+def BenchmarkBatch(args, unused_directory):
+  """Measures per event cost of ParserManager.Parse and ParseBatch.
+
+  Events are logons as returned by elasticsearch (strings and pathspec are
+  python representations) and syslog lines with 1% logins.
+
+  Args:
+    args (argparse.Namespace): command line arguments.
+    unused_directory (str): directory for temporary files.
+  """
+  evtx_event = dict(parsers_test.ParserManagerTest._win_evtx_event)
+  evtx_event[u'strings'] = repr(evtx_event[u'strings'])
+  evtx_event[u'pathspec'] = repr(evtx_event[u'pathspec'])
+  syslog_event = dict(parsers_test.ParserManagerTest._sys_log_event)
+  syslog_event[u'pathspec'] = repr(syslog_event[u'pathspec'])
+
+  syslog_events = []
+  for i in range(args.count):
+    event = dict(syslog_event)
+    if i % 100:
+      noise = _SYSLOG_NOISE[i % len(_SYSLOG_NOISE)]
+      event[u'message'] = noise.format(1000 + i % 50)
+    syslog_events.append(event)
+
+  parse = manager.ParserManager.Parse
+  parse_batch = manager.ParserManager.ParseBatch
+  for name, events in [
+      (u'windows:evtx:record 4624', [evtx_event] * args.count),
+      (u'syslog:line, 1% logins', syslog_events)]:
+    print(u'{0:s}, elasticsearch pathspec:'.format(name))
+    before = Measure(
+        u'Parse', lambda: [parse(event) for event in events], args.count)
+    after = Measure(
+        u'ParseBatch of 1000', lambda: [
+            parse_batch(batch) for batch in BatchGenerator(events, 1000)],
+        args.count)
+    PrintSpeedup(before, after)
+
+
+def LegacyGetEventId(event):
+  """Gets identifier of event without uuid by hashing the whole event.
+
+  Args:
+    event (dict): dict serialized plaso event.
+
+  Returns:
+    str: event identifier.
+  """
+  serialized = json.dumps(event, sort_keys=True)
+  return hashlib.sha1(serialized.encode(u'utf-8')).hexdigest()[:32]
+
+
+def BenchmarkEventId(args, unused_directory):
+  """Measures per event cost of identifiers of events without uuid.
+
+  psort json_line exports have no uuid, so this is the default path of
+  building graphs from files.
+
+  Args:
+    args (argparse.Namespace): command line arguments.
+    unused_directory (str): directory for temporary files.
+  """
+  event = dict(parsers_test.ParserManagerTest._win_evtx_event)
+  del event[u'uuid']
+  get_event_id = manager.ParserManager.GetEventId
+  parse = manager.ParserManager.Parse
+
+  print(u'windows:evtx:record 4624 without uuid, identifier:')
+  before = Measure(
+      u'whole event json + sha1',
+      lambda: [LegacyGetEventId(event) for _ in range(args.count)],
+      args.count)
+  after = Measure(
+      u'location fields + sha1',
+      lambda: [get_event_id(event) for _ in range(args.count)], args.count)
+  PrintSpeedup(before, after)
+
+  print(u'windows:evtx:record 4624 without uuid, ParserManager.Parse:')
+  Measure(
+      u'location fields + sha1',
+      lambda: [parse(event) for _ in range(args.count)], args.count)
+
+
+BENCHMARKS = {
+    u'batch': BenchmarkBatch,
+    u'event_id': BenchmarkEventId,
+    u'evtx': BenchmarkEvtx,
+    u'json': BenchmarkJson,
+    u'lines': BenchmarkLines,
+    u'pipeline': BenchmarkPipeline,
+    u'syslog': BenchmarkSyslog,
+    u'window': BenchmarkWindow,
+}
+
+
+def Main():
+  """The main program function.
+
+  Returns:
+    bool: True if successful or False if not.
+  """
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument(
+      u'--count', type=int, default=100000,
+      help=u'Number of items processed by each benchmark (100000).')
+  parser.add_argument(
+      u'benchmarks', nargs=u'*', metavar=u'benchmark',
+      help=u'Benchmarks to run: {0:s} (all).'.format(
+          u', '.join(sorted(BENCHMARKS))))
+  args = parser.parse_args()
+
+  for name in args.benchmarks:
+    if name not in BENCHMARKS:
+      print(u'Unknown benchmark: {0:s}'.format(name))
+      return False
+
+  directory = tempfile.mkdtemp()
+  try:
+    for name in args.benchmarks or sorted(BENCHMARKS):
+      BENCHMARKS[name](args, directory)
+  finally:
+    shutil.rmtree(directory)
+  return True
+
+
+if __name__ == u'__main__':
+  if not Main():
+    sys.exit(1)
+  else:
+    sys.exit(0)